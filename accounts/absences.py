@@ -0,0 +1,135 @@
+"""
+TEAM ABSENCES - Who on a manager's team is out in a date window
+
+Overlap queries run on the (employee, start_date, end_date) index via
+LeaveRequest.objects.overlapping(). Conflicts for the pending queue are
+found in memory: one query loads every team leave touching the span of
+the queue, then an IntervalIndex answers each pending request without
+going back to the database.
+"""
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from .models import LeaveRequest, User
+
+ABSENCE_STATUSES = ('approved', 'pending')
+MAX_WINDOW_DAYS = 366
+
+
+class IntervalIndex:
+    """
+    Static set of leaves sorted by start date, kept as an implicit balanced
+    tree (the middle of each slice is its root) where every node also holds
+    the latest end date in its subtree. overlapping(start, end) walks only
+    the leaves starting on or before `end` and skips every subtree ending
+    before `start`, so a query costs O((k + 1) log n) for k results rather
+    than a scan of all earlier leaves
+    """
+
+    def __init__(self, leaves):
+        self.leaves = sorted(leaves, key=lambda leave: leave.start_date)
+        self.starts = [leave.start_date for leave in self.leaves]
+        self.max_end = [None] * len(self.leaves)
+        if self.leaves:
+            self._build(0, len(self.leaves))
+
+    def _build(self, lo, hi):
+        mid = (lo + hi) // 2
+        latest = self.leaves[mid].end_date
+        if lo < mid:
+            latest = max(latest, self._build(lo, mid))
+        if mid + 1 < hi:
+            latest = max(latest, self._build(mid + 1, hi))
+        self.max_end[mid] = latest
+        return latest
+
+    def overlapping(self, start, end):
+        """Leaves overlapping [start, end], in start date order"""
+        found = []
+        self._collect(0, len(self.leaves), bisect_right(self.starts, end), start, found)
+        return found
+
+    def _collect(self, lo, hi, stop, start, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] < start:
+            return  # the whole subtree ended before the window
+        self._collect(lo, mid, stop, start, found)
+        if mid < stop:
+            leave = self.leaves[mid]
+            if leave.end_date >= start:
+                found.append(leave)
+            self._collect(mid + 1, hi, stop, start, found)
+
+
+def team_absences(manager, start, end, statuses=ABSENCE_STATUSES):
+    """Approved and pending leaves of the manager's team overlapping [start, end]"""
+    return (
+        LeaveRequest.objects.for_manager(manager)
+        .filter(status__in=statuses)
+        .overlapping(start, end)
+        .with_related()
+        .order_by('start_date', 'id')
+    )
+
+
+def attach_conflicts(manager, pending_leaves):
+    """
+    Set `leave.conflicts` on each pending leave: the other team members'
+    approved or pending leaves overlapping it. One query for the whole queue
+    """
+    if not pending_leaves:
+        return pending_leaves
+    span_start = min(leave.start_date for leave in pending_leaves)
+    span_end = max(leave.end_date for leave in pending_leaves)
+    index = IntervalIndex(team_absences(manager, span_start, span_end))
+    for leave in pending_leaves:
+        leave.conflicts = [
+            other for other in index.overlapping(leave.start_date, leave.end_date)
+            if other.employee_id != leave.employee_id
+        ]
+    return pending_leaves
+
+
+def parse_window(start, end, default_start=None):
+    """
+    Dates from ?start=&end= strings (YYYY-MM-DD). Missing start defaults
+    to `default_start` (or today), missing end to 30 days later. Raises
+    ValueError for bad dates or windows longer than MAX_WINDOW_DAYS
+    """
+    try:
+        start = date.fromisoformat(start) if start else (default_start or date.today())
+        end = date.fromisoformat(end) if end else start + timedelta(days=30)
+    except ValueError:
+        raise ValueError('start and end must be dates in YYYY-MM-DD format')
+    if end < start:
+        raise ValueError('end must not be before start')
+    if (end - start).days >= MAX_WINDOW_DAYS:
+        raise ValueError(f'window can be at most {MAX_WINDOW_DAYS} days')
+    return start, end
+
+
+def month_grid(manager, month_start):
+    """
+    Rows for a month calendar: one per team member with a cell per day,
+    each cell holding the leave covering that day (or None)
+    """
+    next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    month_end = next_month - timedelta(days=1)
+    days = [month_start + timedelta(days=i) for i in range((month_end - month_start).days + 1)]
+
+    members = list(User.objects.filter(manager=manager).order_by('full_name', 'email'))
+    cells = {member.pk: [None] * len(days) for member in members}
+    for leave in team_absences(manager, month_start, month_end):
+        row = cells.get(leave.employee_id)
+        if row is None:
+            continue
+        first = max(leave.start_date, month_start)
+        last = min(leave.end_date, month_end)
+        for offset in range((first - month_start).days, (last - month_start).days + 1):
+            # Approved wins over pending when two leaves share a day
+            if row[offset] is None or leave.status == 'approved':
+                row[offset] = leave
+    rows = [{'member': member, 'cells': cells[member.pk]} for member in members]
+    return days, rows, next_month
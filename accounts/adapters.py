@@ -5,10 +5,7 @@ class CustomAccountAdapter(DefaultAccountAdapter):
     def save_user(self, request, user, form, commit=True):
         user = super().save_user(request, user, form, commit=False)
         user.full_name = form.cleaned_data.get('full_name', '')
-        user.role = form.cleaned_data.get('role', 'employee')
-        if user.role == 'admin':
-            user.is_staff = True
-            user.is_superuser = True
+        user.set_role(form.cleaned_data.get('role', 'employee'))
         if commit:
             user.save()
         return user
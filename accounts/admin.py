@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
-from .models import User, LeaveType, LeaveRequest, LeaveBalance
+from .models import User, LeaveType, LeaveRequest, LeaveBalance, HolidayCalendar, Holiday
 
 # Unregister unnecessary models
 admin.site.unregister(Group)
@@ -31,7 +31,7 @@ class UserAdmin(BaseUserAdmin):
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         ('Personal Info', {'fields': ('full_name', 'phone', 'department', 'profile_picture')}),
-        ('Permissions', {'fields': ('role', 'manager', 'is_active', 'is_staff', 'is_superuser')}),
+        ('Permissions', {'fields': ('role', 'manager', 'holiday_calendar', 'is_active', 'is_staff', 'is_superuser')}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
     
@@ -62,3 +62,14 @@ class LeaveBalanceAdmin(admin.ModelAdmin):
     list_display = ('employee', 'leave_type', 'year', 'total_days', 'used_days', 'remaining_days')
     list_filter = ('year', 'leave_type')
     search_fields = ('employee__email', 'employee__full_name')
+
+
+class HolidayInline(admin.TabularInline):
+    model = Holiday
+    extra = 1
+
+
+@admin.register(HolidayCalendar)
+class HolidayCalendarAdmin(admin.ModelAdmin):
+    list_display = ('name', 'weekend_days', 'is_default', 'updated_at')
+    inlines = [HolidayInline]
@@ -0,0 +1,129 @@
+"""
+CHAT ATTACHMENT PROCESSING - Real type, size, dimensions and thumbnails
+
+send_message stores the upload as it came and, once the message is
+committed, hands it to process_attachment() on a small thread pool, so
+the request never waits for Pillow. Processing sniffs the type from the
+file's first bytes (the file name and the browser's Content-Type are not
+trusted), records size and pixel dimensions, and writes a 256px WebP
+thumbnail for images. The chat API serves thumbnail_url, so opening a
+conversation downloads previews of a few KB instead of the original photos.
+
+CHAT_ATTACHMENT_PROCESSING = 'sync' processes inline instead (tests,
+management commands).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image
+
+from .imaging import upright, upright_size, webp
+from .models import ChatMessage, StoredBlob
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 80
+
+# (offset, magic bytes, MIME type)
+SIGNATURES = (
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),  # after b'RIFF' + 4 length bytes
+    (0, b'%PDF-', 'application/pdf'),
+)
+SNIFF_BYTES = 16
+UNKNOWN_TYPE = 'application/octet-stream'
+THUMBNAIL_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+
+
+def sniff_mime(head):
+    """MIME type from the first bytes of a file, or application/octet-stream"""
+    for offset, magic, mime in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic and (offset == 0 or head.startswith(b'RIFF')):
+            return mime
+    return UNKNOWN_TYPE
+
+
+def make_thumbnail(image):
+    """WebP bytes of `image` scaled to fit THUMBNAIL_SIZE, upright per EXIF"""
+    return webp(upright(image, THUMBNAIL_SIZE, draft_size=THUMBNAIL_SIZE * 2), THUMBNAIL_QUALITY)
+
+
+def process_attachment(message_id):
+    """
+    Sniff, measure and thumbnail one message's attachment and store the
+    results. Returns the updated field values, or None without an attachment
+    """
+    message = ChatMessage.objects.filter(pk=message_id).first()
+    if message is None or not message.attachment:
+        return None
+    old_thumbnail = message.attachment_thumbnail.name or ''
+
+    with message.attachment.open('rb') as f:
+        mime = sniff_mime(f.read(SNIFF_BYTES))
+        fields = {'attachment_mime': mime, 'attachment_size': message.attachment.size}
+        if mime in THUMBNAIL_TYPES:
+            f.seek(0)
+            try:
+                with Image.open(f) as image:
+                    # As displayed: the thumbnail and the page's <img> are upright
+                    fields['attachment_width'], fields['attachment_height'] = upright_size(image)
+                    thumbnail = make_thumbnail(image)
+            except (OSError, ValueError, Image.DecompressionBombError) as exc:
+                # Right magic bytes but not a decodable image: serve it as a plain file
+                logger.warning('Attachment of message %s is not a usable image: %s', message_id, exc)
+                fields['attachment_mime'] = UNKNOWN_TYPE
+            else:
+                message.attachment_thumbnail.save(f'{message_id}.webp', ContentFile(thumbnail), save=False)
+                fields['attachment_thumbnail'] = message.attachment_thumbnail.name
+
+    ChatMessage.objects.filter(pk=message_id).update(**fields)
+    if 'attachment_thumbnail' in fields and fields['attachment_thumbnail'] != old_thumbnail:
+        # update() skips the signals that count blob references
+        StoredBlob.objects.acquire(fields['attachment_thumbnail'])
+        StoredBlob.objects.release(old_thumbnail)
+    return fields
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CHAT_ATTACHMENT_WORKERS', 2),
+                thread_name_prefix='chat-attachments',
+            )
+        return _pool
+
+
+def _process_in_worker(message_id):
+    # Worker threads keep their own connection: drop it when stale or broken
+    close_old_connections()
+    try:
+        process_attachment(message_id)
+    except Exception:
+        logger.exception('Processing the attachment of message %s failed', message_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(message_id):
+    """
+    Process a committed message's attachment in the background. Returns
+    the Future, or None when CHAT_ATTACHMENT_PROCESSING = 'sync' ran it inline
+    """
+    if getattr(settings, 'CHAT_ATTACHMENT_PROCESSING', 'thread') == 'sync':
+        process_attachment(message_id)
+        return None
+    return _executor().submit(_process_in_worker, message_id)
@@ -0,0 +1,61 @@
+"""
+PROFILE PICTURE PIPELINE - Upright, metadata-free pictures and small avatars
+
+Phone photos arrive as multi-megabyte JPEGs, often sideways (EXIF
+orientation) and carrying EXIF/GPS metadata. set_profile_picture()
+decodes the upload once and stores:
+
+    profile_picture   upright, re-encoded WebP at most 1024px, no metadata
+    avatar_48/96/256  square (centre-cropped) WebP avatars
+
+Templates and APIs show avatars through User.avatar_url(size) and the
+avatar_*_url properties, so a page loads a few KB per face instead of
+the original photo. build_avatars backfills pictures stored before this.
+"""
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .imaging import upright, webp
+from .models import User
+
+MAX_SIZE = 1024
+QUALITY = 85
+AVATAR_QUALITY = 80
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image Pillow can decode"""
+
+
+def normalize(image):
+    """`image` upright per EXIF, in RGB (RGBA if transparent), at most MAX_SIZE"""
+    return upright(image, MAX_SIZE)
+
+
+def render(source):
+    """
+    {field: bytes} of the normalized picture and each avatar, from the
+    open file `source`. Raises InvalidImage when it cannot be decoded
+    """
+    try:
+        with Image.open(source) as original:
+            image = normalize(original)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise InvalidImage(str(exc)) from exc
+    files = {'profile_picture': webp(image, QUALITY)}
+    for size in User.AVATAR_SIZES:
+        avatar = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        files[f'avatar_{size}'] = webp(avatar, AVATAR_QUALITY)
+    return files
+
+
+def set_profile_picture(user, upload):
+    """
+    Process the open file `upload` into the user's picture fields. The
+    caller saves the user; the signals then count the new blobs and
+    release the replaced ones
+    """
+    upload.seek(0)
+    for field, content in render(upload).items():
+        # Blob storage names it by content; only the extension is kept
+        getattr(user, field).save(f'{field}.webp', ContentFile(content), save=False)
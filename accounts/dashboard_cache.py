@@ -0,0 +1,96 @@
+"""
+DASHBOARD CACHE - Per-user cached dashboard data with versioned keys
+
+manager_dashboard and employee_dashboard cache their context per user
+in Django's cache framework. Keys embed a per-user version number:
+
+    dashboard:version:<user_id>            -> current version
+    dashboard:<kind>:<user_id>:v<version>  -> cached context
+
+Invalidating a user just bumps the version, so stale entries are never
+read again and simply expire. signals.py bumps the affected users
+whenever a LeaveRequest, LeaveBalance or team membership changes; code
+that bypasses signals (queryset update(), bulk_create()) calls
+invalidate() itself.
+
+Hit and miss counters live in the cache too, so they add up across
+workers when the cache is shared (use a shared backend in production:
+with LocMemCache each worker has its own cache and its own versions).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+HITS_KEY = 'dashboard:stats:hits'
+MISSES_KEY = 'dashboard:stats:misses'
+
+
+def _version_key(user_id):
+    return f'dashboard:version:{user_id}'
+
+
+def _data_key(kind, user_id, version):
+    return f'dashboard:{kind}:{user_id}:v{version}'
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing or evicted: start counting (add() is a no-op if another worker won)
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from a clock value, not 1, so an evicted version key can
+        # never make an older cached entry current again
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate(*user_ids):
+    """Make every cached dashboard of these users stale"""
+    for user_id in {uid for uid in user_ids if uid}:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # No version yet means nothing is cached for this user
+            pass
+
+
+def invalidate_many(user_ids):
+    """
+    Bulk variant for thousands of users: drops the version keys in one
+    delete_many round trip; get_version() then starts each user on a new
+    clock-based version, which no cached entry can have
+    """
+    cache.delete_many([_version_key(user_id) for user_id in user_ids])
+
+
+def get_or_build(kind, user_id, builder):
+    """Return the cached context for (kind, user), building it on a miss"""
+    key = _data_key(kind, user_id, get_version(user_id))
+    data = cache.get(key)
+    if data is not None:
+        _incr(HITS_KEY)
+        return data
+    _incr(MISSES_KEY)
+    data = builder()
+    cache.set(key, data, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    return data
+
+
+def stats():
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import User, LeaveRequest
+from .workdays import count_working_days
 
 
 class CustomSignupForm(UserCreationForm):
@@ -31,15 +32,12 @@ class CustomSignupForm(UserCreationForm):
         user = super().save(commit=False)
         user.email = self.cleaned_data['email']
         user.full_name = self.cleaned_data['full_name']
-        user.role = self.cleaned_data['role']
+        user.set_role(self.cleaned_data['role'])
         
         # Set manager for employees
         if user.role == 'employee' and self.cleaned_data.get('manager'):
             user.manager = self.cleaned_data['manager']
         
-        if user.role == 'admin':
-            user.is_staff = True
-            user.is_superuser = True
         if commit:
             user.save()
         return user
@@ -60,14 +58,32 @@ class LeaveRequestForm(forms.ModelForm):
     
     class Meta:
         model = LeaveRequest
-        fields = ['leave_type', 'start_date', 'end_date', 'total_days', 'reason']
+        fields = ['leave_type', 'start_date', 'end_date', 'reason']
         widgets = {
             'start_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'end_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
-            'total_days': forms.HiddenInput(),
             'reason': forms.Textarea(attrs={'rows': 4, 'class': 'form-control', 'placeholder': 'Please provide a detailed reason for your leave request...'}),
             'leave_type': forms.Select(attrs={'class': 'form-control'}),
         }
+    
+    def __init__(self, *args, employee=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.employee = employee
+    
+    def clean(self):
+        # total_days is counted here from the employee's holiday calendar,
+        # never taken from the browser
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date:
+            if end_date < start_date:
+                raise forms.ValidationError('End date cannot be before start date.')
+            total_days = count_working_days(self.employee, start_date, end_date)
+            if total_days == 0:
+                raise forms.ValidationError('The selected dates contain no working days.')
+            self.instance.total_days = total_days
+        return cleaned_data
 
 
 class ProfileUpdateForm(forms.ModelForm):
@@ -0,0 +1,44 @@
+"""
+IMAGE HELPERS - Orientation, scaling and WebP encoding shared by uploads
+
+Chat attachments (attachments.py) and profile pictures (avatars.py) both
+arrive as photos that may be sideways per EXIF, in any mode Pillow
+decodes, and far larger than they are shown. These helpers measure them
+as displayed, bring them upright in RGB(A) at a bounded size, and encode
+the result as metadata-free WebP.
+"""
+import io
+
+from PIL import ExifTags, ImageOps
+
+
+def upright_size(image):
+    """(width, height) of `image` as shown, i.e. after its EXIF orientation, without decoding it"""
+    width, height = image.size
+    # Orientations 5-8 turn the picture a quarter: its sides swap
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def upright(image, size, draft_size=None):
+    """
+    `image` upright per EXIF, in RGB (RGBA if transparent), scaled to fit
+    `size`. JPEGs decode at a reduced scale no smaller than `draft_size`
+    (default `size`) directly, much faster than full size
+    """
+    draft_size = draft_size or size
+    image.draft('RGB', (draft_size, draft_size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    image.thumbnail((size, size))
+    return image
+
+
+def webp(image, quality):
+    """WebP bytes of `image`"""
+    out = io.BytesIO()
+    # Saving without exif=/icc_profile= leaves all metadata behind
+    image.save(out, 'WEBP', quality=quality)
+    return out.getvalue()
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from accounts import services
+from accounts.models import LeaveBalance, LeaveRequest, LeaveType, User
+
+EMAIL_PREFIX = 'benchmark-approvals-'
+MAX_ATTEMPTS = 50
+
+
+class Race:
+    """Outcome of race_approvals(): per-attempt results and how long threads spent backing off"""
+
+    def __init__(self):
+        self.results = []
+        self.errors = []
+        self.retries = 0
+        self.backoff = 0.0  # seconds slept, summed over threads
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def approved(self):
+        return self.results.count(True)
+
+    def record_retry(self, slept):
+        with self._lock:
+            self.retries += 1
+            self.backoff += slept
+
+
+def _approve_all(leaves, manager, race):
+    # Every thread races for every request, in its own order
+    leaves = list(leaves)
+    random.shuffle(leaves)
+    try:
+        for leave in leaves:
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    stale = LeaveRequest.objects.get(pk=leave.pk)
+                    race.results.append(services.decide_leave(stale, manager, approve=True))
+                    break
+                except OperationalError:
+                    # SQLite allows one writer at a time (and the test database locks whole
+                    # tables): retry soon, with jitter so threads do not wake in lockstep
+                    slept = random.uniform(0, 0.001 * 2 ** min(attempt, 5))
+                    time.sleep(slept)
+                    race.record_retry(slept)
+            else:
+                race.errors.append(f'gave up on {leave.pk}')
+    except Exception as exc:
+        race.errors.append(repr(exc))
+    finally:
+        connection.close()
+
+
+def race_approvals(leaves, manager, threads):
+    """Approve every leave from `threads` threads at once; each leave must be charged exactly once"""
+    race = Race()
+    workers = [threading.Thread(target=_approve_all, args=(leaves, manager, race)) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    race.elapsed = time.perf_counter() - started
+    return race
+
+
+class Command(BaseCommand):
+    help = 'Time parallel leave approvals: every thread tries to approve every pending request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Pending requests to approve')
+        parser.add_argument('--employees', type=int, default=4)
+
+    def handle(self, *args, **options):
+        # Threads need committed rows, so the seed is real and deleted afterwards
+        leave_type = LeaveType.objects.create(name=f'{EMAIL_PREFIX}type', default_days=options['requests'] * 3)
+        try:
+            manager = User.objects.create_user(email=f'{EMAIL_PREFIX}manager@example.invalid', role='manager')
+            employees = [
+                User.objects.create_user(
+                    email=f'{EMAIL_PREFIX}{i}@example.invalid', role='employee', manager=manager
+                )
+                for i in range(options['employees'])
+            ]
+            leaves = [
+                LeaveRequest.objects.create(
+                    employee=employees[i % len(employees)], leave_type=leave_type, start_date=date.today(),
+                    end_date=date.today(), total_days=i % 3 + 1, reason='Benchmark'
+                )
+                for i in range(options['requests'])
+            ]
+            race = race_approvals(leaves, manager, options['threads'])
+            self.report(race, leaves, leave_type, options['threads'])
+        finally:
+            User.objects.filter(email__startswith=EMAIL_PREFIX).delete()
+            leave_type.delete()
+
+    def report(self, race, leaves, leave_type, threads):
+        charged = sum(
+            LeaveBalance.objects.filter(leave_type=leave_type).values_list('used_days', flat=True)
+        )
+        expected = sum(leave.total_days for leave in leaves)
+        self.stdout.write(
+            f'{threads} threads, {len(race.results)} attempts in {race.elapsed:.2f}s: '
+            f'{race.approved / race.elapsed:,.0f} approvals/s, {len(race.results) / race.elapsed:,.0f} attempts/s'
+        )
+        self.stdout.write(
+            f'{race.retries} retries on a locked database, {race.backoff:.2f}s backing off '
+            f'({race.backoff / threads / race.elapsed:.0%} of each thread\'s time)'
+        )
+        if race.errors or race.approved != len(leaves) or charged != expected:
+            self.stdout.write(self.style.ERROR(
+                f'✗ {race.approved} of {len(leaves)} approved, {charged} of {expected} days charged, '
+                f'errors: {race.errors[:3]}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Approved {len(leaves)} requests exactly once'))
@@ -0,0 +1,106 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.urls import reverse
+from accounts import serializers
+from accounts.models import ChatMessage, Conversation, User
+from accounts.storage import is_blob
+
+
+def legacy_payload(msg, viewer):
+    """A message dict built the way the chat views did before serializers.py"""
+    def file_url(view_name, name):
+        url = reverse(view_name, args=[msg.id])
+        return url + f'?v={name.rsplit("/", 1)[-1][:12]}' if is_blob(name) else url
+
+    return {
+        'id': msg.id,
+        'sender_id': msg.sender.id,
+        'sender_name': msg.sender.full_name or msg.sender.email,
+        'message': msg.message,
+        'is_mine': msg.sender == viewer,
+        'time': msg.created_at.strftime('%I:%M %p'),
+        'date': msg.created_at.strftime('%b %d, %Y'),
+        'has_attachment': bool(msg.attachment),
+        'attachment_url': file_url('chat_attachment', msg.attachment.name) if msg.attachment else None,
+        'attachment_name': msg.attachment_name or '',
+        'attachment_size': msg.attachment_size,
+        'attachment_width': msg.attachment_width,
+        'attachment_height': msg.attachment_height,
+        'thumbnail_url': (
+            file_url('chat_attachment_thumbnail', msg.attachment_thumbnail.name) if msg.attachment_thumbnail else None
+        ),
+        'is_image': msg.is_image,
+        'is_pdf': msg.is_pdf,
+    }
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time serializing chat messages: model instances (before) vs .values() + MessageSerializer (after)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help='Messages in the benchmark thread')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per variant; the best is reported')
+
+    def handle(self, *args, **options):
+        # Seeded in a transaction that is always rolled back: nothing is left behind
+        try:
+            with transaction.atomic():
+                self.run(options['messages'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        alice = User.objects.create_user(email='benchmark-alice@example.invalid', full_name='Alice')
+        bob = User.objects.create_user(email='benchmark-bob@example.invalid')
+        conversation = Conversation.objects.between(alice, bob)
+        messages = []
+        for i in range(count):
+            message = ChatMessage(
+                sender=alice if i % 2 else bob, receiver=bob if i % 2 else alice,
+                conversation=conversation, message=f'Benchmark message {i}',
+            )
+            if i % 5 == 0:
+                digest = f'{i:064x}'
+                message.attachment = f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.png'
+                message.attachment_name, message.attachment_mime = f'photo{i}.png', 'image/png'
+                message.attachment_thumbnail = f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.webp'
+            messages.append(message)
+        ChatMessage.objects.bulk_create(messages, batch_size=1000)
+        thread = ChatMessage.objects.filter(conversation=conversation).order_by('id')
+
+        def before():
+            return json.dumps([legacy_payload(msg, alice) for msg in thread]).encode()
+
+        def after(encode):
+            page = serializers.MessageSerializer(alice.id).serialize_many(serializers.message_values(thread))
+            return encode(page)
+
+        variants = [
+            ('instances + json (before)', before),
+            ('values + serializer + json', lambda: after(lambda data: json.dumps(data).encode())),
+        ]
+        if serializers.orjson is not None:
+            variants.append(('values + serializer + orjson', lambda: after(serializers.orjson.dumps)))
+
+        baseline = None
+        for label, func in variants:
+            best = min(self.time(func) for _ in range(repeat))
+            baseline = baseline or best
+            self.stdout.write(
+                f'{label:<30} {best * 1000:8.1f} ms  {count / best:10,.0f} msg/s  {baseline / best:5.1f}x'
+            )
+        self.stdout.write(self.style.SUCCESS(f'✓ Serialized {count} messages, best of {repeat}'))
+
+    @staticmethod
+    def time(func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
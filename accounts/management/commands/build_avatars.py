@@ -0,0 +1,30 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from accounts import avatars
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Normalize stored profile pictures and build their avatar sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild users that already have avatars too')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+        if not options['all']:
+            users = users.filter(Q(avatar_48__isnull=True) | Q(avatar_48=''))
+        built = failed = 0
+        for user in list(users):
+            try:
+                with user.profile_picture.open('rb') as f:
+                    picture = ContentFile(f.read(), name=user.profile_picture.name)
+                avatars.set_profile_picture(user, picture)
+            except (OSError, avatars.InvalidImage) as exc:
+                failed += 1
+                self.stderr.write(f'{user.email}: {exc}')
+                continue
+            user.save(update_fields=['profile_picture', 'avatar_48', 'avatar_96', 'avatar_256'])
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f'✓ Built avatars for {built} users, {failed} failed'))
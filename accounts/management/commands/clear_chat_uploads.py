@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from accounts.uploads import expire_stale
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished chunked chat uploads (and their partial files) older than CHAT_UPLOAD_EXPIRY'
+
+    def handle(self, *args, **kwargs):
+        count = expire_stale()
+        self.stdout.write(self.style.SUCCESS(f'✓ Discarded {count} stale uploads'))
@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from accounts.models import StoredBlob
+from accounts.storage import BLOB_PREFIX, blob_storage
+
+
+class Command(BaseCommand):
+    help = 'Delete unreferenced blobs, and blob files with no StoredBlob row (e.g. from rolled back uploads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Seconds a file must be old before it counts as orphaned (skips uploads in flight)'
+        )
+
+    def handle(self, *args, **options):
+        collected = sum(
+            StoredBlob.objects.collect(name)
+            for name in StoredBlob.objects.filter(ref_count__lte=0).values_list('name', flat=True)
+        )
+
+        orphans = 0
+        root = blob_storage.path(BLOB_PREFIX)
+        cutoff = time.time() - options['min_age']
+        known = set(StoredBlob.objects.values_list('name', flat=True))
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                name = BLOB_PREFIX + os.path.relpath(path, root).replace(os.sep, '/')
+                if name not in known and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    orphans += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Deleted {collected} unreferenced blobs and {orphans} orphaned files'
+        ))
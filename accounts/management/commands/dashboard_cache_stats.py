@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from accounts import dashboard_cache
+
+
+class Command(BaseCommand):
+    help = 'Show dashboard cache hit/miss counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing')
+
+    def handle(self, *args, **options):
+        stats = dashboard_cache.stats()
+        self.stdout.write(
+            f"Dashboard cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.1%} hit rate)"
+        )
+        if options['reset']:
+            dashboard_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('✓ Counters reset'))
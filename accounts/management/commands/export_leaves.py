@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import exports
+from accounts.models import LeaveRequest
+
+
+class Command(BaseCommand):
+    help = 'Stream leave history as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.EXPORT_FORMATS, default='csv')
+        parser.add_argument('--start', help='Only leaves ending on or after YYYY-MM-DD')
+        parser.add_argument('--end', help='Only leaves starting on or before YYYY-MM-DD')
+        parser.add_argument('--status')
+        parser.add_argument('--department')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=exports.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            filters = exports.parse_filters(options)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        
+        rows = exports.export_rows(LeaveRequest.objects.all(), chunk_size=options['chunk_size'], **filters)
+        lines = exports.render_lines(rows, options['format'])
+        if options['output']:
+            count = 0
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line)
+                    count += 1
+            rows_written = count - 1 if options['format'] == 'csv' else count
+            self.stderr.write(self.style.SUCCESS(f'✓ Exported {rows_written} leave requests to {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
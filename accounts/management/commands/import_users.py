@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.user_import import DEFAULT_BATCH_SIZE, import_users
+
+
+class Command(BaseCommand):
+    help = 'Import users from a CSV file (email, full_name, phone, department, role, manager, password)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Users per INSERT')
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        try:
+            result = import_users(options['csv_path'], batch_size=options['batch_size'], workers=options['workers'])
+        except OSError as exc:
+            raise CommandError(f'Cannot read {options["csv_path"]}: {exc}')
+        
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f'→ Line {line} skipped: {message}'))
+        for email, manager in result.unknown_managers:
+            self.stdout.write(self.style.WARNING(f'→ {email}: manager {manager} not found, left unassigned'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Imported {result.created} users ({result.existing} already existed, {len(result.errors)} rows skipped)'
+        ))
@@ -0,0 +1,48 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import ChatMessage, StoredBlob, User
+from accounts.storage import BLOB_PREFIX, blob_storage
+
+# (model, file field) pairs kept in blob storage
+TARGETS = (
+    (ChatMessage, 'attachment'),
+    (ChatMessage, 'attachment_thumbnail'),
+    (User, 'profile_picture'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Move chat attachments, thumbnails and profile pictures saved before blob storage into it'
+
+    def handle(self, *args, **kwargs):
+        moved = missing = 0
+        blobs = set()
+        legacy_names = set()
+        for model, field in TARGETS:
+            rows = list(
+                model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .exclude(**{f'{field}__startswith': BLOB_PREFIX}).values_list('pk', field)
+            )
+            for pk, name in rows:
+                if not default_storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f'{model.__name__} {pk}: {name} is missing')
+                    continue
+                blob = blob_storage.adopt(default_storage.path(name), move=False)
+                with transaction.atomic():
+                    # Conditional on the old name, in case the row changed meanwhile
+                    if model.objects.filter(pk=pk, **{field: name}).update(**{field: blob}):
+                        StoredBlob.objects.acquire(blob)
+                legacy_names.add(name)
+                blobs.add(blob)
+                moved += 1
+
+        # Old copies go once no row points at them any more
+        for name in legacy_names:
+            if not any(model.objects.filter(**{field: name}).exists() for model, field in TARGETS):
+                default_storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Moved {moved} files into {len(blobs)} blobs, {missing} missing'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from accounts.attachments import process_attachment
+from accounts.models import ChatMessage
+
+
+class Command(BaseCommand):
+    help = 'Sniff types and make thumbnails for chat attachments not processed yet (e.g. uploaded before processing existed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every attachment')
+
+    def handle(self, *args, **options):
+        messages = ChatMessage.objects.exclude(attachment='').exclude(attachment__isnull=True)
+        if not options['all']:
+            messages = messages.filter(attachment_mime='')
+        
+        processed = thumbnails = failed = 0
+        for message_id in messages.order_by('pk').values_list('pk', flat=True).iterator():
+            try:
+                fields = process_attachment(message_id)
+            except OSError as exc:
+                # File missing from storage
+                failed += 1
+                self.stderr.write(f'Message {message_id}: {exc}')
+                continue
+            processed += 1
+            thumbnails += bool(fields and fields.get('attachment_thumbnail'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Processed {processed} attachments ({thumbnails} thumbnails), {failed} failed'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import LeaveType
+from accounts.services import PROVISION_BATCH_SIZE, provision_leave_balances
+
+
+class Command(BaseCommand):
+    help = "Create a year's leave balances for every active employee and leave type"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=None, help='Defaults to the current year')
+        parser.add_argument('--batch-size', type=int, default=PROVISION_BATCH_SIZE, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        year = options['year'] or timezone.now().year
+        if not LeaveType.objects.exists():
+            self.stdout.write(self.style.WARNING('→ No leave types yet, run create_leave_types first'))
+            return
+        
+        created = provision_leave_balances(year, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Provisioned {created} leave balances for {year}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from accounts.models import DashboardStats
+
+
+class Command(BaseCommand):
+    help = 'Recount the admin dashboard statistics from scratch'
+
+    def handle(self, *args, **kwargs):
+        stats = DashboardStats.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Dashboard stats rebuilt: {stats.total_users} users '
+            f'({stats.total_admins} admins, {stats.total_managers} managers, '
+            f'{stats.total_employees} employees), {stats.pending_leaves} pending leaves'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from accounts.models import LeaveRollup
+
+
+class Command(BaseCommand):
+    help = 'Recount the leave analytics rollups from scratch'
+
+    def handle(self, *args, **kwargs):
+        rows = LeaveRollup.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ Leave rollups rebuilt: {rows} rows'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from accounts.models import LeaveRequest
+from accounts.workdays import RECOMPUTE_CHUNK_SIZE, recompute_total_days
+
+
+class Command(BaseCommand):
+    help = 'Recount LeaveRequest.total_days from holiday calendars (working days only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', help='Only requests with this status, e.g. pending')
+        parser.add_argument('--chunk-size', type=int, default=RECOMPUTE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        leaves = LeaveRequest.objects.all()
+        if options['status']:
+            leaves = leaves.filter(status=options['status'])
+        
+        scanned, updated = recompute_total_days(leaves, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Checked {scanned} leave requests, corrected {updated}'))
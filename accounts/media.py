@@ -0,0 +1,149 @@
+"""
+MEDIA DELIVERY - Conditional, ranged and proxy-offloaded file responses
+
+serve_file() answers a request for a stored file the way a static file
+server would, so the browser and the front proxy can cache attachments:
+
+    ETag            blobs: their SHA-256 (the name already carries it, so a
+                    revalidation is answered 304 without touching the disk);
+                    other files: mtime and size
+    Last-Modified   file mtime; If-None-Match / If-Modified-Since -> 304
+    Cache-Control   private (access is checked per user); blobs never change
+                    under their name, so they are also immutable for a year
+    Range           one byte range (bytes=a-b, a-, -n) -> 206, honouring
+                    If-Range; an unsatisfiable range -> 416
+
+With MEDIA_SENDFILE = 'x-accel-redirect' (nginx, an `internal` location
+at MEDIA_SENDFILE_URL aliased to MEDIA_ROOT) or 'x-sendfile' (Apache,
+lighttpd) the response carries only headers and the proxy sends the
+bytes and handles Range itself, so no Python worker streams files.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import escape_uri_path
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from .storage import is_blob
+
+READ_SIZE = 64 * 1024
+IMMUTABLE = 'private, max-age=31536000, immutable'
+REVALIDATE = 'private, no-cache'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(name, stat=None):
+    """Strong ETag of a stored file: a blob's digest, else mtime-size"""
+    if is_blob(name):
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+
+def byte_range(header, size):
+    """
+    (start, end) inclusive of a single-range Range header, None to send
+    the whole file (no header, or one we don't serve, e.g. several ranges).
+    Raises ValueError when the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_file(request, storage, name, content_type, file_name='', inline=True):
+    """Response for `name` in `storage` (a local filesystem storage)"""
+    cache_control = IMMUTABLE if is_blob(name) else REVALIDATE
+    if is_blob(name) and file_etag(name) in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = file_etag(name)
+        response['Cache-Control'] = cache_control
+        return response
+
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('File not found')
+    etag = file_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    if response is None:
+        response = _file_response(request, name, path, stat.st_size, etag, last_modified)
+        if response.status_code != 416:
+            response['Content-Type'] = content_type
+            disposition = 'inline' if inline else 'attachment'
+            if file_name:
+                disposition += f"; filename*=UTF-8''{escape_uri_path(file_name)}"
+            response['Content-Disposition'] = disposition
+            response['X-Content-Type-Options'] = 'nosniff'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _file_response(request, name, path, size, etag, last_modified):
+    sendfile = getattr(settings, 'MEDIA_SENDFILE', '')
+    if sendfile == 'x-accel-redirect':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = escape_uri_path(settings.MEDIA_SENDFILE_URL + name)
+        return response
+    if sendfile == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+
+    try:
+        span = byte_range(request.headers.get('Range', ''), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if span is not None and not _if_range_matches(request, etag, last_modified):
+        span = None  # the client's partial copy is stale: send it all again
+
+    if span is None:
+        response = FileResponse(open(path, 'rb'))
+    else:
+        start, end = span
+        response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag  # strong comparison only
+    return parse_http_date_safe(if_range) == last_modified
@@ -0,0 +1,123 @@
+"""
+QUERY INSTRUMENTATION - Per-view SQL count, DB time and template time
+
+Enabled with settings.QUERY_INSTRUMENTATION. For every request the
+middleware counts SQL queries, sums time spent in the database and in
+template rendering, and reports them against the resolved view name:
+
+- response headers: X-View-Name, X-Query-Count, X-DB-Time-Ms,
+  X-Template-Time-Ms and a Server-Timing header for browser dev tools
+- one log line per request on the 'accounts.perf' logger
+
+Template time is measured by the TimedDjangoTemplates backend (set as the
+TEMPLATES BACKEND); with the stock backend it reports 0.
+
+settings.QUERY_BUDGETS maps view names to a maximum query count.
+Requests over budget are logged as errors, or raise QueryBudgetExceeded
+when settings.QUERY_BUDGET_STRICT is on (useful in development and CI).
+"""
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+logger = logging.getLogger('accounts.perf')
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    """Accumulates query count and timings; doubles as a DB execute wrapper"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+class TimedTemplate(DjangoTemplate):
+    """
+    Adds its render time to the current request's metrics. Only the
+    render()/render_to_string() entry point is timed, so includes and extends
+    are not counted twice. Lazy querysets evaluated inside templates count
+    towards both DB and template time
+    """
+
+    def render(self, context=None, request=None):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend handing out TimedTemplate"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else '-'
+        db_ms = metrics.db_time * 1000
+        template_ms = metrics.template_time * 1000
+
+        response['X-View-Name'] = view_name
+        response['X-Query-Count'] = str(metrics.queries)
+        response['X-DB-Time-Ms'] = f'{db_ms:.1f}'
+        response['X-Template-Time-Ms'] = f'{template_ms:.1f}'
+        response['Server-Timing'] = f'db;dur={db_ms:.1f}, tpl;dur={template_ms:.1f}'
+
+        logger.info(
+            'view=%s status=%s queries=%d db_ms=%.1f template_ms=%.1f',
+            view_name, response.status_code, metrics.queries, db_ms, template_ms,
+        )
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and metrics.queries > budget:
+            message = f'{view_name} ran {metrics.queries} queries (budget {budget})'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.error(message)
+        return response
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_counters(apps, schema_editor):
+    """Seed counters from the messages that are currently unread"""
+    ChatMessage = apps.get_model('accounts', 'ChatMessage')
+    UnreadCounter = apps.get_model('accounts', 'UnreadCounter')
+    unread = (
+        ChatMessage.objects.filter(is_read=False)
+        .values('receiver_id', 'sender_id')
+        .annotate(total=models.Count('id'))
+        .order_by()
+    )
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(receiver_id=row['receiver_id'], sender_id=row['sender_id'], count=row['total']) for row in unread],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_chatmessage_chat_unread_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'chat_unread_counters',
+                'unique_together': {('receiver', 'sender')},
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_users_joined_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.PositiveIntegerField(default=0)),
+                ('total_admins', models.PositiveIntegerField(default=0)),
+                ('total_managers', models.PositiveIntegerField(default=0)),
+                ('total_employees', models.PositiveIntegerField(default=0)),
+                ('pending_leaves', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'dashboard_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_dashboardstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveBalanceLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('approval', 'Leave approved'), ('adjustment', 'Manual adjustment')], max_length=20)),
+                ('days', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('balance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='accounts.leavebalance')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('leave_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='accounts.leaverequest')),
+            ],
+            options={
+                'db_table': 'leave_balance_ledger',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['balance', '-created_at'], name='ledger_balance_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leavebalanceledger',
+            constraint=models.UniqueConstraint(condition=models.Q(('entry_type', 'approval')), fields=('leave_request',), name='ledger_one_approval_per_leave'),
+        ),
+    ]
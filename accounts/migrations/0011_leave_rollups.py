@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    """Seed the rollups from the existing leave requests"""
+    LeaveRequest = apps.get_model('accounts', 'LeaveRequest')
+    LeaveRollup = apps.get_model('accounts', 'LeaveRollup')
+    groups = (
+        LeaveRequest.objects.order_by()
+        .annotate(month=TruncMonth('start_date'))
+        .values('employee__department', 'leave_type_id', 'month', 'status')
+        .annotate(requests=models.Count('id'), days=models.Sum('total_days'))
+    )
+    LeaveRollup.objects.bulk_create(
+        [
+            LeaveRollup(
+                department=group['employee__department'] or '',
+                leave_type_id=group['leave_type_id'],
+                month=group['month'],
+                status=group['status'],
+                request_count=group['requests'],
+                total_days=group['days'] or 0,
+            )
+            for group in groups
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_leave_overlap_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(blank=True, max_length=100)),
+                ('month', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('request_count', models.IntegerField(default=0)),
+                ('total_days', models.IntegerField(default=0)),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.leavetype')),
+            ],
+            options={
+                'db_table': 'leave_rollups',
+                'indexes': [models.Index(fields=['month'], name='rollup_month_idx')],
+                'unique_together': {('department', 'leave_type', 'month', 'status')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:44
+
+import accounts.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_chat_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'stored_blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=accounts.storage.BlobStorage(), upload_to='chat_attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='attachment_thumbnail',
+            field=models.FileField(blank=True, null=True, storage=accounts.storage.BlobStorage(), upload_to='chat_thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=accounts.storage.BlobStorage(), upload_to='profiles/'),
+        ),
+    ]
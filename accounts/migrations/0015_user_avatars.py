@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:53
+
+import accounts.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_256',
+            field=models.ImageField(blank=True, editable=False, null=True, storage=accounts.storage.BlobStorage(), upload_to='avatars/'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_48',
+            field=models.ImageField(blank=True, editable=False, null=True, storage=accounts.storage.BlobStorage(), upload_to='avatars/'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_96',
+            field=models.ImageField(blank=True, editable=False, null=True, storage=accounts.storage.BlobStorage(), upload_to='avatars/'),
+        ),
+    ]
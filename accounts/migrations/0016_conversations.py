@@ -0,0 +1,95 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_conversations(apps, schema_editor):
+    """One conversation per pair that has messages, with last message and read cursors"""
+    ChatMessage = apps.get_model('accounts', 'ChatMessage')
+    Conversation = apps.get_model('accounts', 'Conversation')
+    pairs = {
+        (min(sender, receiver), max(sender, receiver))
+        for sender, receiver in ChatMessage.objects.order_by().values_list('sender_id', 'receiver_id').distinct()
+    }
+    Conversation.objects.bulk_create(
+        [Conversation(user_low_id=low, user_high_id=high) for low, high in pairs], batch_size=1000
+    )
+    for conversation in Conversation.objects.all():
+        low, high = conversation.user_low_id, conversation.user_high_id
+        messages = ChatMessage.objects.filter(
+            models.Q(sender_id=low, receiver_id=high) | models.Q(sender_id=high, receiver_id=low)
+        )
+        messages.update(conversation=conversation)
+        last = messages.order_by('-id').values('id', 'created_at').first()
+        conversation.last_message_id, conversation.last_activity = last['id'], last['created_at']
+        # A participant has seen everything they sent and everything marked read
+        for cursor, user in (('low_read_id', low), ('high_read_id', high)):
+            seen = messages.filter(models.Q(sender_id=user) | models.Q(receiver_id=user, is_read=True))
+            setattr(conversation, cursor, seen.aggregate(last=models.Max('id'))['last'] or 0)
+        conversation.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_user_avatars'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('low_read_id', models.PositiveBigIntegerField(default=0)),
+                ('high_read_id', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'chat_conversations',
+            },
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='accounts.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'id'], name='chat_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_low', '-last_activity'], name='conversation_low_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_high', '-last_activity'], name='conversation_high_activity_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversation_pair_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(check=models.Q(('user_low__lte', models.F('user_high'))), name='conversation_pair_ordered'),
+        ),
+        migrations.RunPython(populate_conversations, migrations.RunPython.noop),
+    ]
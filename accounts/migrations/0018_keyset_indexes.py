@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_team_managers(apps, schema_editor):
+    """File every existing request under its employee's current manager"""
+    LeaveRequest = apps.get_model('accounts', 'LeaveRequest')
+    User = apps.get_model('accounts', 'User')
+    LeaveRequest.objects.update(team_manager_id=models.Subquery(
+        User.objects.filter(pk=models.OuterRef('employee_id')).values('manager_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_conversation_required'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='leaverequest',
+            name='leave_emp_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='leaverequest',
+            name='leave_status_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='leaverequest',
+            name='leave_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_joined_idx',
+        ),
+        migrations.AddField(
+            model_name='leaverequest',
+            name='team_manager',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='team_leaves', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(populate_team_managers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['employee', 'created_at', 'id'], name='leave_emp_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='leave_status_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['created_at', 'id'], name='leave_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['team_manager', 'created_at', 'id'], name='leave_team_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['team_manager', 'status', 'created_at', 'id'], name='leave_team_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['team_manager', 'start_date', 'end_date'], name='leave_team_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='users_joined_id_idx'),
+        ),
+    ]
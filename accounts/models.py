@@ -1,7 +1,14 @@
+import uuid
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction, IntegrityError, connections
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
 from django.utils import timezone
 
+from .storage import blob_storage, is_blob
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -41,8 +48,17 @@ class User(AbstractBaseUser, PermissionsMixin):
     # Complex relationship: One user (manager) can have many users (employees)
     manager = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='team_members')
     
-    # PROFILE PICTURE UPLOAD: Uses Pillow library, saves to media/profiles/
-    profile_picture = models.ImageField(upload_to='profiles/', null=True, blank=True)
+    # Public holidays and weekly days off used to count leave days (default calendar if empty)
+    holiday_calendar = models.ForeignKey(
+        'HolidayCalendar', on_delete=models.SET_NULL, null=True, blank=True, related_name='users'
+    )
+    
+    # PROFILE PICTURE UPLOAD: Uses Pillow library, stored once per distinct image (see storage.py)
+    # Upright and stripped of metadata on upload, with square WebP avatars (see avatars.py)
+    profile_picture = models.ImageField(upload_to='profiles/', storage=blob_storage, null=True, blank=True)
+    avatar_48 = models.ImageField(upload_to='avatars/', storage=blob_storage, null=True, blank=True, editable=False)
+    avatar_96 = models.ImageField(upload_to='avatars/', storage=blob_storage, null=True, blank=True, editable=False)
+    avatar_256 = models.ImageField(upload_to='avatars/', storage=blob_storage, null=True, blank=True, editable=False)
     
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -53,11 +69,44 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'  # Login with email instead of username
     REQUIRED_FIELDS = []
     
+    AVATAR_SIZES = (48, 96, 256)
+    
     def __str__(self):
         return self.email
     
+    def set_role(self, role):
+        """Give the user `role`; admins also get Django admin access (staff + superuser)"""
+        self.role = role
+        if role == 'admin':
+            self.is_staff = True
+            self.is_superuser = True
+    
+    def avatar_url(self, size=48):
+        """URL of the smallest avatar at least `size` px, else the profile picture (None without one)"""
+        for variant in self.AVATAR_SIZES:
+            avatar = getattr(self, f'avatar_{variant}')
+            if variant >= size and avatar:
+                return avatar.url
+        return self.profile_picture.url if self.profile_picture else None
+    
+    @property
+    def avatar_small_url(self):
+        return self.avatar_url(48)
+    
+    @property
+    def avatar_medium_url(self):
+        return self.avatar_url(96)
+    
+    @property
+    def avatar_large_url(self):
+        return self.avatar_url(256)
+    
     class Meta:
         db_table = 'users'
+        indexes = [
+            # Keyset pages of all_users seek (date_joined, id) (see pagination.py)
+            models.Index(fields=['date_joined', 'id'], name='users_joined_id_idx'),
+        ]
 
 
 class LeaveType(models.Model):
@@ -72,6 +121,86 @@ class LeaveType(models.Model):
         db_table = 'leave_types'
 
 
+class HolidayCalendar(models.Model):
+    """
+    HOLIDAY CALENDAR - Weekly days off plus dated public holidays
+    Leave durations count working days only (see workdays.py). Users
+    without a calendar fall back to the one marked is_default
+    """
+    name = models.CharField(max_length=100, unique=True)
+    # Weekday numbers (Monday=0 ... Sunday=6), comma separated
+    weekend_days = models.CharField(max_length=13, default='5,6')
+    is_default = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)  # Bumped on holiday changes too
+    
+    @property
+    def weekend(self):
+        return frozenset(int(day) for day in self.weekend_days.split(',') if day.strip())
+    
+    def clean(self):
+        days = [day.strip() for day in self.weekend_days.split(',') if day.strip()]
+        if not all(day.isdigit() and 0 <= int(day) <= 6 for day in days):
+            raise ValidationError({
+                'weekend_days': 'Enter comma-separated weekday numbers from 0 (Monday) to 6 (Sunday).'
+            })
+        # Stored canonically: sorted, no duplicates or spaces
+        self.weekend_days = ','.join(str(day) for day in sorted({int(day) for day in days}))
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        db_table = 'holiday_calendars'
+
+
+class Holiday(models.Model):
+    calendar = models.ForeignKey(HolidayCalendar, on_delete=models.CASCADE, related_name='holidays')
+    date = models.DateField()
+    name = models.CharField(max_length=100)
+    
+    def __str__(self):
+        return f"{self.name} ({self.date})"
+    
+    class Meta:
+        db_table = 'holidays'
+        ordering = ['date']
+        unique_together = ['calendar', 'date']
+
+
+class LeaveRequestQuerySet(models.QuerySet):
+    """
+    LISTING QUERIES - Shared filters and eager loading for leave tables
+    Every listing view builds on these so a page renders in a constant
+    number of queries however many rows it shows
+    """
+    # Columns the leave tables read, including the joined employee/type/approver
+    LISTING_FIELDS = (
+        'id', 'start_date', 'end_date', 'total_days', 'status', 'created_at',
+        'employee', 'employee__full_name', 'employee__email',
+        'leave_type', 'leave_type__name',
+        'approved_by', 'approved_by__full_name', 'approved_by__email',
+    )
+    
+    def for_employee(self, employee):
+        return self.filter(employee=employee)
+    
+    def for_manager(self, manager):
+        """Leaves of the manager's direct team"""
+        return self.filter(team_manager=manager)
+    
+    def overlapping(self, start, end):
+        """Leaves with at least one day inside [start, end]"""
+        return self.filter(start_date__lte=end, end_date__gte=start)
+    
+    def with_related(self, reason=False):
+        """
+        Join employee, leave type and approver in the same query and load
+        only the columns listings display (`reason` is opt-in: it can be long)
+        """
+        fields = self.LISTING_FIELDS + ('reason',) if reason else self.LISTING_FIELDS
+        return self.select_related('employee', 'leave_type', 'approved_by').only(*fields)
+
+
 class LeaveRequest(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -87,15 +216,36 @@ class LeaveRequest(models.Model):
     reason = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_leaves')
+    # The employee's current manager, kept by signals.py: team listings then seek one
+    # (team_manager, created_at, id) index instead of joining users and sorting
+    team_manager = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='team_leaves', db_index=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = LeaveRequestQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.employee.email} - {self.leave_type.name}"
     
     class Meta:
         db_table = 'leave_requests'
         ordering = ['-created_at']
+        # COMPOSITE INDEXES: match the filters used by dashboards and leave lists
+        indexes = [
+            models.Index(fields=['employee', 'status', '-created_at'], name='leave_emp_status_created_idx'),
+            # Keyset pages seek (created_at, id) (see pagination.py); scanned backwards for newest first
+            models.Index(fields=['employee', 'created_at', 'id'], name='leave_emp_created_id_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='leave_status_created_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='leave_created_id_idx'),
+            models.Index(fields=['team_manager', 'created_at', 'id'], name='leave_team_created_idx'),
+            models.Index(fields=['team_manager', 'status', 'created_at', 'id'], name='leave_team_status_created_idx'),
+            # Overlap lookups (start_date <= window end AND end_date >= window start)
+            models.Index(fields=['employee', 'start_date', 'end_date'], name='leave_emp_dates_idx'),
+            models.Index(fields=['start_date', 'end_date'], name='leave_dates_idx'),
+            models.Index(fields=['team_manager', 'start_date', 'end_date'], name='leave_team_dates_idx'),
+        ]
 
 
 class LeaveBalance(models.Model):
@@ -115,6 +265,145 @@ class LeaveBalance(models.Model):
     class Meta:
         db_table = 'leave_balances'
         unique_together = ['employee', 'leave_type', 'year']
+        indexes = [
+            models.Index(fields=['employee', 'year'], name='balance_emp_year_idx'),
+        ]
+
+
+class LeaveBalanceLedger(models.Model):
+    """
+    BALANCE LEDGER - Append-only history of LeaveBalance.used_days
+    Each change to used_days writes one entry in the same transaction,
+    so every change to a balance can be traced back to a request or user
+    """
+    ENTRY_TYPES = [
+        ('approval', 'Leave approved'),
+        ('adjustment', 'Manual adjustment'),
+    ]
+    
+    balance = models.ForeignKey(LeaveBalance, on_delete=models.CASCADE, related_name='ledger_entries')
+    leave_request = models.ForeignKey(
+        LeaveRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries'
+    )
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPES)
+    days = models.IntegerField()  # Added to used_days; negative gives days back
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Ledger entries are append-only')
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.balance_id}: {self.days:+d} ({self.entry_type})"
+    
+    class Meta:
+        db_table = 'leave_balance_ledger'
+        ordering = ['-created_at']
+        constraints = [
+            # A request can only ever be charged once
+            models.UniqueConstraint(
+                fields=['leave_request'],
+                condition=models.Q(entry_type='approval'),
+                name='ledger_one_approval_per_leave',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['balance', '-created_at'], name='ledger_balance_created_idx'),
+        ]
+
+
+class ConversationManager(models.Manager):
+    @staticmethod
+    def pair(a, b):
+        """(low, high) ids of two users or user ids: a conversation's key"""
+        a, b = getattr(a, 'pk', a), getattr(b, 'pk', b)
+        return (a, b) if a <= b else (b, a)
+    
+    def for_pair(self, a, b):
+        low, high = self.pair(a, b)
+        return self.filter(user_low_id=low, user_high_id=high)
+    
+    def between(self, a, b):
+        """The conversation of two users, created on their first message"""
+        low, high = self.pair(a, b)
+        conversation = self.filter(user_low_id=low, user_high_id=high).first()
+        if conversation is None:
+            try:
+                with transaction.atomic():
+                    conversation = self.create(user_low_id=low, user_high_id=high)
+            except IntegrityError:
+                # Created concurrently by another request
+                conversation = self.get(user_low_id=low, user_high_id=high)
+        return conversation
+    
+    def record_message(self, message):
+        """
+        Make `message` the conversation's last message and move the sender's
+        read cursor past it. Greatest() keeps both monotonic when concurrent
+        sends update the row out of order
+        """
+        cursor = self.model.cursor_field(message.sender_id, message.receiver_id)
+        self.filter(pk=message.conversation_id).update(**{
+            'last_message': Greatest(Coalesce('last_message', 0), message.id, output_field=models.BigIntegerField()),
+            'last_activity': Greatest(Coalesce('last_activity', message.created_at), message.created_at),
+            cursor: Greatest(cursor, message.id),
+        })
+    
+    def mark_read(self, user, other, message_id):
+        """Move `user`'s read cursor in their conversation with `other` up to `message_id` (never back)"""
+        if message_id:
+            cursor = self.model.cursor_field(user, other)
+            self.for_pair(user, other).update(**{cursor: Greatest(cursor, message_id)})
+
+
+class Conversation(models.Model):
+    """
+    CONVERSATION - One row per pair of users who have exchanged messages
+    Keyed by the ordered pair (user_low < user_high), so a thread and the
+    inbox are single indexed lookups. last_message, last_activity and
+    the read cursors are kept in the transaction that saves each message
+    (see signals.py)
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(
+        'ChatMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_activity = models.DateTimeField(null=True, blank=True)
+    # READ CURSORS: id of the newest message each participant has seen
+    low_read_id = models.PositiveBigIntegerField(default=0)
+    high_read_id = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ConversationManager()
+    
+    @staticmethod
+    def cursor_field(user, other):
+        """Name of `user`'s read cursor in their conversation with `other`"""
+        low, _ = ConversationManager.pair(user, other)
+        return 'low_read_id' if getattr(user, 'pk', user) == low else 'high_read_id'
+    
+    def read_id(self, user):
+        """Id of the newest message `user` has seen here"""
+        user_id = getattr(user, 'pk', user)
+        return self.low_read_id if user_id == self.user_low_id else self.high_read_id
+    
+    def __str__(self):
+        return f"{self.user_low_id} <-> {self.user_high_id}"
+    
+    class Meta:
+        db_table = 'chat_conversations'
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='conversation_pair_uniq'),
+            models.CheckConstraint(check=models.Q(user_low__lte=F('user_high')), name='conversation_pair_ordered'),
+        ]
+        # Inbox: a user's conversations by recent activity, from either side of the pair
+        indexes = [
+            models.Index(fields=['user_low', '-last_activity'], name='conversation_low_activity_idx'),
+            models.Index(fields=['user_high', '-last_activity'], name='conversation_high_activity_idx'),
+        ]
 
 
 class ChatMessage(models.Model):
@@ -123,40 +412,349 @@ class ChatMessage(models.Model):
     """
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
+    # Required: threads are read by conversation only. save() fills it in from sender/receiver
+    # (see signals.py); bulk_create() callers must set it themselves
+    # (indexed by chat_conversation_idx, which leads with it)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', db_index=False)
     message = models.TextField(blank=True)  # Text message (optional if file attached)
     
-    # FILE UPLOAD: Stores images and PDFs in media/chat_attachments/
-    # Uses Pillow library for image processing
-    attachment = models.FileField(upload_to='chat_attachments/', null=True, blank=True)
+    # FILE UPLOAD: Images and PDFs, stored once per distinct content under media/blobs/
+    # (see storage.py); Pillow makes the thumbnails
+    attachment = models.FileField(upload_to='chat_attachments/', storage=blob_storage, null=True, blank=True)
     attachment_name = models.CharField(max_length=255, blank=True)
     
+    # Filled in after upload by attachments.process_attachment (empty until then)
+    attachment_mime = models.CharField(max_length=100, blank=True)  # Sniffed from the content
+    attachment_size = models.PositiveBigIntegerField(null=True, blank=True)
+    attachment_width = models.PositiveIntegerField(null=True, blank=True)
+    attachment_height = models.PositiveIntegerField(null=True, blank=True)
+    attachment_thumbnail = models.FileField(upload_to='chat_thumbnails/', storage=blob_storage, null=True, blank=True)
+    
     is_read = models.BooleanField(default=False)  # For unread badge
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.sender.email} -> {self.receiver.email}"
     
-    @property
-    def is_image(self):
+    IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp')
+    
+    @classmethod
+    def attachment_kind(cls, name, mime):
         """
-        FILE TYPE DETECTION: Check if attachment is an image
-        Used in template to show image preview vs download link
+        FILE TYPE DETECTION: 'image', 'pdf' or None for an attachment
+        Trusts the sniffed type once processed, the extension until then.
+        Takes plain values so serializers.py can use it on .values() rows
         """
-        if self.attachment:
-            ext = self.attachment.name.lower().split('.')[-1]
-            return ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']
-        return False
+        if mime:
+            if mime.startswith('image/'):
+                return 'image'
+            return 'pdf' if mime == 'application/pdf' else None
+        if name:
+            ext = name.lower().rsplit('.', 1)[-1]
+            if ext in cls.IMAGE_EXTENSIONS:
+                return 'image'
+            return 'pdf' if ext == 'pdf' else None
+        return None
+    
+    @property
+    def is_image(self):
+        """Used in template to show image preview vs download link"""
+        return self.attachment_kind(self.attachment.name, self.attachment_mime) == 'image'
     
     @property
     def is_pdf(self):
-        """
-        FILE TYPE DETECTION: Check if attachment is a PDF
-        Used in template to show PDF icon and download link
-        """
-        if self.attachment:
-            return self.attachment.name.lower().endswith('.pdf')
-        return False
+        """Used in template to show PDF icon and download link"""
+        return self.attachment_kind(self.attachment.name, self.attachment_mime) == 'pdf'
     
     class Meta:
         db_table = 'chat_messages'
         ordering = ['created_at']
+        # COMPOSITE INDEXES: unread badge counts and conversation paging/polling
+        indexes = [
+            # Partial index: only unread rows, which is all the badge count ever reads
+            models.Index(fields=['sender', 'receiver'], condition=models.Q(is_read=False), name='chat_unread_idx'),
+            models.Index(fields=['sender', 'receiver', 'id'], name='chat_thread_idx'),
+            models.Index(fields=['conversation', 'id'], name='chat_conversation_idx'),
+        ]
+
+
+class ChatUpload(models.Model):
+    """
+    CHUNKED ATTACHMENT UPLOAD - A file arriving in pieces (see uploads.py)
+    Chunks are written straight into `path`, the attachment's final storage
+    location; completing the upload hands that file to a new ChatMessage
+    and deletes this row
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_uploads')
+    file_name = models.CharField(max_length=255)  # As the user named it
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()  # Declared up front, never exceeded
+    received = models.PositiveBigIntegerField(default=0)  # Bytes written so far = next offset
+    path = models.CharField(max_length=255)  # Storage name the chunks go to
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def is_complete(self):
+        return self.received == self.size
+    
+    def __str__(self):
+        return f"{self.file_name} ({self.received}/{self.size})"
+    
+    class Meta:
+        db_table = 'chat_uploads'
+        indexes = [
+            models.Index(fields=['updated_at'], name='chat_upload_updated_idx'),
+        ]
+
+
+class StoredBlobManager(models.Manager):
+    def acquire(self, name, size=None):
+        """Count one more field pointing at blob `name` (other names are ignored)"""
+        if not is_blob(name):
+            return
+        if self.filter(name=name).update(ref_count=F('ref_count') + 1):
+            return
+        if size is None:
+            size = blob_storage.size(name) if blob_storage.exists(name) else 0
+        try:
+            with transaction.atomic():
+                self.create(name=name, sha256=name.rsplit('/', 1)[-1][:64], size=size, ref_count=1)
+        except IntegrityError:
+            # Created concurrently by another request
+            self.filter(name=name).update(ref_count=F('ref_count') + 1)
+    
+    def release(self, name):
+        """Count one reference fewer; the blob is deleted after commit once none are left"""
+        if not is_blob(name):
+            return
+        self.filter(name=name).update(ref_count=F('ref_count') - 1)
+        transaction.on_commit(lambda: self.collect(name))
+    
+    def collect(self, name):
+        """
+        Delete the blob's row and file if nothing references it. Returns True
+        if the file went (see BlobStorage.discard for when it is kept)
+        """
+        with transaction.atomic():
+            if not self.filter(name=name, ref_count__lte=0).delete()[0]:
+                return False
+        return blob_storage.discard(name)
+
+
+class StoredBlob(models.Model):
+    """
+    BLOB REFERENCE COUNT - How many file fields point at a stored blob
+    Kept by signals on ChatMessage and User (see signals.py); queryset
+    updates that change file names call acquire()/release() themselves
+    """
+    name = models.CharField(max_length=255, unique=True)  # Storage name under blobs/
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = StoredBlobManager()
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+    
+    class Meta:
+        db_table = 'stored_blobs'
+
+
+class UnreadCounterManager(models.Manager):
+    def increment(self, sender, receiver, by=1):
+        """Add `by` unread messages from sender to receiver's counter"""
+        updated = self.filter(sender=sender, receiver=receiver).update(count=F('count') + by)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    self.create(sender=sender, receiver=receiver, count=by)
+            except IntegrityError:
+                # Created concurrently by another request
+                self.filter(sender=sender, receiver=receiver).update(count=F('count') + by)
+
+    def decrement(self, sender, receiver, by):
+        """Remove `by` messages that were just marked read (never below zero)"""
+        if by:
+            self.filter(sender=sender, receiver=receiver).update(count=Greatest(F('count') - by, 0))
+
+
+class UnreadCounter(models.Model):
+    """
+    DENORMALIZED UNREAD COUNT - One row per (receiver, sender) pair
+    Kept in step with ChatMessage.is_read by the chat views so the contact
+    list reads every badge in the same query instead of one COUNT per contact
+    """
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='unread_counters')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    objects = UnreadCounterManager()
+    
+    def __str__(self):
+        return f"{self.receiver.email} <- {self.sender.email}: {self.count}"
+    
+    class Meta:
+        db_table = 'chat_unread_counters'
+        unique_together = ['receiver', 'sender']
+
+
+class DashboardStatsManager(models.Manager):
+    ROLE_FIELDS = {
+        'admin': 'total_admins',
+        'manager': 'total_managers',
+        'employee': 'total_employees',
+    }
+    
+    def current(self):
+        """The single stats row, rebuilt from scratch if missing"""
+        stats = self.filter(pk=1).first()
+        return stats if stats is not None else self.rebuild()
+    
+    def adjust(self, **deltas):
+        """Apply counter deltas, e.g. adjust(total_users=1, total_employees=1)"""
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        updated = self.filter(pk=1).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if not updated:
+            # First change ever: counting from scratch already includes it
+            self.rebuild()
+    
+    def rebuild(self):
+        """Recount everything from the users and leave_requests tables"""
+        by_role = dict(User.objects.values_list('role').annotate(total=models.Count('id')).order_by())
+        values = {field: by_role.get(role, 0) for role, field in self.ROLE_FIELDS.items()}
+        values['total_users'] = sum(by_role.values())
+        values['pending_leaves'] = LeaveRequest.objects.filter(status='pending').count()
+        values['updated_at'] = timezone.now()
+        stats, _ = self.update_or_create(pk=1, defaults=values)
+        return stats
+
+
+class DashboardStats(models.Model):
+    """
+    MATERIALIZED ADMIN STATISTICS - Single row of running totals
+    Maintained incrementally by signals on User and LeaveRequest (see
+    signals.py) so the admin dashboard reads one row instead of running
+    COUNT(*) over users and leave_requests on every load
+    """
+    total_users = models.PositiveIntegerField(default=0)
+    total_admins = models.PositiveIntegerField(default=0)
+    total_managers = models.PositiveIntegerField(default=0)
+    total_employees = models.PositiveIntegerField(default=0)
+    pending_leaves = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    objects = DashboardStatsManager()
+    
+    def __str__(self):
+        return f"Dashboard stats ({self.updated_at:%Y-%m-%d %H:%M})"
+    
+    class Meta:
+        db_table = 'dashboard_stats'
+
+
+class LeaveRollupManager(models.Manager):
+    UPSERT_BATCH_SIZE = 500
+    
+    def department_of(self, leave):
+        """The department a leave is rolled up under, without a query if the employee is loaded"""
+        employee = leave._state.fields_cache.get('employee')
+        if employee is not None and 'department' in employee.__dict__:
+            return employee.department
+        return User.objects.filter(pk=leave.employee_id).values_list('department', flat=True).first()
+    
+    def apply(self, changes):
+        """
+        Add changes to the rollups, each a tuple of
+        (department, leave_type_id, start_date, status, requests, days).
+        Changes to the same row are summed first and every row is written
+        with one INSERT ... ON CONFLICT DO UPDATE, so concurrent writers
+        add up correctly and a batch costs one query per 500 rows
+        """
+        totals = {}
+        for department, leave_type_id, start_date, status, requests, days in changes:
+            key = (department or '', leave_type_id, start_date.replace(day=1), status)
+            old_requests, old_days = totals.get(key, (0, 0))
+            totals[key] = (old_requests + requests, old_days + days)
+        rows = [key + delta for key, delta in totals.items() if any(delta)]
+        
+        connection = connections[self.db]
+        month_field = self.model._meta.get_field('month')
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        for start in range(0, len(rows), self.UPSERT_BATCH_SIZE):
+            batch = rows[start:start + self.UPSERT_BATCH_SIZE]
+            params = []
+            for department, leave_type_id, month, status, requests, days in batch:
+                params += [department, leave_type_id, month_field.get_db_prep_value(month, connection),
+                           status, requests, days]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} (department, leave_type_id, month, status, request_count, total_days) '
+                    f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT (department, leave_type_id, month, status) DO UPDATE SET '
+                    f'request_count = {table}.request_count + EXCLUDED.request_count, '
+                    f'total_days = {table}.total_days + EXCLUDED.total_days',
+                    params
+                )
+    
+    def rebuild(self):
+        """Recount every rollup row from leave_requests. Returns the number of rows"""
+        groups = (
+            LeaveRequest.objects.order_by()
+            .annotate(month=TruncMonth('start_date'))
+            .values('employee__department', 'leave_type_id', 'month', 'status')
+            .annotate(requests=models.Count('id'), days=models.Sum('total_days'))
+        )
+        rollups = [
+            self.model(
+                department=group['employee__department'] or '',
+                leave_type_id=group['leave_type_id'],
+                month=group['month'],
+                status=group['status'],
+                request_count=group['requests'],
+                total_days=group['days'] or 0,
+            )
+            for group in groups
+        ]
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(rollups, batch_size=self.UPSERT_BATCH_SIZE)
+        return len(rollups)
+
+
+class LeaveRollup(models.Model):
+    """
+    LEAVE ANALYTICS ROLLUP - Requests and days per department, leave type,
+    month and status
+    Maintained incrementally by signals on LeaveRequest and User (see
+    signals.py), and by the services that change leaves in bulk, so
+    reports read a few hundred rows instead of scanning leave_requests.
+    A leave counts in the month it starts in, under the employee's
+    current department
+    """
+    department = models.CharField(max_length=100, blank=True)
+    leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE, related_name='+')
+    month = models.DateField()  # First day of the month
+    status = models.CharField(max_length=20, choices=LeaveRequest.STATUS_CHOICES)
+    request_count = models.IntegerField(default=0)
+    total_days = models.IntegerField(default=0)
+    
+    objects = LeaveRollupManager()
+    
+    def __str__(self):
+        return f"{self.department or '-'} / {self.leave_type_id} / {self.month:%Y-%m} / {self.status}"
+    
+    class Meta:
+        db_table = 'leave_rollups'
+        unique_together = ['department', 'leave_type', 'month', 'status']
+        indexes = [
+            models.Index(fields=['month'], name='rollup_month_idx'),
+        ]
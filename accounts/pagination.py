@@ -0,0 +1,126 @@
+"""
+KEYSET PAGINATION - Seek-based paging for long listings
+
+Pages are addressed by a cursor holding the sort key of the row at the
+page edge, e.g. (created_at, id), instead of an OFFSET. Each page is a
+single indexed range query, so page 500 costs the same as page one and
+rows inserted meanwhile never shift or duplicate entries.
+
+Listings are ordered newest first on (key, id):
+    ?after=<cursor>   rows older than the cursor (next page)
+    ?before=<cursor>  rows newer than the cursor (previous page)
+Other query parameters (e.g. the status filter) are carried over into
+the next/previous links unchanged.
+
+The cursor condition is one row-value comparison, (key, id) < (k, pk),
+rather than key < k OR (key = k AND id < pk): the database turns it into
+a range on a composite (..., key, id) index and reads the page in index
+order, where the OR form needs both branches merged and sorted. Every
+paginated listing has such an index (see the models' Meta.indexes).
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import BooleanField, F, Func, Value
+
+DEFAULT_PAGE_SIZE = 25
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (key, id) from a cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, pk = json.loads(raw)
+        return datetime.fromisoformat(key), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+class RowCompare(Func):
+    """`(field, ...) <op> (value, ...)` as a single SQL row-value comparison"""
+    conditional = True
+    output_field = BooleanField()
+
+    def __init__(self, model, fields, op, values):
+        self.op = op
+        self.width = len(fields)
+        super().__init__(
+            *[F(name) for name in fields],
+            *[Value(value, output_field=model._meta.get_field(name)) for name, value in zip(fields, values)],
+        )
+
+    def as_sql(self, compiler, connection):
+        parts, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            parts.append(sql)
+            params.extend(expression_params)
+        columns, values = ', '.join(parts[:self.width]), ', '.join(parts[self.width:])
+        return f'({columns}) {self.op} ({values})', params
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, has_previous, key_field, query_params):
+        self.items = items
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._key_field = key_field
+        self._query_params = query_params
+
+    def _edge_query(self, direction, item):
+        params = self._query_params.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[direction] = encode_cursor([getattr(item, self._key_field), item.pk])
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        """Query string for the next (older) page, or '' on the last page"""
+        if not self.has_next:
+            return ''
+        return self._edge_query('after', self.items[-1])
+
+    @property
+    def previous_query(self):
+        """Query string for the previous (newer) page, or '' on the first page"""
+        if not self.has_previous:
+            return ''
+        return self._edge_query('before', self.items[0])
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(request, queryset, key_field, per_page=DEFAULT_PAGE_SIZE):
+    """
+    Return one KeysetPage of `queryset` ordered by (-key_field, -id),
+    positioned by the ?after= / ?before= cursor in request.GET
+    """
+    after = decode_cursor(request.GET.get('after', ''))
+    before = None if after else decode_cursor(request.GET.get('before', ''))
+
+    fields = (key_field, 'id')
+    if before:
+        rows = list(
+            queryset.filter(RowCompare(queryset.model, fields, '>', before))
+            .order_by(key_field, 'id')[:per_page + 1]
+        )
+        if len(rows) > per_page:
+            return KeysetPage(rows[:per_page][::-1], True, True, key_field, request.GET)
+        # Reached the newest rows: fall through to a full first page
+
+    if after:
+        queryset = queryset.filter(RowCompare(queryset.model, fields, '<', after))
+    rows = list(queryset.order_by(f'-{key_field}', '-id')[:per_page + 1])
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], has_next, bool(after), key_field, request.GET)
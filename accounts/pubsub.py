@@ -0,0 +1,333 @@
+"""
+CHAT FAN-OUT BUS - Pluggable publish/subscribe for real-time delivery
+
+Views publish events to named channels and push streams subscribe to
+them. Every backend fans events out to the subscribers of its own
+process through a LocalHub; cross-process backends additionally carry
+each event to the hubs of all other workers:
+
+- InProcessBackend: single process only (runserver, one ASGI worker)
+- SQLiteBackend:    processes on one machine share an SQLite event log
+- PostgresBackend:  any number of nodes via LISTEN/NOTIFY
+
+Configured with settings.CHAT_BUS, in the same shape as CACHES:
+
+    CHAT_BUS = {
+        'BACKEND': 'accounts.pubsub.SQLiteBackend',
+        'OPTIONS': {'path': '/tmp/leaveflow-bus.sqlite3'},
+    }
+"""
+import asyncio
+import json
+import logging
+import select
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LocalHub:
+    """
+    In-process fan-out: channel name -> set of asyncio queues.
+
+    publish() may be called from any thread (sync views run in a thread
+    pool under ASGI, listeners run in their own thread), so queues are
+    fed through their own event loop.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # Event loop already closed - subscriber is gone
+                pass
+        return len(targets)
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            # Slow client: drop the oldest event rather than block publishers
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def subscribe(self, channel, setup=None):
+        return Subscription(self, channel, setup)
+
+    def _add(self, channel, entry):
+        with self._lock:
+            self._subscribers[channel].add(entry)
+
+    def _remove(self, channel, entry):
+        with self._lock:
+            entries = self._subscribers.get(channel)
+            if entries is not None:
+                entries.discard(entry)
+                if not entries:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+class Subscription:
+    """
+    Async context manager yielding events published to one channel.
+    `setup` (blocking, e.g. starting a listener) runs in a worker thread first
+    """
+
+    def __init__(self, hub, channel, setup=None):
+        self.hub = hub
+        self.channel = channel
+        self.setup = setup
+        self._entry = None
+
+    async def __aenter__(self):
+        if self.setup is not None:
+            await sync_to_async(self.setup, thread_sensitive=False)()
+        queue = asyncio.Queue(maxsize=self.hub.queue_size)
+        self._entry = (asyncio.get_running_loop(), queue)
+        self.hub._add(self.channel, self._entry)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.hub._remove(self.channel, self._entry)
+
+    async def get(self, timeout=None):
+        """Wait for the next event; returns None on timeout"""
+        try:
+            return await asyncio.wait_for(self._entry[1].get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BaseBackend:
+    """
+    Common interface. Subclasses implement publish() and, if they carry
+    events between processes, a listener that feeds self.hub.
+    """
+
+    def __init__(self, queue_size=100):
+        self.hub = LocalHub(queue_size=queue_size)
+
+    def publish(self, channel, event):
+        """
+        Send `event` to the channel's subscribers. Returns the number of
+        deliveries: local subscribers reached, or events put on the bus for
+        backends whose subscribers live in other processes
+        """
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        # The listener starts (and may wait to connect) off the event loop
+        return self.hub.subscribe(channel, setup=None if self.is_listening() else self.start)
+
+    def is_listening(self):
+        """Whether events from other processes already reach self.hub"""
+        return True
+
+    def start(self):
+        """Start the background listener, if any (blocking; called lazily)"""
+
+    def close(self):
+        """Stop the background listener, if any"""
+
+
+class InProcessBackend(BaseBackend):
+    """Delivers only to subscribers in the publishing process"""
+
+    def publish(self, channel, event):
+        return self.hub.publish(channel, event)
+
+
+class ListenerBackend(BaseBackend):
+    """Base for backends that receive events in a daemon listener thread"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._thread = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def is_listening(self):
+        return self._ready.is_set() and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._ready = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._ready,), name=f'{type(self).__name__}-listener', daemon=True
+                )
+                self._thread.start()
+            ready = self._ready
+        # Events published after subscribe() returns must not be missed
+        ready.wait(timeout=5)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, ready):
+        while not self._stop.is_set():
+            try:
+                self.listen(ready)
+            except Exception:
+                logger.exception('%s listener failed, reconnecting', type(self).__name__)
+                self._stop.wait(1)
+
+    def listen(self, ready):
+        raise NotImplementedError
+
+    def _dispatch(self, raw):
+        data = json.loads(raw)
+        self.hub.publish(data['channel'], data['event'])
+
+
+class SQLiteBackend(ListenerBackend):
+    """
+    Cross-process bus for a single machine. publish() appends to an
+    event log in a small SQLite file; one listener thread per process
+    tails the log and fans new rows out locally. Old rows are pruned
+    after `retention` seconds.
+    """
+
+    def __init__(self, path=None, poll_interval=0.05, retention=60, **options):
+        super().__init__(**options)
+        self.path = str(path or settings.BASE_DIR / 'chat_bus.sqlite3')
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS bus_events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created REAL NOT NULL)'
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+
+    def _publisher(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def publish(self, channel, event):
+        payload = json.dumps({'channel': channel, 'event': event})
+        return self._publisher().execute(
+            'INSERT INTO bus_events (payload, created) VALUES (?, ?)', (payload, time.time())
+        ).rowcount
+
+    def listen(self, ready):
+        conn = self._connect()
+        try:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM bus_events').fetchone()[0]
+            ready.set()
+            last_prune = time.monotonic()
+            while not self._stop.is_set():
+                rows = conn.execute(
+                    'SELECT id, payload FROM bus_events WHERE id > ? ORDER BY id', (last_id,)
+                ).fetchall()
+                for row_id, payload in rows:
+                    last_id = row_id
+                    self._dispatch(payload)
+                if time.monotonic() - last_prune > self.retention:
+                    conn.execute('DELETE FROM bus_events WHERE created < ?', (time.time() - self.retention,))
+                    last_prune = time.monotonic()
+                self._stop.wait(self.poll_interval)
+        finally:
+            conn.close()
+
+
+class PostgresBackend(ListenerBackend):
+    """
+    Cross-node bus using PostgreSQL LISTEN/NOTIFY on the default
+    database. NOTIFY payloads are limited to 8000 bytes; larger events
+    are replaced by a 'resync' event telling clients to fetch instead.
+    """
+
+    PAYLOAD_LIMIT = 7900
+
+    def __init__(self, channel='leaveflow_bus', using='default', **options):
+        super().__init__(**options)
+        self.pg_channel = channel
+        self.using = using
+
+    def publish(self, channel, event):
+        from django.db import connections
+
+        payload = json.dumps({'channel': channel, 'event': event})
+        if len(payload.encode()) > self.PAYLOAD_LIMIT:
+            payload = json.dumps({'channel': channel, 'event': {'type': 'resync'}})
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.pg_channel, payload])
+        return 1
+
+    def listen(self, ready):
+        import psycopg2
+        from django.db import connections
+
+        params = connections[self.using].get_connection_params()
+        params.pop('cursor_factory', None)
+        conn = psycopg2.connect(**params)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.pg_channel}"')
+            ready.set()
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide bus configured in settings.CHAT_BUS"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                conf = getattr(settings, 'CHAT_BUS', {})
+                backend_cls = import_string(conf.get('BACKEND', 'accounts.pubsub.InProcessBackend'))
+                _backend = backend_cls(**conf.get('OPTIONS', {}))
+    return _backend
+
+
+def publish(channel, event):
+    return get_backend().publish(channel, event)
+
+
+def subscribe(channel):
+    return get_backend().subscribe(channel)
@@ -0,0 +1,52 @@
+"""
+REAL-TIME CHAT DELIVERY - Push new messages to connected browsers
+
+Each open chat page keeps one Server-Sent Events connection to
+/chat/stream/ (served by the ASGI app in config/asgi.py). When
+send_message commits a new ChatMessage, the payload is published on the
+chat bus (see pubsub.py) to the receiver's channel and every stream that
+user has open gets it at once, whichever worker it is connected to.
+"""
+import json
+
+from django.conf import settings
+
+from . import pubsub
+
+
+def user_channel(user_id):
+    """Channel name a user's streams listen on"""
+    return f'user.{user_id}'
+
+
+def publish_message(receiver_id, payload):
+    """Push a serialized ChatMessage to every open stream of the receiver"""
+    return pubsub.publish(user_channel(receiver_id), {'type': 'message', 'message': payload})
+
+
+def format_sse(event):
+    """Encode one event in text/event-stream wire format"""
+    lines = []
+    message = event.get('message')
+    if message and 'id' in message:
+        lines.append(f"id: {message['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+async def event_stream(user_id):
+    """
+    SSE body for one connected user. Sends a comment line as heartbeat
+    so proxies keep idle connections open.
+    """
+    heartbeat = getattr(settings, 'CHAT_STREAM_HEARTBEAT', 15)
+    async with pubsub.subscribe(user_channel(user_id)) as subscription:
+        # Tell the browser how fast to reconnect after a dropped connection
+        yield b'retry: 3000\n\n'
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            if event is None:
+                yield b': ping\n\n'
+            else:
+                yield format_sse(event)
@@ -0,0 +1,228 @@
+"""
+LEAVE SERVICES - Leave state transitions that touch several tables
+
+Each transition runs in one transaction and is decided by a conditional
+UPDATE (... WHERE status = 'pending'), so two managers clicking at once,
+or a double-submitted form, can only ever apply it once. Balances move
+with F() expressions in the database, never read-modify-write in Python.
+
+Queryset update() skips model signals, so the denormalized data kept by
+signals.py (dashboard stats, leave rollups, dashboard cache) is adjusted
+here directly.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import dashboard_cache
+from .models import (
+    DashboardStats, LeaveBalance, LeaveBalanceLedger, LeaveRequest, LeaveRollup, LeaveType, User
+)
+
+
+def charge_balance(leave_request, user, entry_type='approval'):
+    """
+    Add the request's days to the employee's balance for this year and
+    record a ledger entry. Returns the entry, or None without a balance row
+    """
+    balance_id = LeaveBalance.objects.filter(
+        employee_id=leave_request.employee_id,
+        leave_type_id=leave_request.leave_type_id,
+        year=timezone.now().year
+    ).values_list('id', flat=True).first()
+    if balance_id is None:
+        return None
+    LeaveBalance.objects.filter(pk=balance_id).update(used_days=F('used_days') + leave_request.total_days)
+    return LeaveBalanceLedger.objects.create(
+        balance_id=balance_id,
+        leave_request=leave_request,
+        entry_type=entry_type,
+        days=leave_request.total_days,
+        created_by=user,
+    )
+
+
+def decide_leave(leave_request, manager, approve):
+    """
+    Approve or reject a pending request. Returns False, changing nothing,
+    if it was no longer pending (already decided or cancelled)
+    """
+    status = 'approved' if approve else 'rejected'
+    with transaction.atomic():
+        decided = LeaveRequest.objects.filter(pk=leave_request.pk, status='pending').update(
+            status=status, approved_by=manager, updated_at=timezone.now()
+        )
+        if not decided:
+            return False
+        if approve:
+            charge_balance(leave_request, manager)
+        DashboardStats.objects.adjust(pending_leaves=-1)
+        _rollup_decisions([(
+            LeaveRollup.objects.department_of(leave_request), leave_request.leave_type_id,
+            leave_request.start_date, leave_request.total_days
+        )], status)
+        # After commit, so a concurrent request cannot re-cache the old state
+        transaction.on_commit(
+            lambda: dashboard_cache.invalidate(leave_request.employee_id, manager.id)
+        )
+
+    leave_request.status = status
+    leave_request.approved_by = manager
+    leave_request._counted_status = status
+    leave_request._rolled_up = (
+        leave_request.leave_type_id, leave_request.start_date, status, leave_request.total_days
+    )
+    return True
+
+
+class LeaveConflict(Exception):
+    """Raised when requests change under a bulk decision; nothing was applied"""
+
+
+def decide_leaves(manager, leave_ids, approve):
+    """
+    Approve or reject many pending requests of the manager's team at once.
+    A fixed number of queries whatever the batch size: one ownership read,
+    one status UPDATE, one balance lookup, one CASE balance UPDATE, one
+    ledger bulk INSERT, one stats update and one rollup upsert, all in one
+    transaction.
+
+    Returns a summary dict: decided / not_pending / not_found ids and days_charged
+    """
+    status = 'approved' if approve else 'rejected'
+    leave_ids = set(leave_ids)
+    with transaction.atomic():
+        # Team ownership and current status in one read; rows stay locked
+        # until commit on databases that support SELECT ... FOR UPDATE
+        owned = list(
+            LeaveRequest.objects.select_for_update(of=('self',))
+            .filter(pk__in=leave_ids, employee__manager=manager)
+            .values(
+                'id', 'status', 'employee_id', 'leave_type_id', 'total_days', 'start_date', 'employee__department'
+            )
+        )
+        pending = [row for row in owned if row['status'] == 'pending']
+        pending_ids = [row['id'] for row in pending]
+
+        decided = 0
+        if pending_ids:
+            decided = LeaveRequest.objects.filter(pk__in=pending_ids, status='pending').update(
+                status=status, approved_by=manager, updated_at=timezone.now()
+            )
+        if decided != len(pending_ids):
+            # Another transaction decided some of them between the read and
+            # the update (no row locks on SQLite): roll back the whole batch
+            raise LeaveConflict('Some leave requests were processed by someone else, reload and retry')
+
+        days_charged = _charge_balances(pending, manager) if approve and pending else 0
+        DashboardStats.objects.adjust(pending_leaves=-decided)
+        _rollup_decisions([
+            (row['employee__department'], row['leave_type_id'], row['start_date'], row['total_days'])
+            for row in pending
+        ], status)
+        employee_ids = {row['employee_id'] for row in pending}
+        transaction.on_commit(lambda: dashboard_cache.invalidate(manager.id, *employee_ids))
+
+    owned_ids = {row['id'] for row in owned}
+    return {
+        'action': status,
+        'decided': sorted(pending_ids),
+        'not_pending': sorted(owned_ids - set(pending_ids)),
+        'not_found': sorted(leave_ids - owned_ids),
+        'days_charged': days_charged,
+    }
+
+
+def _rollup_decisions(leaves, status):
+    """Move decided (department, leave_type_id, start_date, days) leaves out of the pending rollups"""
+    changes = []
+    for department, leave_type_id, start_date, days in leaves:
+        changes.append((department, leave_type_id, start_date, 'pending', -1, -days))
+        changes.append((department, leave_type_id, start_date, status, 1, days))
+    LeaveRollup.objects.apply(changes)
+
+
+def _charge_balances(rows, user):
+    """Charge this year's balances for approved request rows in three queries"""
+    days_by_key = {}
+    for row in rows:
+        key = (row['employee_id'], row['leave_type_id'])
+        days_by_key[key] = days_by_key.get(key, 0) + row['total_days']
+
+    balance_ids = {
+        (employee_id, leave_type_id): balance_id
+        for balance_id, employee_id, leave_type_id in LeaveBalance.objects.filter(
+            employee_id__in={key[0] for key in days_by_key},
+            leave_type_id__in={key[1] for key in days_by_key},
+            year=timezone.now().year
+        ).values_list('id', 'employee_id', 'leave_type_id')
+    }
+    charges = {balance_ids[key]: days for key, days in days_by_key.items() if key in balance_ids}
+    if not charges:
+        return 0
+
+    LeaveBalance.objects.filter(pk__in=charges).update(used_days=F('used_days') + Case(
+        *[When(pk=balance_id, then=Value(days)) for balance_id, days in charges.items()],
+        output_field=IntegerField(),
+    ))
+    LeaveBalanceLedger.objects.bulk_create([
+        LeaveBalanceLedger(
+            balance_id=balance_ids[(row['employee_id'], row['leave_type_id'])],
+            leave_request_id=row['id'],
+            entry_type='approval',
+            days=row['total_days'],
+            created_by=user,
+        )
+        for row in rows if (row['employee_id'], row['leave_type_id']) in balance_ids
+    ])
+    return sum(charges.values())
+
+
+PROVISION_BATCH_SIZE = 5000
+
+
+def provision_leave_balances(year, employee_ids=None, batch_size=PROVISION_BATCH_SIZE):
+    """
+    Create the year's LeaveBalance for every active employee x LeaveType,
+    with total_days = LeaveType.default_days. Existing rows are left alone
+    (bulk_create with ignore_conflicts on the unique employee/type/year),
+    so it is safe to re-run. Employees are read and inserted in chunks of
+    `batch_size` rows to keep memory flat. Returns the number of rows created.
+    """
+    leave_types = list(LeaveType.objects.values_list('id', 'default_days'))
+    if not leave_types:
+        return 0
+
+    employees = User.objects.filter(role='employee', is_active=True)
+    if employee_ids is not None:
+        employees = employees.filter(pk__in=employee_ids)
+    created = 0
+    per_chunk = max(1, batch_size // len(leave_types))
+    chunk = []
+    for employee_id in employees.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=per_chunk):
+        chunk.append(employee_id)
+        if len(chunk) == per_chunk:
+            created += _create_balances(chunk, leave_types, year)
+            chunk = []
+    if chunk:
+        created += _create_balances(chunk, leave_types, year)
+    return created
+
+
+def _create_balances(employee_ids, leave_types, year):
+    """Insert the chunk's missing balances; returns how many were created"""
+    # ignore_conflicts does not report which rows went in: count the chunk's own
+    # rows before and after (a lookup on the employee/type/year unique index)
+    balances = LeaveBalance.objects.filter(employee_id__in=employee_ids, year=year)
+    before = balances.count()
+    LeaveBalance.objects.bulk_create(
+        [
+            LeaveBalance(employee_id=employee_id, leave_type_id=leave_type_id, year=year, total_days=days)
+            for employee_id in employee_ids
+            for leave_type_id, days in leave_types
+        ],
+        ignore_conflicts=True,
+    )
+    # bulk_create skips the post_save signal that refreshes cached dashboards
+    dashboard_cache.invalidate_many(employee_ids)
+    return balances.count() - before
@@ -0,0 +1,265 @@
+"""
+SIGNAL HANDLERS - Keep denormalized data in step with model changes
+
+Connected in AccountsConfig.ready(). Queryset update()/bulk_create()
+bypass signals, so code using them must adjust the same data itself.
+"""
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import dashboard_cache, services
+from .models import (
+    ChatMessage, Conversation, DashboardStats, Holiday, HolidayCalendar, LeaveBalance, LeaveRequest, LeaveRollup,
+    LeaveType, StoredBlob, User
+)
+
+ROLE_FIELDS = DashboardStats.objects.ROLE_FIELDS
+
+# User fields shown on the manager dashboard's team and pending lists
+TEAM_FIELDS = ('manager_id', 'full_name', 'email', 'role')
+
+# LeaveRequest fields that place a request in the rollups, then its days
+ROLLUP_FIELDS = ('leave_type_id', 'start_date', 'status', 'total_days')
+
+# File fields whose blobs are reference counted (see storage.py)
+BLOB_FIELDS = {
+    ChatMessage: ('attachment', 'attachment_thumbnail'),
+    User: ('profile_picture', 'avatar_48', 'avatar_96', 'avatar_256'),
+}
+
+
+# ---------- Remember the values the stats were last counted with ----------
+# Read from __dict__: touching a deferred field here would cost a query per row
+
+@receiver(post_init, sender=User)
+def remember_user_role(sender, instance, **kwargs):
+    instance._counted_role = instance.__dict__.get('role')
+    instance._cached_team_fields = {f: instance.__dict__.get(f) for f in TEAM_FIELDS}
+    instance._rolled_up_department = instance.__dict__.get('department')
+
+
+@receiver(post_init, sender=LeaveRequest)
+def remember_leave_status(sender, instance, **kwargs):
+    instance._counted_status = instance.__dict__.get('status')
+    instance._rolled_up = tuple(instance.__dict__.get(f) for f in ROLLUP_FIELDS)
+
+
+# ---------- Admin dashboard statistics ----------
+
+def role_deltas(role, delta):
+    field = ROLE_FIELDS.get(role)
+    return {field: delta} if field else {}
+
+
+@receiver(post_save, sender=User)
+def count_user_saved(sender, instance, created, **kwargs):
+    role = instance.__dict__.get('role')
+    deltas = {}
+    if created:
+        deltas = {'total_users': 1, **role_deltas(role, 1)}
+    elif instance._counted_role and role and instance._counted_role != role:
+        deltas = {**role_deltas(instance._counted_role, -1), **role_deltas(role, 1)}
+    DashboardStats.objects.adjust(**deltas)
+    instance._counted_role = role
+
+
+@receiver(post_delete, sender=User)
+def count_user_deleted(sender, instance, **kwargs):
+    role = instance._counted_role or instance.role
+    DashboardStats.objects.adjust(total_users=-1, **role_deltas(role, -1))
+
+
+@receiver(post_save, sender=LeaveRequest)
+def count_leave_saved(sender, instance, created, **kwargs):
+    status = instance.__dict__.get('status')
+    if status is None:
+        return
+    was_pending = not created and instance._counted_status == 'pending'
+    is_pending = status == 'pending'
+    DashboardStats.objects.adjust(pending_leaves=int(is_pending) - int(was_pending))
+    instance._counted_status = status
+
+
+@receiver(post_delete, sender=LeaveRequest)
+def count_leave_deleted(sender, instance, **kwargs):
+    if (instance._counted_status or instance.status) == 'pending':
+        DashboardStats.objects.adjust(pending_leaves=-1)
+
+
+# ---------- Dashboard cache invalidation ----------
+
+def manager_of(employee_id):
+    return User.objects.filter(pk=employee_id).values_list('manager_id', flat=True).first()
+
+
+@receiver(pre_save, sender=LeaveRequest)
+def attach_team_manager(sender, instance, **kwargs):
+    if instance._state.adding and instance.team_manager_id is None:
+        employee = instance._state.fields_cache.get('employee')
+        instance.team_manager_id = employee.manager_id if employee else manager_of(instance.employee_id)
+
+
+def invalidate_leave_dashboards(instance):
+    employee = instance._state.fields_cache.get('employee')
+    manager_id = employee.manager_id if employee else manager_of(instance.employee_id)
+    dashboard_cache.invalidate(instance.employee_id, manager_id)
+
+
+@receiver(post_save, sender=LeaveRequest)
+@receiver(post_delete, sender=LeaveRequest)
+def invalidate_leave_changed(sender, instance, **kwargs):
+    invalidate_leave_dashboards(instance)
+
+
+@receiver(post_save, sender=LeaveBalance)
+@receiver(post_delete, sender=LeaveBalance)
+def invalidate_balance_changed(sender, instance, **kwargs):
+    dashboard_cache.invalidate(instance.employee_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_team_changed(sender, instance, created, **kwargs):
+    # Ignore saves that touch nothing on a team listing, e.g. last_login on every login
+    current = {f: instance.__dict__.get(f) for f in TEAM_FIELDS}
+    previous = instance._cached_team_fields
+    changed = [f for f in TEAM_FIELDS if f in instance.__dict__ and current[f] != previous[f]]
+    if created:
+        # A recycled id must not inherit a cached dashboard
+        dashboard_cache.invalidate(instance.id, current['manager_id'])
+    elif changed:
+        dashboard_cache.invalidate(previous['manager_id'], current['manager_id'])
+    if not created and 'manager_id' in changed:
+        # The employee's requests move to the new manager's team listings
+        LeaveRequest.objects.filter(employee_id=instance.id).update(team_manager_id=current['manager_id'])
+    instance._cached_team_fields = current
+
+
+@receiver(post_delete, sender=User)
+def invalidate_team_member_deleted(sender, instance, **kwargs):
+    dashboard_cache.invalidate(instance.manager_id, instance.id)
+
+
+# ---------- Leave analytics rollups ----------
+
+@receiver(post_save, sender=LeaveRequest)
+def rollup_leave_saved(sender, instance, created, **kwargs):
+    # getattr loads a field deferred at init; untouched, it still holds the saved value
+    current = tuple(getattr(instance, f) for f in ROLLUP_FIELDS)
+    previous = None if created else tuple(
+        old if old is not None else new for old, new in zip(instance._rolled_up, current)
+    )
+    if previous != current:
+        department = LeaveRollup.objects.department_of(instance)
+        changes = [(department, *current[:3], 1, current[3])]
+        if previous is not None:
+            changes.append((department, *previous[:3], -1, -previous[3]))
+        LeaveRollup.objects.apply(changes)
+    instance._rolled_up = current
+
+
+@receiver(post_delete, sender=LeaveRequest)
+def rollup_leave_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, LeaveType) or getattr(origin, 'model', None) is LeaveType:
+        return  # the type's rollup rows are deleted with it
+    values = tuple(
+        old if old is not None else instance.__dict__.get(f) for f, old in zip(ROLLUP_FIELDS, instance._rolled_up)
+    )
+    if None in values:
+        return  # never loaded; rebuild_leave_rollups recounts
+    if isinstance(origin, User) and origin.pk == instance.employee_id:
+        department = origin.department
+    else:
+        department = LeaveRollup.objects.department_of(instance)
+    LeaveRollup.objects.apply([(department, *values[:3], -1, -values[3])])
+
+
+@receiver(post_save, sender=User)
+def rollup_department_changed(sender, instance, created, **kwargs):
+    # Leaves roll up under the employee's current department: move them all
+    department = instance.__dict__.get('department')
+    previous = instance._rolled_up_department
+    if not created and department is not None and previous is not None and department != previous:
+        groups = (
+            instance.leave_requests.order_by()
+            .annotate(month=TruncMonth('start_date'))
+            .values('leave_type_id', 'month', 'status')
+            .annotate(requests=Count('id'), days=Sum('total_days'))
+        )
+        changes = []
+        for group in groups:
+            key = (group['leave_type_id'], group['month'], group['status'])
+            changes.append((previous, *key, -group['requests'], -group['days']))
+            changes.append((department, *key, group['requests'], group['days']))
+        LeaveRollup.objects.apply(changes)
+    instance._rolled_up_department = department
+
+
+# ---------- Blob reference counts ----------
+
+def file_names(instance):
+    # As loaded: a plain name until the FieldFile descriptor has wrapped it
+    values = {f: instance.__dict__.get(f) for f in BLOB_FIELDS[type(instance)]}
+    return {f: getattr(value, 'name', value) or '' for f, value in values.items()}
+
+
+@receiver(post_init, sender=ChatMessage)
+@receiver(post_init, sender=User)
+def remember_blob_names(sender, instance, **kwargs):
+    instance._blob_names = file_names(instance)
+
+
+@receiver(post_save, sender=ChatMessage)
+@receiver(post_save, sender=User)
+def count_blob_references(sender, instance, created, **kwargs):
+    current = file_names(instance)
+    previous = instance._blob_names
+    for field, name in current.items():
+        # A field deferred and never touched was not saved either
+        if field in instance.__dict__ and (created or name != previous[field]):
+            StoredBlob.objects.acquire(name)
+            if not created:
+                StoredBlob.objects.release(previous[field])
+    instance._blob_names = current
+
+
+@receiver(post_delete, sender=ChatMessage)
+@receiver(post_delete, sender=User)
+def release_blob_references(sender, instance, **kwargs):
+    current = file_names(instance)
+    for field, name in instance._blob_names.items():
+        StoredBlob.objects.release(name or current[field])
+
+
+# ---------- Chat conversations ----------
+
+@receiver(pre_save, sender=ChatMessage)
+def attach_conversation(sender, instance, **kwargs):
+    if instance.conversation_id is None:
+        instance.conversation = Conversation.objects.between(instance.sender_id, instance.receiver_id)
+
+
+@receiver(post_save, sender=ChatMessage)
+def record_last_message(sender, instance, created, **kwargs):
+    # Same transaction as the message: the inbox never shows a message that did not commit
+    if created:
+        Conversation.objects.record_message(instance)
+
+
+# ---------- Leave balance provisioning ----------
+
+@receiver(post_save, sender=User)
+def provision_new_employee(sender, instance, created, **kwargs):
+    if created and instance.role == 'employee' and instance.is_active:
+        services.provision_leave_balances(timezone.now().year, employee_ids=[instance.pk])
+
+
+# ---------- Working-day tables ----------
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def touch_holiday_calendar(sender, instance, **kwargs):
+    # workdays.py rebuilds a calendar's tables when updated_at moves
+    HolidayCalendar.objects.filter(pk=instance.calendar_id).update(updated_at=timezone.now())
@@ -0,0 +1,147 @@
+"""
+CONTENT-ADDRESSED MEDIA STORAGE - One file per distinct content
+
+Chat attachments, their thumbnails and profile pictures are stored under
+blobs/ named by the SHA-256 of their bytes (plus the original extension,
+so URLs keep a usable type):
+
+    blobs/3f/a9/3fa9...c2.pdf
+
+The digest is computed while the upload is streamed to a temp file next
+to its final place; if that blob already exists the temp file is dropped,
+so the same policy PDF sent to fifty people is stored once. StoredBlob
+rows count the model fields pointing at each blob (kept by signals.py)
+and the file is deleted when the last reference goes.
+
+A save that reuses an existing blob only counts its reference when its
+transaction commits, so the blob can lose its last other reference in
+between. Storing a blob (new or reused) therefore sets its mtime, and
+discard() keeps files stored within BLOB_COLLECT_GRACE seconds; one kept
+for a save that never commits is left to collect_blobs' orphan sweep.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs/'
+READ_SIZE = 1024 * 1024
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def blob_name(digest, ext):
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def _extension(name):
+    return os.path.splitext(name)[1].lower()[:10]
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """FileSystemStorage under MEDIA_ROOT whose names come from the file's SHA-256"""
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the real name; equal content is meant to share it
+        return name
+
+    def _save(self, name, content):
+        os.makedirs(self.path(BLOB_PREFIX), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.path(BLOB_PREFIX), suffix='.part')
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._store(temp_path, digest.hexdigest(), _extension(name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _store(self, temp_path, digest, ext):
+        """Move a fully written temp file to its blob name, unless that blob exists"""
+        name = blob_name(digest, ext)
+        path = self.path(name)
+        try:
+            # Reused: the fresh mtime keeps discard() off it until our reference is counted
+            os.utime(path)
+        except FileNotFoundError:
+            # New, or collected since: (re)write it
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, path)  # atomic: readers never see a partial blob
+        else:
+            os.remove(temp_path)
+        return name
+
+    def adopt(self, path, move=True):
+        """
+        Store the local file at `path` (e.g. a finished chunked upload)
+        and return its blob name. The file is moved in place when `move`,
+        otherwise hard-linked (copied across filesystems) and left where
+        it is; either way it is hashed by streaming from disk
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_SIZE), b''):
+                digest.update(chunk)
+        os.makedirs(self.path(BLOB_PREFIX), exist_ok=True)
+        if move:
+            temp_path = path
+        else:
+            temp_path = os.path.join(self.path(BLOB_PREFIX), f'{uuid.uuid4().hex}.part')
+            try:
+                os.link(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+        return self._store(temp_path, digest.hexdigest(), _extension(path))
+
+    def delete(self, name):
+        """Blobs still referenced are kept: FieldFile.delete() must not pull a shared file"""
+        from .models import StoredBlob
+        if is_blob(name) and StoredBlob.objects.filter(name=name, ref_count__gt=0).exists():
+            return
+        super().delete(name)
+
+    def discard(self, name):
+        """
+        Delete the file of a blob whose StoredBlob row was just collected,
+        unless it was stored within BLOB_COLLECT_GRACE or counted again
+        since. Returns True if deleted
+        """
+        from .models import StoredBlob
+        path = self.path(name)
+        # Move it aside first, so a _store() that reuses it either touches it
+        # before (seen in its mtime below) or finds it gone and rewrites it
+        doomed = f'{path}.{uuid.uuid4().hex}.collect'
+        try:
+            os.rename(path, doomed)
+        except FileNotFoundError:
+            return False
+        grace = getattr(settings, 'BLOB_COLLECT_GRACE', 60)
+        if (time.time() - os.stat(doomed).st_mtime < grace
+                or StoredBlob.objects.filter(name=name, ref_count__gt=0).exists()):
+            try:
+                os.link(doomed, path)
+            except FileExistsError:
+                pass  # rewritten meanwhile by a _store() that found it gone
+            os.remove(doomed)
+            return False
+        os.remove(doomed)
+        return True
+
+
+blob_storage = BlobStorage()
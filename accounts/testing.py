@@ -0,0 +1,39 @@
+"""
+TEST HELPERS - Query budget assertions for view tests
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetTestMixin:
+    """
+    Mix into a TestCase to assert upper bounds on SQL queries, e.g.
+
+        with self.assertMaxQueries(5):
+            self.client.get('/dashboard/admin/')
+
+        self.assertWithinQueryBudget('admin_dashboard', '/dashboard/admin/')
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, limit, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as captured:
+            yield captured
+        executed = len(captured)
+        if executed > limit:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(captured.captured_queries, start=1)
+            )
+            self.fail(f'{executed} queries executed, {limit} allowed\nCaptured queries were:\n{queries}')
+
+    def assertWithinQueryBudget(self, view_name, url, **extra):
+        """GET url and check it stays within settings.QUERY_BUDGETS[view_name]"""
+        budget = settings.QUERY_BUDGETS[view_name]
+        with self.assertMaxQueries(budget):
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resolver_match.view_name, view_name)
+        return response
@@ -5,11 +5,45 @@ This file contains all test cases for the LeaveFlow application.
 Run tests with: python manage.py test accounts
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, RequestFactory, override_settings
+from django.utils import timezone
+from django.core.management import call_command
+from io import StringIO
+from django.db import connection, OperationalError
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import LeaveType, LeaveRequest, LeaveBalance, ChatMessage
+from asgiref.sync import async_to_sync, sync_to_async
+from unittest.mock import patch
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.template import engines
+from django.template.backends.django import Template as DjangoTemplate
+from . import (
+    absences, attachments, dashboard_cache, pubsub, realtime, serializers, services, storage, uploads, workdays
+)
+from .middleware import QueryBudgetExceeded, TimedTemplate
+from .pagination import keyset_paginate
+from .testing import QueryBudgetTestMixin
+from .models import (
+    LeaveType, LeaveRequest, LeaveBalance, LeaveBalanceLedger, ChatMessage, ChatUpload, UnreadCounter, DashboardStats,
+    HolidayCalendar, Holiday, LeaveRollup, StoredBlob, Conversation
+)
 from datetime import date, timedelta
+from django.db.migrations.executor import MigrationExecutor
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
 
 User = get_user_model()
 
@@ -414,3 +448,2405 @@ class DatabaseIntegrityTests(TestCase):
                 total_days=10,
                 used_days=0
             )
+
+
+class ChatPushStreamTests(TestCase):
+    """Test cases for push delivery of chat messages"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.manager = User.objects.create_user(
+            email='manager@test.com',
+            password='testpass123',
+            role='manager'
+        )
+        self.employee = User.objects.create_user(
+            email='employee@test.com',
+            password='testpass123',
+            role='employee',
+            manager=self.manager
+        )
+    
+    def test_stream_requires_login(self):
+        """Test anonymous users cannot open the stream"""
+        response = self.client.get('/chat/stream/')
+        self.assertEqual(response.status_code, 401)
+    
+    def test_stream_falls_back_under_wsgi(self):
+        """Test WSGI requests get 204 so the browser falls back to polling"""
+        self.client.force_login(self.employee)
+        response = self.client.get('/chat/stream/')
+        self.assertEqual(response.status_code, 204)
+    
+    def test_hub_delivers_to_subscriber(self):
+        """Test published events reach subscribers of the same channel only"""
+        hub = pubsub.LocalHub()
+        
+        async def scenario():
+            async with hub.subscribe('user.1') as sub:
+                self.assertEqual(hub.publish('user.2', {'type': 'message'}), 0)
+                self.assertEqual(hub.publish('user.1', {'type': 'message', 'message': {'id': 7}}), 1)
+                return await sub.get(timeout=1)
+        
+        event = async_to_sync(scenario)()
+        self.assertEqual(event['message']['id'], 7)
+        self.assertEqual(hub.subscriber_count('user.1'), 0)
+    
+    def test_send_message_pushes_to_receiver_stream(self):
+        """Test send_message publishes the committed message to the receiver"""
+        self.client.force_login(self.employee)
+        
+        async def scenario():
+            async with pubsub.subscribe(realtime.user_channel(self.manager.id)) as sub:
+                await sync_to_async(self.client.post)(
+                    '/chat/send/',
+                    data=json.dumps({'receiver_id': self.manager.id, 'message': 'Hi'}),
+                    content_type='application/json'
+                )
+                return await sub.get(timeout=1)
+        
+        with patch('accounts.views.transaction.on_commit', side_effect=lambda fn: fn()):
+            event = async_to_sync(scenario)()
+        
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['message']['message'], 'Hi')
+        self.assertFalse(event['message']['is_mine'])
+    
+    def test_stream_delivers_events_under_asgi(self):
+        """Test the ASGI stream emits published messages as SSE events"""
+        client = AsyncClient()
+        client.force_login(self.manager)
+        
+        async def scenario():
+            response = await client.get('/chat/stream/')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = response.streaming_content.__aiter__()
+            self.assertEqual(await chunks.__anext__(), b'retry: 3000\n\n')
+            realtime.publish_message(self.manager.id, {'id': 42, 'message': 'Hello'})
+            event = await chunks.__anext__()
+            await chunks.aclose()
+            return event
+        
+        event = async_to_sync(scenario)()
+        self.assertIn(b'id: 42', event)
+        self.assertIn(b'"Hello"', event)
+    
+    def test_sse_encoding(self):
+        """Test events are encoded in text/event-stream format"""
+        payload = realtime.format_sse({'type': 'message', 'message': {'id': 3}}).decode()
+        self.assertTrue(payload.startswith('id: 3\nevent: message\ndata: '))
+        self.assertTrue(payload.endswith('\n\n'))
+
+
+class ChatBusBackendTests(TransactionTestCase):
+    """Test cases for the pluggable chat fan-out bus (NOTIFY needs real commits)"""
+    
+    def deliver(self, publisher, subscriber, channel='user.1'):
+        async def scenario():
+            async with subscriber.subscribe(channel) as sub:
+                publisher.publish(channel, {'type': 'message', 'message': {'id': 1}})
+                return await sub.get(timeout=3)
+        return async_to_sync(scenario)()
+    
+    def test_in_process_backend(self):
+        """Test in-process backend delivers within the same process"""
+        backend = pubsub.InProcessBackend()
+        self.assertEqual(self.deliver(backend, backend)['message']['id'], 1)
+    
+    def test_sqlite_backend_crosses_instances(self):
+        """Test SQLite backend delivers between independent bus instances (workers)"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bus.sqlite3')
+            worker_a = pubsub.SQLiteBackend(path=path, poll_interval=0.01)
+            worker_b = pubsub.SQLiteBackend(path=path, poll_interval=0.01)
+            try:
+                event = self.deliver(worker_a, worker_b)
+                self.assertEqual(worker_a.publish('user.2', {'type': 'resync'}), 1)
+            finally:
+                worker_a.close()
+                worker_b.close()
+        self.assertEqual(event['message']['id'], 1)
+    
+    def test_listener_starts_off_the_event_loop(self):
+        """Test the first subscribe waits for a slow listener without blocking the event loop"""
+        class SlowBackend(pubsub.ListenerBackend):
+            def listen(self, ready):
+                time.sleep(0.3)  # e.g. connecting to the database
+                ready.set()
+                self._stop.wait()
+        
+        backend = SlowBackend()
+        self.addCleanup(backend.close)
+        
+        async def scenario():
+            ticks = 0
+            
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+            
+            ticker = asyncio.ensure_future(tick())
+            async with backend.subscribe('user.1'):
+                self.assertTrue(backend.is_listening())
+            ticker.cancel()
+            return ticks
+        
+        self.assertGreater(async_to_sync(scenario)(), 10)
+    
+    @skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY requires PostgreSQL')
+    def test_postgres_backend_crosses_instances(self):
+        """Test Postgres backend delivers between independent bus instances"""
+        worker_a = pubsub.PostgresBackend(channel='leaveflow_bus_test')
+        worker_b = pubsub.PostgresBackend(channel='leaveflow_bus_test')
+        try:
+            event = self.deliver(worker_a, worker_b)
+        finally:
+            worker_b.close()
+        self.assertEqual(event['message']['id'], 1)
+    
+    @override_settings(CHAT_BUS={'BACKEND': 'accounts.pubsub.InProcessBackend'})
+    def test_backend_loaded_from_settings(self):
+        """Test the bus backend is built from settings.CHAT_BUS"""
+        with patch.object(pubsub, '_backend', None):
+            self.assertIsInstance(pubsub.get_backend(), pubsub.InProcessBackend)
+
+
+class ChatHistoryPaginationTests(TestCase):
+    """Test cases for cursor-paginated chat history"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.manager = User.objects.create_user(
+            email='manager@test.com',
+            password='testpass123',
+            role='manager'
+        )
+        self.employee = User.objects.create_user(
+            email='employee@test.com',
+            password='testpass123',
+            role='employee',
+            manager=self.manager
+        )
+        self.messages = [
+            ChatMessage.objects.create(
+                sender=self.employee if i % 2 else self.manager,
+                receiver=self.manager if i % 2 else self.employee,
+                message=f'Message {i}'
+            )
+            for i in range(7)
+        ]
+        self.client.force_login(self.employee)
+    
+    def test_first_page_returns_newest_messages(self):
+        """Test first page holds the newest messages in chronological order"""
+        response = self.client.get(f'/chat/messages/{self.manager.id}/?limit=3')
+        data = response.json()
+        self.assertEqual([m['message'] for m in data['messages']], ['Message 4', 'Message 5', 'Message 6'])
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['next_before_id'], self.messages[4].id)
+    
+    def test_before_id_walks_back_to_start(self):
+        """Test following next_before_id returns every message exactly once"""
+        url = f'/chat/messages/{self.manager.id}/?limit=3'
+        data = self.client.get(url).json()
+        seen = [m['id'] for m in data['messages']]
+        while data['has_more']:
+            data = self.client.get(f"{url}&before_id={data['next_before_id']}").json()
+            seen = [m['id'] for m in data['messages']] + seen
+        self.assertEqual(seen, [m.id for m in self.messages])
+    
+    def test_opening_chat_marks_messages_read(self):
+        """Test loading the first page marks received messages as read"""
+        self.client.get(f'/chat/messages/{self.manager.id}/?limit=1')
+        self.assertFalse(ChatMessage.objects.filter(receiver=self.employee, is_read=False).exists())
+    
+    def test_invalid_cursor_rejected(self):
+        """Test non-numeric pagination parameters return 400"""
+        response = self.client.get(f'/chat/messages/{self.manager.id}/?before_id=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Query-plan regression suite: runs EXPLAIN on the hot queries from
+    views.py over seeded data and fails on any full table scan
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        User.objects.bulk_create([
+            User(email=f'emp{i}@test.com', role='employee', manager=cls.manager if i % 3 == 0 else None)
+            for i in range(60)
+        ])
+        cls.employee = User.objects.get(email='emp0@test.com')
+        employees = list(User.objects.filter(role='employee'))
+        cls.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        # bulk_create skips the signal that files requests under the employee's manager
+        LeaveRequest.objects.bulk_create([
+            LeaveRequest(
+                employee=employees[i % len(employees)],
+                team_manager_id=employees[i % len(employees)].manager_id,
+                leave_type=cls.leave_type,
+                start_date=date(2025, 1, 1) + timedelta(days=i % 300),
+                end_date=date(2025, 1, 2) + timedelta(days=i % 300),
+                total_days=2,
+                reason='Seeded',
+                status=['pending', 'approved', 'rejected'][i % 3],
+            )
+            for i in range(600)
+        ])
+        LeaveBalance.objects.bulk_create([
+            LeaveBalance(employee=emp, leave_type=cls.leave_type, year=year, total_days=12)
+            for emp in employees for year in (2024, 2025)
+        ])
+        # bulk_create skips the signal that files messages under their conversation
+        conversations = {emp.pk: Conversation.objects.between(cls.manager, emp) for emp in employees}
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                sender=employees[i % len(employees)] if i % 2 else cls.manager,
+                receiver=cls.manager if i % 2 else employees[i % len(employees)],
+                conversation=conversations[employees[i % len(employees)].pk],
+                message=f'Seeded {i}',
+                is_read=i % 5 != 0,
+            )
+            for i in range(600)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def query_plan(self, queryset):
+        """Return (tables read in full, index names used) for this queryset"""
+        sql, params = queryset.query.sql_with_params()
+        scans, indexes = [], []
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny tables make sequential scans cheap; forbid them unless unavoidable
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                nodes = [cursor.fetchone()[0][0]['Plan']]
+                while nodes:
+                    node = nodes.pop()
+                    if node['Node Type'] == 'Seq Scan':
+                        scans.append(node['Relation Name'])
+                    if 'Index Name' in node:
+                        indexes.append(node['Index Name'])
+                    nodes.extend(node.get('Plans', []))
+                return scans, indexes
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            for detail in (row[-1] for row in cursor.fetchall()):
+                # "SCAN t" reads the whole table; "SCAN t USING INDEX i" walks an index in order
+                if detail.startswith('SCAN ') and ' USING ' not in detail:
+                    scans.append(detail.split()[1])
+                if ' INDEX ' in detail:
+                    indexes.append(detail.split(' INDEX ')[1].split()[0])
+        return scans, indexes
+    
+    def assertNoFullScan(self, queryset, index=None):
+        """
+        Fail on any full table scan. On SQLite, whose planner is rule based,
+        also check the composite index meant for this query is the one used.
+        """
+        scans, indexes = self.query_plan(queryset)
+        self.assertEqual(scans, [], str(queryset.query))
+        if index and connection.vendor == 'sqlite':
+            self.assertIn(index, indexes, str(queryset.query))
+    
+    def assertPageTwoSeeks(self, queryset, key_field, index):
+        """
+        Fail unless the second keyset page of `queryset` is read straight off
+        `index` in order: no sort step (SQLite: TEMP B-TREE, PostgreSQL: Sort)
+        """
+        first = keyset_paginate(RequestFactory().get('/'), queryset, key_field, per_page=5)
+        self.assertTrue(first.has_next)
+        with CaptureQueriesContext(connection) as captured:
+            keyset_paginate(RequestFactory().get('/?' + first.next_query), queryset, key_field, per_page=5)
+        sql = captured.captured_queries[-1]['sql']
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                self.assertNotIn('Sort', plan, sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                self.assertNotIn('TEMP B-TREE', plan, sql)
+                self.assertIn(f'INDEX {index} ', plan, sql)
+    
+    def test_admin_leaves_page_two(self):
+        """all_leaves (admin): a cursor page seeks (created_at, id)"""
+        self.assertPageTwoSeeks(LeaveRequest.objects.with_related(), 'created_at', 'leave_created_id_idx')
+    
+    def test_admin_leaves_by_status_page_two(self):
+        """all_leaves (admin) with status filter"""
+        self.assertPageTwoSeeks(
+            LeaveRequest.objects.with_related().filter(status='approved'), 'created_at', 'leave_status_created_id_idx'
+        )
+    
+    def test_manager_leaves_page_two(self):
+        """all_leaves / team_history (manager): a cursor page seeks the team's (created_at, id)"""
+        self.assertPageTwoSeeks(
+            LeaveRequest.objects.for_manager(self.manager).with_related(reason=True), 'created_at',
+            'leave_team_created_idx'
+        )
+    
+    def test_manager_leaves_by_status_page_two(self):
+        """team_history with status filter"""
+        self.assertPageTwoSeeks(
+            LeaveRequest.objects.for_manager(self.manager).with_related().filter(status='pending'), 'created_at',
+            'leave_team_status_created_idx'
+        )
+    
+    def test_employee_leaves_page_two(self):
+        """my_leaves: a cursor page seeks the employee's (created_at, id)"""
+        self.assertPageTwoSeeks(
+            LeaveRequest.objects.for_employee(self.employee).with_related(), 'created_at', 'leave_emp_created_id_idx'
+        )
+    
+    def test_users_page_two(self):
+        """all_users: a cursor page seeks (date_joined, id)"""
+        self.assertPageTwoSeeks(User.objects.select_related('manager'), 'date_joined', 'users_joined_id_idx')
+    
+    def test_team_absence_overlap(self):
+        """team_calendar / pending conflicts: team leaves overlapping a window"""
+        self.assertNoFullScan(
+            LeaveRequest.objects.for_manager(self.manager).filter(status__in=absences.ABSENCE_STATUSES)
+            .overlapping(date(2025, 6, 1), date(2025, 6, 30)).order_by(),
+            index='leave_team_dates_idx'
+        )
+    
+    def test_chat_unread_count(self):
+        """get_chat_users: unread badge count per contact"""
+        self.assertNoFullScan(ChatMessage.objects.filter(
+            sender=self.employee, receiver=self.manager, is_read=False
+        ).order_by(), index='chat_unread_idx')
+    
+    def test_chat_thread_page(self):
+        """get_messages: newest page of one conversation"""
+        conversation = Conversation.objects.between(self.manager, self.employee)
+        self.assertNoFullScan(ChatMessage.objects.filter(
+            conversation=conversation, id__lt=500
+        ).order_by('-id')[:51], index='chat_conversation_idx')
+    
+    def test_chat_conversation_lookup(self):
+        """get_messages / get_chat_users: the conversation of a pair of users"""
+        self.assertNoFullScan(Conversation.objects.for_pair(self.employee, self.manager))
+    
+    def test_chat_check_new(self):
+        """check_new_messages: messages after the last seen id"""
+        self.assertNoFullScan(ChatMessage.objects.filter(
+            sender=self.employee, receiver=self.manager, id__gt=100
+        ).order_by('created_at'), index='chat_thread_idx')
+    
+    def test_employee_leaves_by_status(self):
+        """employee_dashboard: pending/approved counts"""
+        self.assertNoFullScan(
+            LeaveRequest.objects.filter(employee=self.employee, status='pending'),
+            index='leave_emp_status_created_idx'
+        )
+    
+    def test_employee_recent_leaves(self):
+        """employee_dashboard / my_leaves: own leaves, newest first"""
+        self.assertNoFullScan(
+            LeaveRequest.objects.filter(employee=self.employee)[:10], index='leave_emp_created_id_idx'
+        )
+    
+    def test_manager_pending_queue(self):
+        """manager_dashboard: team pending requests"""
+        self.assertNoFullScan(
+            LeaveRequest.objects.for_manager(self.manager).filter(status='pending').order_by('-created_at'),
+            index='leave_team_status_created_idx'
+        )
+    
+    def test_manager_team_history(self):
+        """team_history / all_leaves for managers: team leaves, newest first"""
+        self.assertNoFullScan(
+            LeaveRequest.objects.for_manager(self.manager)[:10], index='leave_team_created_idx'
+        )
+    
+    def test_admin_recent_leaves(self):
+        """admin_dashboard / all_leaves: newest leaves company-wide"""
+        self.assertNoFullScan(LeaveRequest.objects.all()[:10], index='leave_created_id_idx')
+    
+    def test_admin_leaves_by_status(self):
+        """all_leaves with status filter"""
+        self.assertNoFullScan(
+            LeaveRequest.objects.filter(status='pending').order_by('-created_at')[:10],
+            index='leave_status_created_id_idx'
+        )
+    
+    def test_leave_balance_for_year(self):
+        """employee_dashboard: balances for the current year"""
+        self.assertNoFullScan(
+            LeaveBalance.objects.filter(employee=self.employee, year=2025), index='balance_emp_year_idx'
+        )
+
+
+class UnreadCounterTests(TestCase):
+    """Test cases for the denormalized unread message counters"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.manager = User.objects.create_user(
+            email='manager@test.com',
+            password='testpass123',
+            role='manager'
+        )
+        self.employee = User.objects.create_user(
+            email='employee@test.com',
+            password='testpass123',
+            role='employee',
+            manager=self.manager
+        )
+    
+    def send(self, sender, receiver, text):
+        self.client.force_login(sender)
+        self.client.post(
+            '/chat/send/',
+            data=json.dumps({'receiver_id': receiver.id, 'message': text}),
+            content_type='application/json'
+        )
+    
+    def unread_for(self, user, contact):
+        self.client.force_login(user)
+        users = self.client.get('/chat/users/').json()['users']
+        return next(u['unread'] for u in users if u['id'] == contact.id)
+    
+    def test_send_increments_counter(self):
+        """Test each sent message increments the receiver's counter"""
+        self.send(self.employee, self.manager, 'One')
+        self.send(self.employee, self.manager, 'Two')
+        self.assertEqual(self.unread_for(self.manager, self.employee), 2)
+    
+    def test_opening_chat_resets_counter(self):
+        """Test get_messages clears the counter along with is_read"""
+        self.send(self.employee, self.manager, 'One')
+        self.client.force_login(self.manager)
+        self.client.get(f'/chat/messages/{self.employee.id}/')
+        self.assertEqual(self.unread_for(self.manager, self.employee), 0)
+    
+    def test_opening_chat_keeps_messages_it_did_not_mark(self):
+        """Test get_messages subtracts what it marked, so a send counted meanwhile survives"""
+        self.send(self.employee, self.manager, 'One')
+        # A send whose counter increment lands before its row is visible to the UPDATE
+        UnreadCounter.objects.increment(sender=self.employee, receiver=self.manager)
+        self.client.force_login(self.manager)
+        self.client.get(f'/chat/messages/{self.employee.id}/')
+        self.assertEqual(self.unread_for(self.manager, self.employee), 1)
+    
+    def test_check_new_decrements_counter(self):
+        """Test check_new_messages subtracts only the messages it marks read"""
+        self.send(self.employee, self.manager, 'One')
+        first = ChatMessage.objects.get()
+        self.send(self.employee, self.manager, 'Two')
+        self.client.force_login(self.manager)
+        self.client.get(f'/chat/check/{self.employee.id}/?last_id={first.id}')
+        self.assertEqual(self.unread_for(self.manager, self.employee), 1)
+    
+    def test_chat_users_query_count_is_constant(self):
+        """Test the contact list costs the same number of queries for any contact count"""
+        self.client.force_login(self.employee)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/chat/users/')
+        for i in range(5):
+            manager = User.objects.create_user(email=f'm{i}@test.com', role='manager')
+            UnreadCounter.objects.increment(sender=manager, receiver=self.employee)
+        with CaptureQueriesContext(connection) as many:
+            users = self.client.get('/chat/users/').json()['users']
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(sum(u['unread'] for u in users), 5)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Test cases keeping dashboards and list views within their query budgets"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@test.com', role='admin', is_staff=True)
+        cls.manager = User.objects.create_user(email='manager@test.com', full_name='Manager', role='manager')
+        leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        cls.employees = []
+        for i in range(5):
+            employee = User.objects.create_user(
+                email=f'employee{i}@test.com',
+                full_name=f'Employee {i}',
+                role='employee',
+                manager=cls.manager
+            )
+            cls.employees.append(employee)  # balances are provisioned on creation
+            for status in ['pending', 'approved']:
+                LeaveRequest.objects.create(
+                    employee=employee,
+                    leave_type=leave_type,
+                    start_date=date.today(),
+                    end_date=date.today() + timedelta(days=1),
+                    total_days=2,
+                    reason='Budget test',
+                    status=status,
+                    approved_by=cls.manager if status == 'approved' else None
+                )
+    
+    def setUp(self):
+        # Measure the cold path, not a cached dashboard
+        cache.clear()
+    
+    def test_admin_views_within_budget(self):
+        """Test admin dashboard and lists stay within budget"""
+        self.client.force_login(self.admin)
+        self.assertWithinQueryBudget('admin_dashboard', '/dashboard/admin/')
+        self.assertWithinQueryBudget('all_leaves', '/leaves/all/')
+        self.assertWithinQueryBudget('all_users', '/dashboard/users/')
+    
+    def test_manager_views_within_budget(self):
+        """Test manager dashboard and lists stay within budget"""
+        self.client.force_login(self.manager)
+        self.assertWithinQueryBudget('manager_dashboard', '/dashboard/manager/')
+        self.assertWithinQueryBudget('all_leaves', '/leaves/all/?status=pending')
+        self.assertWithinQueryBudget('team_history', '/leaves/history/')
+    
+    def test_employee_views_within_budget(self):
+        """Test employee dashboard and lists stay within budget"""
+        self.client.force_login(self.employees[0])
+        self.assertWithinQueryBudget('employee_dashboard', '/dashboard/employee/')
+        self.assertWithinQueryBudget('my_leaves', '/leaves/my-leaves/')
+    
+    def test_with_related_loads_rows_in_one_query(self):
+        """Test listing rows and their employee/type/approver come from a single query"""
+        with self.assertNumQueries(1):
+            rows = [
+                (leave.employee.full_name, leave.leave_type.name, leave.approved_by and leave.approved_by.email)
+                for leave in LeaveRequest.objects.for_manager(self.manager).with_related()
+            ]
+        self.assertEqual(len(rows), 10)
+    
+    @override_settings(QUERY_INSTRUMENTATION=True)
+    def test_instrumentation_headers_and_log(self):
+        """Test the middleware reports queries and timings per view"""
+        self.client.force_login(self.employees[0])
+        with self.assertLogs('accounts.perf', level='INFO') as logs:
+            response = self.client.get('/leaves/my-leaves/')
+        self.assertEqual(response['X-View-Name'], 'my_leaves')
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('X-DB-Time-Ms', response)
+        self.assertGreater(float(response['X-Template-Time-Ms']), 0)
+        self.assertIn('view=my_leaves', logs.output[0])
+    
+    @override_settings(QUERY_INSTRUMENTATION=True)
+    def test_template_timing_comes_from_the_backend(self):
+        """Test template time is measured by the configured backend, not a patched Template.render"""
+        self.client.force_login(self.employees[0])
+        with self.assertLogs('accounts.perf', level='INFO'):
+            self.client.get('/leaves/my-leaves/')
+        self.assertEqual(DjangoTemplate.render.__module__, 'django.template.backends.django')
+        self.assertIsInstance(engines['django'].from_string('{{ x }}'), TimedTemplate)
+    
+    @override_settings(QUERY_INSTRUMENTATION=True, QUERY_BUDGET_STRICT=True, QUERY_BUDGETS={'my_leaves': 1})
+    def test_strict_budget_raises(self):
+        """Test strict mode turns a blown budget into an error"""
+        self.client.force_login(self.employees[0])
+        with self.assertLogs('accounts.perf', level='INFO'):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/leaves/my-leaves/')
+
+
+class KeysetPaginationTests(TestCase):
+    """Test cases for keyset pagination of leave and user listings"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        cls.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=cls.manager)
+        leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        cls.leaves = LeaveRequest.objects.bulk_create([
+            LeaveRequest(
+                employee=cls.employee,
+                team_manager=cls.manager,
+                leave_type=leave_type,
+                start_date=date.today(),
+                end_date=date.today(),
+                total_days=1,
+                reason='Paging',
+                status='pending' if i % 2 else 'approved',
+            )
+            for i in range(30)
+        ])
+        # Several rows share a timestamp to exercise the id tie-breaker
+        base = timezone.now()
+        for i, leave in enumerate(cls.leaves):
+            LeaveRequest.objects.filter(id=leave.id).update(created_at=base - timedelta(hours=i // 3))
+        cls.expected = list(
+            LeaveRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+    
+    def page(self, query=''):
+        request = RequestFactory().get(f'/leaves/all/?{query}')
+        return keyset_paginate(request, LeaveRequest.objects.all(), 'created_at', per_page=7)
+    
+    def test_next_cursors_visit_every_row_once(self):
+        """Test following next cursors returns every row exactly once, in order"""
+        page = self.page()
+        seen = [leave.id for leave in page]
+        while page.has_next:
+            page = self.page(page.next_query)
+            seen += [leave.id for leave in page]
+        self.assertEqual(seen, self.expected)
+    
+    def test_previous_cursor_returns_same_page(self):
+        """Test stepping forward then back returns the original page"""
+        first = self.page()
+        second = self.page(first.next_query)
+        third = self.page(second.next_query)
+        back = self.page(third.previous_query)
+        self.assertEqual([l.id for l in back], [l.id for l in second])
+        self.assertTrue(back.has_previous)
+        self.assertFalse(self.page(second.previous_query).has_previous)
+    
+    def test_cursor_keeps_other_filters(self):
+        """Test next/previous links carry the status filter along"""
+        page = self.page('status=pending')
+        self.assertIn('status=pending', page.next_query)
+        self.assertNotIn('before=', page.next_query)
+    
+    def test_team_listing_follows_the_employees_manager(self):
+        """Test new requests are filed under the manager, and move with the employee"""
+        leave = LeaveRequest.objects.create(
+            employee=User.objects.get(pk=self.employee.pk), leave_type=LeaveType.objects.get(),
+            start_date=date.today(), end_date=date.today(), total_days=1, reason='Team'
+        )
+        self.assertEqual(leave.team_manager_id, self.manager.id)
+        other = User.objects.create_user(email='other@test.com', role='manager')
+        employee = User.objects.get(pk=self.employee.pk)
+        employee.manager = other
+        employee.save()
+        self.assertFalse(LeaveRequest.objects.for_manager(self.manager).exists())
+        self.assertEqual(LeaveRequest.objects.for_manager(other).count(), 31)
+    
+    def test_malformed_cursor_shows_first_page(self):
+        """Test a garbage cursor falls back to the first page"""
+        self.assertEqual([l.id for l in self.page('after=garbage')], self.expected[:7])
+    
+    def test_views_paginate_with_status_filter(self):
+        """Test all_leaves pages the filtered list and links the next page"""
+        self.client.force_login(self.manager)
+        response = self.client.get('/leaves/all/?status=pending')
+        page = response.context['page']
+        self.assertEqual(len(page), 15)
+        self.assertFalse(page.has_next)
+        response = self.client.get('/leaves/all/')
+        self.assertEqual(len(response.context['leaves']), 25)
+        self.assertContains(response, 'Older')
+
+
+class DashboardStatsTests(TestCase):
+    """Test cases for the materialized admin dashboard statistics"""
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=self.manager)
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+    
+    def create_leave(self, status='pending'):
+        return LeaveRequest.objects.create(
+            employee=self.employee,
+            leave_type=self.leave_type,
+            start_date=date.today(),
+            end_date=date.today(),
+            total_days=1,
+            reason='Stats',
+            status=status
+        )
+    
+    def assertStatsMatchRecount(self):
+        stats = DashboardStats.objects.get(pk=1)
+        fresh = DashboardStats.objects.rebuild()
+        for field in ['total_users', 'total_admins', 'total_managers', 'total_employees', 'pending_leaves']:
+            self.assertEqual(getattr(stats, field), getattr(fresh, field), field)
+        return fresh
+    
+    def test_user_changes_update_totals(self):
+        """Test creating, re-roling and deleting users keeps totals exact"""
+        User.objects.create_user(email='admin@test.com', role='admin')
+        self.employee.role = 'manager'
+        self.employee.save()
+        self.manager.delete()
+        stats = self.assertStatsMatchRecount()
+        self.assertEqual((stats.total_users, stats.total_managers, stats.total_employees), (2, 1, 0))
+    
+    def test_leave_status_changes_update_pending(self):
+        """Test pending count follows creation, approval and cancellation"""
+        first = self.create_leave()
+        second = self.create_leave()
+        self.create_leave(status='approved')
+        first.status = 'approved'
+        first.save()
+        second.delete()
+        self.assertEqual(self.assertStatsMatchRecount().pending_leaves, 0)
+    
+    def test_cascade_delete_updates_pending(self):
+        """Test deleting an employee removes their pending leaves from the count"""
+        self.create_leave()
+        self.employee.delete()
+        self.assertEqual(self.assertStatsMatchRecount().pending_leaves, 0)
+    
+    def test_admin_dashboard_reads_stats_row(self):
+        """Test the dashboard shows the materialized numbers"""
+        admin = User.objects.create_user(email='admin@test.com', role='admin')
+        self.create_leave()
+        self.client.force_login(admin)
+        response = self.client.get('/dashboard/admin/')
+        self.assertEqual(response.context['total_users'], 3)
+        self.assertEqual(response.context['pending_leaves'], 1)
+    
+    def test_rebuild_command(self):
+        """Test the management command recounts from scratch"""
+        DashboardStats.objects.filter(pk=1).update(total_users=99, pending_leaves=42)
+        call_command('rebuild_dashboard_stats', stdout=StringIO())
+        stats = DashboardStats.objects.get(pk=1)
+        self.assertEqual((stats.total_users, stats.pending_leaves), (2, 0))
+
+
+class DashboardCacheTests(TestCase):
+    """Test cases for the per-user manager/employee dashboard cache"""
+    
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create_user(email='manager@test.com', full_name='Manager', role='manager')
+        self.employee = User.objects.create_user(
+            email='employee@test.com', full_name='Employee', role='employee', manager=self.manager
+        )
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.balance = LeaveBalance.objects.create(
+            employee=self.employee, leave_type=self.leave_type, year=date.today().year, total_days=12
+        )
+    
+    def create_leave(self):
+        return LeaveRequest.objects.create(
+            employee=self.employee,
+            leave_type=self.leave_type,
+            start_date=date.today(),
+            end_date=date.today(),
+            total_days=1,
+            reason='Cache',
+        )
+    
+    def get_dashboard(self, user):
+        self.client.force_login(user)
+        url = '/dashboard/manager/' if user.role == 'manager' else '/dashboard/employee/'
+        return self.client.get(url)
+    
+    def test_repeat_visit_is_served_from_cache(self):
+        """Test the second visit skips the dashboard queries and counts a hit"""
+        self.create_leave()
+        self.client.force_login(self.manager)
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get('/dashboard/manager/')
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get('/dashboard/manager/')
+        self.assertLess(len(warm), len(cold))
+        self.assertEqual(response.context['pending_count'], 1)
+        self.assertEqual(dashboard_cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+    
+    def test_leave_changes_invalidate_employee_and_manager(self):
+        """Test a new or updated leave refreshes both affected dashboards"""
+        self.get_dashboard(self.employee)
+        self.get_dashboard(self.manager)
+        leave = self.create_leave()
+        self.assertEqual(self.get_dashboard(self.employee).context['pending_count'], 1)
+        self.assertEqual(self.get_dashboard(self.manager).context['pending_count'], 1)
+        leave.status = 'approved'
+        leave.save()
+        self.assertEqual(self.get_dashboard(self.employee).context['approved_count'], 1)
+        self.assertEqual(self.get_dashboard(self.manager).context['pending_count'], 0)
+    
+    def test_balance_change_invalidates_employee(self):
+        """Test a balance update shows on the next employee visit"""
+        self.get_dashboard(self.employee)
+        self.balance.used_days = 3
+        self.balance.save()
+        balances = self.get_dashboard(self.employee).context['leave_balances']
+        self.assertEqual(balances[0].remaining_days, 9)
+    
+    def test_team_membership_invalidates_old_and_new_manager(self):
+        """Test moving an employee refreshes both managers' team lists"""
+        other = User.objects.create_user(email='other@test.com', role='manager')
+        self.get_dashboard(self.manager)
+        self.get_dashboard(other)
+        self.employee.manager = other
+        self.employee.save()
+        self.assertEqual(self.get_dashboard(self.manager).context['team_count'], 0)
+        self.assertEqual(self.get_dashboard(other).context['team_count'], 1)
+    
+    def test_cached_team_has_no_password_hashes(self):
+        """Test the cached manager context keeps team members as plain display rows"""
+        response = self.get_dashboard(self.manager)
+        self.assertEqual(response.context['team_members'], [{
+            'id': self.employee.id, 'full_name': 'Employee', 'email': 'employee@test.com',
+            'role': 'employee', 'role_display': 'Employee',
+        }])
+        self.assertContains(response, 'employee@test.com')
+        self.assertNotIn(self.employee.password, str(response.context['team_members']))
+    
+    def test_unrelated_user_save_keeps_cache(self):
+        """Test saves like last_login on every login leave the manager's cache alone"""
+        self.get_dashboard(self.manager)
+        self.employee.last_login = timezone.now()
+        self.employee.save()
+        self.get_dashboard(self.manager)
+        self.assertEqual(dashboard_cache.stats()['hits'], 1)
+    
+    def test_stats_command(self):
+        """Test the stats command prints and resets the counters"""
+        self.get_dashboard(self.employee)
+        out = StringIO()
+        call_command('dashboard_cache_stats', '--reset', stdout=out)
+        self.assertIn('0 hits, 1 misses', out.getvalue())
+        self.assertEqual(dashboard_cache.stats()['misses'], 0)
+
+
+class LeaveApprovalTests(TestCase):
+    """Test cases for the transactional approve/reject flow and balance ledger"""
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(
+            email='employee@test.com', full_name='Employee', role='employee', manager=self.manager
+        )
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.balance = LeaveBalance.objects.create(
+            employee=self.employee, leave_type=self.leave_type, year=timezone.now().year, total_days=12
+        )
+        self.leave = LeaveRequest.objects.create(
+            employee=self.employee,
+            leave_type=self.leave_type,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=2),
+            total_days=3,
+            reason='Trip'
+        )
+    
+    def test_approve_charges_balance_and_writes_ledger(self):
+        """Test approval moves status, balance and ledger together"""
+        self.assertTrue(services.decide_leave(self.leave, self.manager, approve=True))
+        self.leave.refresh_from_db()
+        self.balance.refresh_from_db()
+        self.assertEqual((self.leave.status, self.leave.approved_by), ('approved', self.manager))
+        self.assertEqual(self.balance.used_days, 3)
+        entry = LeaveBalanceLedger.objects.get()
+        self.assertEqual((entry.balance, entry.leave_request, entry.days), (self.balance, self.leave, 3))
+        self.assertEqual(DashboardStats.objects.current().pending_leaves, 0)
+    
+    def test_second_decision_is_refused(self):
+        """Test a request cannot be approved twice or rejected after approval"""
+        stale = LeaveRequest.objects.get(pk=self.leave.pk)
+        self.assertTrue(services.decide_leave(self.leave, self.manager, approve=True))
+        self.assertFalse(services.decide_leave(stale, self.manager, approve=True))
+        self.assertFalse(services.decide_leave(stale, self.manager, approve=False))
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.used_days, 3)
+        self.assertEqual(LeaveBalanceLedger.objects.count(), 1)
+    
+    def test_reject_leaves_balance_alone(self):
+        """Test rejection does not touch the balance"""
+        self.assertTrue(services.decide_leave(self.leave, self.manager, approve=False))
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.used_days, 0)
+        self.assertFalse(LeaveBalanceLedger.objects.exists())
+    
+    def test_ledger_is_append_only(self):
+        """Test saved ledger entries cannot be edited"""
+        services.decide_leave(self.leave, self.manager, approve=True)
+        entry = LeaveBalanceLedger.objects.get()
+        entry.days = 0
+        with self.assertRaises(ValueError):
+            entry.save()
+    
+    def test_double_submitted_form(self):
+        """Test posting approve twice only charges once"""
+        self.client.force_login(self.manager)
+        url = reverse('approve_leave', args=[self.leave.id])
+        self.client.post(url, {'action': 'approve'})
+        response = self.client.post(url, {'action': 'approve'}, follow=True)
+        self.assertContains(response, 'already been processed')
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.used_days, 3)
+    
+    def test_cancel_after_approval_is_refused(self):
+        """Test an employee cannot cancel a request approved meanwhile"""
+        services.decide_leave(self.leave, self.manager, approve=True)
+        self.client.force_login(self.employee)
+        self.client.post(reverse('cancel_leave', args=[self.leave.id]))
+        self.assertTrue(LeaveRequest.objects.filter(pk=self.leave.pk).exists())
+
+
+class LeaveApprovalStressTests(TransactionTestCase):
+    """Parallel approvals from several threads (needs real commits between threads)"""
+    
+    THREADS = 8
+    REQUESTS = 40
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        leave_type = LeaveType.objects.create(name='Casual Leave', default_days=100)
+        self.balances = []
+        self.leaves = []
+        for i in range(4):
+            employee = User.objects.create_user(
+                email=f'employee{i}@test.com', role='employee', manager=self.manager
+            )
+            self.balances.append(LeaveBalance.objects.get(employee=employee, year=timezone.now().year))
+            for j in range(self.REQUESTS // 4):
+                self.leaves.append(LeaveRequest.objects.create(
+                    employee=employee,
+                    leave_type=leave_type,
+                    start_date=date.today(),
+                    end_date=date.today(),
+                    total_days=j % 3 + 1,
+                    reason='Stress'
+                ))
+    
+    def test_parallel_approvals_keep_balances_exact(self):
+        """Test each request is charged exactly once under parallel approvals"""
+        from .management.commands.benchmark_approvals import race_approvals
+        race = race_approvals(self.leaves, self.manager, self.THREADS)
+        
+        self.assertEqual(race.errors, [])
+        self.assertEqual(race.approved, self.REQUESTS)
+        self.assertEqual(len(race.results), self.REQUESTS * self.THREADS)
+        self.assertEqual(LeaveBalanceLedger.objects.count(), self.REQUESTS)
+        for balance in self.balances:
+            balance.refresh_from_db()
+            expected = sum(leave.total_days for leave in self.leaves if leave.employee_id == balance.employee_id)
+            self.assertEqual(balance.used_days, expected)
+        self.assertEqual(DashboardStats.objects.current().pending_leaves, 0)
+    
+    def test_benchmark_command(self):
+        """Test the benchmark reports throughput and removes what it seeded"""
+        out = StringIO()
+        call_command('benchmark_approvals', threads=3, requests=9, employees=2, stdout=out)
+        self.assertIn('approvals/s', out.getvalue())
+        self.assertIn('Approved 9 requests exactly once', out.getvalue())
+        self.assertFalse(User.objects.filter(email__startswith='benchmark-approvals-').exists())
+        self.assertEqual(LeaveType.objects.count(), 1)
+        self.assertEqual(DashboardStats.objects.current().pending_leaves, self.REQUESTS)
+
+
+class BulkDecisionTests(QueryBudgetTestMixin, TestCase):
+    """Test cases for bulk approve/reject of the manager's pending queue"""
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.employees = [
+            User.objects.create_user(email=f'employee{i}@test.com', role='employee', manager=self.manager)
+            for i in range(3)
+        ]  # balances are provisioned on creation
+        self.client.force_login(self.manager)
+    
+    def create_leaves(self, count, employee=None, total_days=2):
+        return [
+            LeaveRequest.objects.create(
+                employee=employee or self.employees[i % len(self.employees)],
+                leave_type=self.leave_type,
+                start_date=date.today(),
+                end_date=date.today() + timedelta(days=total_days - 1),
+                total_days=total_days,
+                reason='Bulk'
+            )
+            for i in range(count)
+        ]
+    
+    def post(self, leaves, action='approve'):
+        return self.client.post(
+            reverse('bulk_decide_leaves'),
+            {'action': action, 'leave_ids': [leave.id for leave in leaves]},
+            HTTP_ACCEPT='application/json'
+        )
+    
+    def test_bulk_approve_charges_balances(self):
+        """Test every selected request is approved and charged once"""
+        leaves = self.create_leaves(6)
+        summary = self.post(leaves).json()
+        self.assertEqual(summary['decided'], sorted(leave.id for leave in leaves))
+        self.assertEqual(summary['days_charged'], 12)
+        self.assertEqual(LeaveRequest.objects.filter(status='approved', approved_by=self.manager).count(), 6)
+        self.assertEqual(
+            sorted(LeaveBalance.objects.values_list('used_days', flat=True)), [4, 4, 4]
+        )
+        self.assertEqual(LeaveBalanceLedger.objects.count(), 6)
+        self.assertEqual(DashboardStats.objects.current().pending_leaves, 0)
+    
+    def test_query_count_does_not_grow_with_batch(self):
+        """Test 3 and 30 requests take the same number of queries"""
+        small_batch, large_batch = self.create_leaves(3), self.create_leaves(30)
+        with CaptureQueriesContext(connection) as small:
+            self.post(small_batch)
+        with CaptureQueriesContext(connection) as large:
+            self.post(large_batch)
+        self.assertEqual(len(small), len(large))
+    
+    def test_other_teams_and_decided_requests_are_skipped(self):
+        """Test foreign and already decided ids are reported, not touched"""
+        other_manager = User.objects.create_user(email='other@test.com', role='manager')
+        outsider = User.objects.create_user(email='outsider@test.com', role='employee', manager=other_manager)
+        foreign = self.create_leaves(1, employee=outsider)
+        decided = self.create_leaves(1)
+        services.decide_leave(decided[0], self.manager, approve=False)
+        pending = self.create_leaves(2)
+        summary = self.post(foreign + decided + pending).json()
+        self.assertEqual(summary['not_found'], [foreign[0].id])
+        self.assertEqual(summary['not_pending'], [decided[0].id])
+        self.assertEqual(len(summary['decided']), 2)
+        self.assertEqual(LeaveRequest.objects.get(pk=foreign[0].pk).status, 'pending')
+    
+    def test_bulk_reject_keeps_balances(self):
+        """Test rejecting in bulk leaves balances alone"""
+        self.post(self.create_leaves(3), action='reject')
+        self.assertEqual(LeaveRequest.objects.filter(status='rejected').count(), 3)
+        self.assertFalse(LeaveBalance.objects.exclude(used_days=0).exists())
+    
+    def test_form_post_redirects_with_summary(self):
+        """Test the dashboard form gets a flash message and a redirect"""
+        leaves = self.create_leaves(2)
+        response = self.client.post(
+            reverse('bulk_decide_leaves'), {'action': 'approve', 'leave_ids': [leave.id for leave in leaves]},
+            follow=True
+        )
+        self.assertRedirects(response, reverse('manager_dashboard'))
+        self.assertContains(response, '2 leave request(s) approved.')
+    
+    def test_rejects_bad_input_and_non_managers(self):
+        """Test invalid ids, missing action and non-managers are refused"""
+        self.assertEqual(self.client.post(
+            reverse('bulk_decide_leaves'), {'action': 'approve', 'leave_ids': ['x']}, HTTP_ACCEPT='application/json'
+        ).status_code, 400)
+        self.assertEqual(self.post(self.create_leaves(1), action='delete').status_code, 400)
+        self.client.force_login(self.employees[0])
+        self.assertEqual(self.post(self.create_leaves(1)).status_code, 403)
+    
+    def test_conflict_rolls_back_batch(self):
+        """Test a request decided mid-batch aborts the whole batch"""
+        leaves = self.create_leaves(3)
+        queryset_class = type(LeaveRequest.objects.all())
+        original_update = queryset_class.update
+        raced = []
+        
+        def racing_update(queryset, **kwargs):
+            if not raced:
+                # Simulate another manager deciding one request first
+                raced.append(True)
+                original_update(LeaveRequest.objects.filter(pk=leaves[0].pk), status='rejected')
+            return original_update(queryset, **kwargs)
+        
+        with patch.object(queryset_class, 'update', racing_update):
+            response = self.post(leaves)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(LeaveRequest.objects.filter(status='pending').count(), 3)
+
+
+class LeaveBalanceProvisioningTests(TestCase):
+    """Test cases for yearly leave balance provisioning"""
+    
+    def setUp(self):
+        self.casual = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.sick = LeaveType.objects.create(name='Sick Leave', default_days=10)
+    
+    def test_new_employee_gets_balances(self):
+        """Test creating an employee provisions this year's balances"""
+        employee = User.objects.create_user(email='employee@test.com', role='employee')
+        balances = dict(
+            LeaveBalance.objects.filter(employee=employee, year=timezone.now().year)
+            .values_list('leave_type__name', 'total_days')
+        )
+        self.assertEqual(balances, {'Casual Leave': 12, 'Sick Leave': 10})
+    
+    def test_managers_and_inactive_users_are_skipped(self):
+        """Test only active employees are provisioned"""
+        User.objects.create_user(email='manager@test.com', role='manager')
+        User.objects.create_user(email='gone@test.com', role='employee', is_active=False)
+        self.assertFalse(LeaveBalance.objects.exists())
+    
+    def test_command_provisions_in_chunks_and_is_idempotent(self):
+        """Test the command fills every missing row across chunks and keeps existing ones"""
+        for i in range(7):
+            User.objects.create_user(email=f'employee{i}@test.com', role='employee')
+        LeaveBalance.objects.all().delete()
+        kept = LeaveBalance.objects.create(
+            employee=User.objects.get(email='employee0@test.com'), leave_type=self.casual, year=2030,
+            total_days=20, used_days=4
+        )
+        out = StringIO()
+        call_command('provision_leave_balances', '--year', '2030', '--batch-size', '4', stdout=out)
+        self.assertIn('Provisioned 13 leave balances for 2030', out.getvalue())
+        self.assertEqual(LeaveBalance.objects.filter(year=2030).count(), 14)
+        kept.refresh_from_db()
+        self.assertEqual((kept.total_days, kept.used_days), (20, 4))
+        
+        out = StringIO()
+        call_command('provision_leave_balances', '--year', '2030', stdout=out)
+        self.assertIn('Provisioned 0 leave balances', out.getvalue())
+    
+    def test_query_count_is_per_chunk(self):
+        """Test provisioning issues one INSERT per chunk, not one per row"""
+        for i in range(10):
+            User.objects.create_user(email=f'employee{i}@test.com', role='employee')
+        with CaptureQueriesContext(connection) as captured:
+            services.provision_leave_balances(2030, batch_size=10)
+        inserts = [q for q in captured.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(LeaveBalance.objects.filter(year=2030).count(), 20)
+        # The created-row count only looks at each chunk's employees, never the whole year
+        counts = [q['sql'] for q in captured.captured_queries if 'COUNT(' in q['sql']]
+        self.assertEqual(len(counts), 4)
+        for sql in counts:
+            self.assertIn('"employee_id" IN', sql)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTests(TestCase):
+    """Test cases for the bulk CSV user import"""
+    
+    def setUp(self):
+        LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.existing_manager = User.objects.create_user(email='boss@test.com', role='manager')
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+    
+    def write_csv(self, rows):
+        with open(self.path, 'w', newline='') as f:
+            f.write('email,full_name,department,role,manager,password\n')
+            for row in rows:
+                f.write(','.join(row) + '\n')
+    
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_users', self.path, *args, stdout=out)
+        return out.getvalue()
+    
+    def test_import_links_managers_in_second_pass(self):
+        """Test managers resolve whether they already exist or appear later in the file"""
+        self.write_csv([
+            ('dev1@test.com', 'Dev One', 'Engineering', 'employee', 'lead@test.com', 'secret-1'),
+            ('dev2@test.com', 'Dev Two', 'Engineering', 'employee', 'boss@test.com', ''),
+            ('lead@test.com', 'Lead', 'Engineering', 'manager', 'boss@test.com', 'secret-2'),
+        ])
+        output = self.run_import('--batch-size', '2', '--workers', '1')
+        self.assertIn('Imported 3 users', output)
+        lead = User.objects.get(email='lead@test.com')
+        self.assertEqual(User.objects.get(email='dev1@test.com').manager, lead)
+        self.assertEqual(lead.manager, self.existing_manager)
+        self.assertTrue(User.objects.get(email='dev1@test.com').check_password('secret-1'))
+        self.assertFalse(User.objects.get(email='dev2@test.com').has_usable_password())
+    
+    def test_admins_get_the_same_flags_as_at_signup(self):
+        """Test imported admins are staff and superusers, like admins who sign up"""
+        self.write_csv([
+            ('root@test.com', 'Root', 'IT', 'admin', '', 'secret-1'),
+            ('lead@test.com', 'Lead', 'IT', 'manager', '', 'secret-2'),
+        ])
+        self.run_import('--workers', '1')
+        root, lead = (User.objects.get(email=email) for email in ('root@test.com', 'lead@test.com'))
+        self.assertEqual((root.role, root.is_staff, root.is_superuser), ('admin', True, True))
+        self.assertEqual((lead.role, lead.is_staff, lead.is_superuser), ('manager', False, False))
+    
+    def test_password_hashing_in_process_pool(self):
+        """Test passwords hashed by worker processes verify in the parent"""
+        self.write_csv([(f'user{i}@test.com', '', '', 'employee', '', f'pass-{i}') for i in range(6)])
+        self.run_import('--workers', '2')
+        for i in range(6):
+            self.assertTrue(User.objects.get(email=f'user{i}@test.com').check_password(f'pass-{i}'))
+    
+    def test_bad_duplicate_and_existing_rows_are_skipped(self):
+        """Test invalid, repeated and already registered rows are reported"""
+        self.write_csv([
+            ('not-an-email', '', '', 'employee', '', ''),
+            ('new@test.com', '', '', 'wizard', '', ''),
+            ('ok@test.com', '', '', 'employee', 'nobody@test.com', ''),
+            ('ok@test.com', '', '', 'employee', '', ''),
+            ('boss@test.com', '', '', 'manager', '', ''),
+        ])
+        output = self.run_import('--workers', '1')
+        self.assertIn('Line 2 skipped', output)
+        self.assertIn("unknown role 'wizard'", output)
+        self.assertIn('duplicate email ok@test.com', output)
+        self.assertIn('manager nobody@test.com not found', output)
+        self.assertIn('Imported 1 users (1 already existed, 3 rows skipped)', output)
+    
+    def test_stats_and_balances_follow_import(self):
+        """Test bulk inserts still update dashboard stats and provision balances"""
+        self.write_csv([(f'user{i}@test.com', '', '', 'employee', 'boss@test.com', '') for i in range(5)])
+        with self.assertNumQueries(12):
+            self.run_import('--workers', '1')
+        stats = DashboardStats.objects.current()
+        self.assertEqual((stats.total_users, stats.total_employees), (6, 5))
+        self.assertEqual(LeaveBalance.objects.filter(year=timezone.now().year).count(), 5)
+
+
+class LeaveExportTests(TestCase):
+    """Test cases for the streaming leave history export"""
+    
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', role='admin')
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.dev = User.objects.create_user(
+            email='dev@test.com', full_name='Dev', department='Engineering', role='employee', manager=self.manager
+        )
+        self.sales = User.objects.create_user(email='sales@test.com', department='Sales', role='employee')
+        self.create_leave(self.dev, date(2026, 1, 5), 'approved')
+        self.create_leave(self.dev, date(2026, 3, 2), 'pending')
+        self.create_leave(self.sales, date(2026, 1, 20), 'approved')
+    
+    def create_leave(self, employee, start, status):
+        return LeaveRequest.objects.create(
+            employee=employee,
+            leave_type=self.leave_type,
+            start_date=start,
+            end_date=start + timedelta(days=1),
+            total_days=2,
+            reason='Export, with "quotes"',
+            status=status
+        )
+    
+    def export(self, user, query=''):
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_leaves') + query)
+        body = b''.join(response.streaming_content).decode() if response.streaming else ''
+        return response, body
+    
+    def test_csv_cells_cannot_start_formulas(self):
+        """Test typed text that a spreadsheet would run as a formula is exported as plain text"""
+        LeaveRequest.objects.filter(employee=self.sales).update(reason='=HYPERLINK("http://evil.test","Click")')
+        User.objects.filter(pk=self.sales.pk).update(full_name='@SUM(1+1)', department='-2+3')
+        response, body = self.export(self.admin, '?department=-2%2B3')
+        row = next(csv.DictReader(StringIO(body)))
+        self.assertEqual(row['reason'], '\'=HYPERLINK("http://evil.test","Click")')
+        self.assertEqual((row['employee_name'], row['department']), ("'@SUM(1+1)", "'-2+3"))
+        self.assertEqual(row['total_days'], '2')
+        self.assertEqual(self.export(self.admin, '?format=jsonl')[1].count("'="), 0)
+
+    def test_csv_export_streams_all_rows_for_admin(self):
+        """Test admins get every request as a streamed CSV attachment"""
+        response, body = self.export(self.admin)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['employee_email'], 'dev@test.com')
+        self.assertEqual(rows[0]['reason'], 'Export, with "quotes"')
+    
+    def test_manager_only_exports_team(self):
+        """Test managers only get their own team's requests"""
+        _, body = self.export(self.manager, '?format=jsonl')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual({row['employee_email'] for row in rows}, {'dev@test.com'})
+    
+    def test_filters(self):
+        """Test date range, status and department filters combine"""
+        _, body = self.export(self.admin, '?format=jsonl&start=2026-01-01&end=2026-01-31&status=approved')
+        self.assertEqual(len(body.splitlines()), 2)
+        _, body = self.export(self.admin, '?format=jsonl&start=2026-01-01&end=2026-01-31&department=Sales')
+        self.assertEqual([json.loads(line)['employee_email'] for line in body.splitlines()], ['sales@test.com'])
+    
+    def test_bad_parameters_and_access(self):
+        """Test invalid filters are rejected and employees are refused"""
+        self.assertEqual(self.export(self.admin, '?start=01/02/2026')[0].status_code, 400)
+        self.assertEqual(self.export(self.admin, '?status=lost')[0].status_code, 400)
+        self.assertEqual(self.export(self.admin, '?format=xlsx')[0].status_code, 400)
+        self.assertEqual(self.export(self.dev)[0].status_code, 302)
+    
+    def test_export_reads_rows_through_iterator(self):
+        """Test rows are fetched in chunks instead of loading the whole table"""
+        with patch.object(type(LeaveRequest.objects.all()), 'iterator', autospec=True,
+                          side_effect=lambda qs, chunk_size: iter(list(qs))) as iterator:
+            self.export(self.admin)
+        self.assertEqual(iterator.call_args.kwargs['chunk_size'], 2000)
+    
+    def test_command_writes_file(self):
+        """Test the management command writes a filtered export"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'leaves.csv')
+            err = StringIO()
+            call_command('export_leaves', '--status', 'approved', '--output', path, stderr=err)
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 2)
+        self.assertIn('Exported 2 leave requests', err.getvalue())
+        out = StringIO()
+        call_command('export_leaves', '--format', 'jsonl', '--department', 'Sales', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 1)
+
+
+class WorkdayEngineTests(TestCase):
+    """Test cases for holiday calendars and server-side leave day counting"""
+    
+    def setUp(self):
+        self.calendar = HolidayCalendar.objects.create(name='India', is_default=True)
+        Holiday.objects.create(calendar=self.calendar, date=date(2026, 1, 26), name='Republic Day')
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=self.manager)
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+    
+    def brute_force(self, calendar, start, end):
+        days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+        return sum(1 for day in days if calendar.is_working_day(day))
+    
+    def test_prefix_sums_match_day_by_day_count(self):
+        """Test O(1) range counts agree with walking every day, across years"""
+        calendar = workdays.WorkdayCalendar({4, 5}, {date(2024, 2, 29), date(2025, 12, 31)})
+        rng = random.Random(7)
+        for _ in range(300):
+            start = date(2023, 6, 1) + timedelta(days=rng.randrange(1200))
+            end = start + timedelta(days=rng.randrange(800))
+            self.assertEqual(calendar.count(start, end), self.brute_force(calendar, start, end), (start, end))
+        self.assertEqual(calendar.count(date(2026, 1, 2), date(2026, 1, 1)), 0)
+    
+    def test_weekends_and_holidays_are_excluded(self):
+        """Test a week containing a holiday counts four working days"""
+        # Mon 26 Jan 2026 is a holiday; Sat/Sun 31 Jan - 1 Feb are off
+        self.assertEqual(workdays.count_working_days(self.employee, date(2026, 1, 26), date(2026, 2, 1)), 4)
+    
+    def test_user_calendar_overrides_default(self):
+        """Test a user's own calendar (Friday/Saturday weekend) is used"""
+        gulf = HolidayCalendar.objects.create(name='Gulf', weekend_days='4,5')
+        self.employee.holiday_calendar = gulf
+        self.employee.save()
+        # Thu 29 Jan - Sun 1 Feb 2026: Thursday and Sunday are working days
+        self.assertEqual(workdays.count_working_days(self.employee, date(2026, 1, 29), date(2026, 2, 1)), 2)
+    
+    def test_new_holiday_refreshes_cached_tables(self):
+        """Test adding a holiday is picked up by the memoized calendar"""
+        start, end = date(2026, 3, 2), date(2026, 3, 6)
+        self.assertEqual(workdays.count_working_days(self.employee, start, end), 5)
+        Holiday.objects.create(calendar=self.calendar, date=date(2026, 3, 4), name='Holi')
+        self.assertEqual(workdays.count_working_days(self.employee, start, end), 4)
+    
+    def test_form_ignores_client_total_days(self):
+        """Test the request form counts days itself and rejects empty ranges"""
+        self.client.force_login(self.employee)
+        data = {
+            'manager': self.manager.id,
+            'leave_type': self.leave_type.id,
+            'start_date': '2026-01-23',
+            'end_date': '2026-01-27',
+            'total_days': '99',
+            'reason': 'Long weekend',
+        }
+        self.client.post(reverse('request_leave'), data)
+        self.assertEqual(LeaveRequest.objects.get().total_days, 2)
+        
+        data.update(start_date='2026-01-31', end_date='2026-02-01')
+        response = self.client.post(reverse('request_leave'), data)
+        self.assertContains(response, 'no working days')
+        data.update(start_date='2026-02-05', end_date='2026-02-02')
+        response = self.client.post(reverse('request_leave'), data)
+        self.assertContains(response, 'End date cannot be before start date.')
+    
+    def test_request_form_preview_uses_the_users_calendar(self):
+        """Test the request page hands the duration preview the user's weekend and holidays"""
+        gulf = HolidayCalendar.objects.create(name='Gulf', weekend_days='4,5')
+        Holiday.objects.create(calendar=gulf, date=date(2026, 12, 2), name='National Day')
+        self.employee.holiday_calendar = gulf
+        self.employee.save()
+        self.client.force_login(self.employee)
+        response = self.client.get(reverse('request_leave'))
+        self.assertEqual(response.context['workday_calendar'], {'weekend': [4, 5], 'holidays': ['2026-12-02']})
+        self.assertContains(response, '<script id="workday-calendar" type="application/json">')
+        
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('request_leave'))
+        self.assertEqual(response.context['workday_calendar'], {'weekend': [5, 6], 'holidays': ['2026-01-26']})
+    
+    def test_batch_recompute(self):
+        """Test the batch API fixes stored totals chunk by chunk"""
+        for i in range(5):
+            LeaveRequest.objects.create(
+                employee=self.employee,
+                leave_type=self.leave_type,
+                start_date=date(2026, 1, 26),
+                end_date=date(2026, 2, 1),
+                total_days=7 if i % 2 else 4,
+                reason='Recompute'
+            )
+        self.assertEqual(workdays.recompute_total_days(chunk_size=2), (5, 2))
+        self.assertEqual(set(LeaveRequest.objects.values_list('total_days', flat=True)), {4})
+        out = StringIO()
+        call_command('recompute_leave_days', '--status', 'pending', stdout=out)
+        self.assertIn('Checked 5 leave requests, corrected 0', out.getvalue())
+    
+    def test_recompute_invalidates_employee_and_manager_dashboards(self):
+        """Test corrected totals refresh the manager's cached team lists as well"""
+        LeaveRequest.objects.create(
+            employee=self.employee, leave_type=self.leave_type,
+            start_date=date(2026, 1, 26), end_date=date(2026, 2, 1), total_days=4, reason='Recompute'
+        )
+        LeaveRequest.objects.update(total_days=7)
+        versions = {user.pk: dashboard_cache.get_version(user.pk) for user in (self.employee, self.manager)}
+        workdays.recompute_total_days()
+        for user_id, version in versions.items():
+            self.assertNotEqual(dashboard_cache.get_version(user_id), version)
+    
+    def test_weekend_days_are_validated(self):
+        """Test weekend_days must be weekday numbers 0-6, and is stored sorted without duplicates"""
+        for value in ('7', 'sat,sun', '5;6', '-1'):
+            with self.assertRaises(ValidationError):
+                HolidayCalendar(name=f'Bad {value}', weekend_days=value).full_clean()
+        calendar = HolidayCalendar(name='Gulf', weekend_days=' 5, 4,4')
+        calendar.full_clean()
+        self.assertEqual(calendar.weekend_days, '4,5')
+        self.assertEqual(calendar.weekend, {4, 5})
+
+
+class TeamAbsenceTests(QueryBudgetTestMixin, TestCase):
+    """Test cases for the team calendar, absences API and pending-queue conflicts"""
+    
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.leave_type = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.alice = User.objects.create_user(
+            email='alice@test.com', full_name='Alice', role='employee', manager=self.manager
+        )
+        self.bob = User.objects.create_user(email='bob@test.com', full_name='Bob', role='employee', manager=self.manager)
+        self.outsider = User.objects.create_user(email='out@test.com', full_name='Out', role='employee')
+        self.client.force_login(self.manager)
+    
+    def create_leave(self, employee, start, end, status='pending'):
+        return LeaveRequest.objects.create(
+            employee=employee,
+            leave_type=self.leave_type,
+            start_date=start,
+            end_date=end,
+            total_days=(end - start).days + 1,
+            reason='Absence',
+            status=status
+        )
+    
+    def test_interval_index_matches_brute_force(self):
+        """Test the in-memory index returns exactly the overlapping leaves"""
+        rng = random.Random(3)
+        leaves = []
+        for i in range(60):
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(200))
+            leaves.append(LeaveRequest(pk=i, start_date=start, end_date=start + timedelta(days=rng.randrange(15))))
+        index = absences.IntervalIndex(leaves)
+        for _ in range(100):
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(220))
+            end = start + timedelta(days=rng.randrange(20))
+            found = index.overlapping(start, end)
+            expected = {leave.pk for leave in leaves if leave.start_date <= end and leave.end_date >= start}
+            self.assertEqual({leave.pk for leave in found}, expected)
+            self.assertEqual([leave.start_date for leave in found], sorted(leave.start_date for leave in found))
+    
+    def test_interval_index_skips_leaves_ended_before_the_window(self):
+        """Test a query late in the year looks at a handful of nodes, not every earlier leave"""
+        reads = []
+        
+        class Leave:
+            def __init__(self, start, end):
+                self.start_date, self._end = start, end
+            
+            @property
+            def end_date(self):
+                reads.append(self)
+                return self._end
+        
+        first = date(2026, 1, 1)
+        leaves = [Leave(first + timedelta(days=i % 300), first + timedelta(days=i % 300)) for i in range(3000)]
+        index = absences.IntervalIndex(leaves)
+        reads.clear()
+        found = index.overlapping(date(2026, 10, 27), date(2026, 10, 27))
+        self.assertEqual(len(found), 10)
+        self.assertLess(len(reads), 200)
+    
+    def test_api_returns_team_overlaps_only(self):
+        """Test the API lists approved/pending team leaves touching the window"""
+        inside = self.create_leave(self.alice, date(2026, 5, 28), date(2026, 6, 2), 'approved')
+        self.create_leave(self.bob, date(2026, 6, 5), date(2026, 6, 6), 'rejected')
+        self.create_leave(self.bob, date(2026, 7, 1), date(2026, 7, 3))
+        self.create_leave(self.outsider, date(2026, 6, 1), date(2026, 6, 2), 'approved')
+        response = self.assertWithinQueryBudget(
+            'team_absences_api', reverse('team_absences_api') + '?start=2026-06-01&end=2026-06-30'
+        )
+        self.assertEqual([row['id'] for row in response.json()['absences']], [inside.id])
+    
+    def test_api_validates_window(self):
+        """Test bad dates, reversed and oversized windows are rejected"""
+        url = reverse('team_absences_api')
+        for query in ['?start=June', '?start=2026-06-10&end=2026-06-01', '?start=2026-01-01&end=2027-06-01']:
+            self.assertEqual(self.client.get(url + query).status_code, 400, query)
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get(url).status_code, 403)
+    
+    def test_pending_queue_shows_conflicts_in_one_query(self):
+        """Test each pending request lists overlapping teammates without a query per row"""
+        self.create_leave(self.alice, date(2026, 6, 1), date(2026, 6, 5), 'approved')
+        for offset in range(5):
+            day = date(2026, 6, 1) + timedelta(days=offset * 10)
+            self.create_leave(self.bob, day, day + timedelta(days=1))
+        response = self.assertWithinQueryBudget('manager_dashboard', reverse('manager_dashboard'))
+        pending = {leave.start_date: leave for leave in response.context['pending_leaves']}
+        self.assertEqual([other.employee for other in pending[date(2026, 6, 1)].conflicts], [self.alice])
+        self.assertEqual(pending[date(2026, 6, 11)].conflicts, [])
+        self.assertContains(response, 'Alice also out')
+    
+    def test_calendar_marks_days(self):
+        """Test the month grid marks each day a team member is away"""
+        self.create_leave(self.alice, date(2026, 5, 30), date(2026, 6, 2), 'approved')
+        self.create_leave(self.bob, date(2026, 6, 2), date(2026, 6, 2))
+        response = self.assertWithinQueryBudget('team_calendar', reverse('team_calendar') + '?month=2026-06')
+        rows = {row['member'].email: row['cells'] for row in response.context['rows']}
+        self.assertEqual(len(response.context['days']), 30)
+        self.assertEqual([i for i, cell in enumerate(rows['alice@test.com']) if cell], [0, 1])
+        self.assertEqual(rows['bob@test.com'][1].status, 'pending')
+        self.assertEqual(response.context['next_month'], date(2026, 7, 1))
+
+
+class LeaveRollupTests(QueryBudgetTestMixin, TestCase):
+    """Test cases for the incrementally maintained leave analytics rollups"""
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.casual = LeaveType.objects.create(name='Casual Leave', default_days=12)
+        self.sick = LeaveType.objects.create(name='Sick Leave', default_days=8)
+        self.alice = User.objects.create_user(
+            email='alice@test.com', role='employee', department='Sales', manager=self.manager
+        )
+        self.bob = User.objects.create_user(
+            email='bob@test.com', role='employee', department='Support', manager=self.manager
+        )
+    
+    def create_leave(self, employee, start, days=2, leave_type=None, status='pending'):
+        return LeaveRequest.objects.create(
+            employee=employee,
+            leave_type=leave_type or self.casual,
+            start_date=start,
+            end_date=start + timedelta(days=days - 1),
+            total_days=days,
+            reason='Rollup',
+            status=status
+        )
+    
+    def rollups(self):
+        return {
+            (row.department, row.leave_type_id, row.month, row.status): (row.request_count, row.total_days)
+            for row in LeaveRollup.objects.exclude(request_count=0)
+        }
+    
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        LeaveRollup.objects.rebuild()
+        self.assertEqual(incremental, self.rollups())
+    
+    def test_new_requests_are_counted(self):
+        """Test creating requests adds to the department/type/month/status row"""
+        self.create_leave(self.alice, date(2026, 3, 2))
+        self.create_leave(self.alice, date(2026, 3, 20), days=3)
+        self.create_leave(self.bob, date(2026, 3, 31), days=4, leave_type=self.sick)
+        self.assertEqual(self.rollups(), {
+            ('Sales', self.casual.id, date(2026, 3, 1), 'pending'): (2, 5),
+            ('Support', self.sick.id, date(2026, 3, 1), 'pending'): (1, 4),
+        })
+    
+    def test_decisions_move_requests_between_statuses(self):
+        """Test single and bulk decisions move counts out of pending"""
+        first, second, third = (self.create_leave(self.alice, date(2026, 4, 6)) for _ in range(3))
+        services.decide_leave(first, self.manager, approve=True)
+        services.decide_leaves(self.manager, [second.id], approve=False)
+        self.assertEqual(self.rollups(), {
+            ('Sales', self.casual.id, date(2026, 4, 1), 'pending'): (1, 2),
+            ('Sales', self.casual.id, date(2026, 4, 1), 'approved'): (1, 2),
+            ('Sales', self.casual.id, date(2026, 4, 1), 'rejected'): (1, 2),
+        })
+        # Saving the decided instance again must not count it twice
+        first.reason = 'Edited'
+        first.save()
+        self.assertMatchesRebuild()
+    
+    def test_edits_cancellations_and_department_changes(self):
+        """Test date/type edits, deletes and department moves stay in step with a rebuild"""
+        leave = self.create_leave(self.alice, date(2026, 5, 29))
+        self.create_leave(self.alice, date(2026, 6, 1), status='approved')
+        leave.start_date, leave.total_days, leave.leave_type = date(2026, 6, 2), 1, self.sick
+        leave.save()
+        self.client.force_login(self.bob)
+        cancelled = self.create_leave(self.bob, date(2026, 6, 3))
+        self.client.post(reverse('cancel_leave', args=[cancelled.id]))
+        self.alice.department = 'Marketing'
+        self.alice.save()
+        self.assertEqual(set(LeaveRollup.objects.exclude(request_count=0).values_list('department', flat=True)), {'Marketing'})
+        self.assertMatchesRebuild()
+    
+    def test_recompute_adjusts_days(self):
+        """Test the bulk total_days recount updates rolled-up days"""
+        self.create_leave(self.alice, date(2026, 1, 9), days=4)  # Friday to Monday: 2 working days
+        workdays.recompute_total_days()
+        self.assertEqual(self.rollups(), {('Sales', self.casual.id, date(2026, 1, 1), 'pending'): (1, 2)})
+    
+    def test_deleting_users_and_leave_types(self):
+        """Test cascades from a user or a leave type leave consistent rollups"""
+        self.create_leave(self.alice, date(2026, 2, 2), leave_type=self.sick)
+        self.create_leave(self.bob, date(2026, 2, 2))
+        self.bob.delete()
+        self.assertEqual(self.rollups(), {('Sales', self.sick.id, date(2026, 2, 1), 'pending'): (1, 2)})
+        self.sick.delete()
+        self.assertEqual(self.rollups(), {})
+    
+    def test_rebuild_command(self):
+        """Test the command recounts from leave_requests"""
+        self.create_leave(self.alice, date(2026, 7, 1))
+        LeaveRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_leave_rollups', stdout=out)
+        self.assertIn('1 rows', out.getvalue())
+        self.assertEqual(self.rollups(), {('Sales', self.casual.id, date(2026, 7, 1), 'pending'): (1, 2)})
+    
+    def test_report_reads_rollups_only(self):
+        """Test the report totals per group and month without touching leave_requests"""
+        admin = User.objects.create_user(email='admin@test.com', role='admin')
+        self.create_leave(self.alice, date(2025, 12, 1), status='approved')
+        self.create_leave(self.alice, date(2026, 1, 5), days=3, status='approved')
+        self.create_leave(self.bob, date(2026, 2, 5), status='rejected')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.assertWithinQueryBudget('leave_report', reverse('leave_report') + '?start=2026-01&end=2026-12')
+        self.assertFalse(any('leave_requests' in query['sql'] for query in captured.captured_queries))
+        self.assertEqual(response.context['totals']['days_taken'], 3)
+        self.assertEqual([row['month'] for row in response.context['by_month']], [date(2026, 1, 1), date(2026, 2, 1)])
+        response = self.client.get(reverse('leave_report') + '?start=2026-01&end=2026-12&department=Support')
+        self.assertEqual([row['department'] for row in response.context['by_type']], ['Support'])
+        self.client.force_login(self.alice)
+        self.assertRedirects(self.client.get(reverse('leave_report')), reverse('account_login'), fetch_redirect_response=False)
+
+
+def image_bytes(size, fmt='PNG', mode='RGB'):
+    out = io.BytesIO()
+    Image.new(mode, size, 'red').save(out, fmt)
+    return out.getvalue()
+
+
+class ChatAttachmentTests(TestCase):
+    """Test cases for attachment type sniffing, metadata and thumbnails"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, CHAT_ATTACHMENT_PROCESSING='sync')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=self.manager)
+        self.client.force_login(self.employee)
+    
+    def send(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('send_message'), {
+                'receiver_id': self.manager.id,
+                'attachment': SimpleUploadedFile(name, content),
+            })
+        self.assertEqual(response.status_code, 200)
+        return ChatMessage.objects.get(pk=response.json()['message']['id'])
+    
+    def test_image_gets_webp_thumbnail(self):
+        """Test an uploaded photo is measured and thumbnailed to 256px WebP"""
+        msg = self.send('photo.png', image_bytes((1024, 512)))
+        self.assertEqual(msg.attachment_mime, 'image/png')
+        self.assertEqual((msg.attachment_width, msg.attachment_height), (1024, 512))
+        self.assertEqual(msg.attachment_size, msg.attachment.size)
+        with Image.open(msg.attachment_thumbnail.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (256, 128)))
+        self.assertLess(msg.attachment_thumbnail.size, msg.attachment_size)
+        
+        self.client.force_login(self.manager)
+        data = self.client.get(reverse('get_messages', args=[self.employee.id])).json()['messages'][0]
+        self.assertTrue(data['thumbnail_url'].startswith(reverse('chat_attachment_thumbnail', args=[msg.id])))
+        self.assertTrue(data['is_image'])
+    
+    def test_type_comes_from_content_not_name(self):
+        """Test a PDF named .jpg is a PDF, and a fake PNG is a plain file"""
+        pdf = self.send('scan.jpg', b'%PDF-1.4\n%fake\n')
+        self.assertEqual(pdf.attachment_mime, 'application/pdf')
+        self.assertEqual((pdf.is_image, pdf.is_pdf, bool(pdf.attachment_thumbnail)), (False, True, False))
+        with self.assertLogs('accounts.attachments', 'WARNING'):
+            broken = self.send('photo.png', b'\x89PNG\r\n\x1a\n' + b'garbage' * 10)
+        self.assertEqual(broken.attachment_mime, 'application/octet-stream')
+        self.assertFalse(broken.is_image)
+    
+    def test_jpeg_and_palette_images(self):
+        """Test JPEGs and transparent palette GIFs thumbnail too"""
+        jpeg = self.send('a.jpg', image_bytes((300, 900), 'JPEG'))
+        self.assertEqual((jpeg.attachment_mime, jpeg.attachment_width), ('image/jpeg', 300))
+        gif = self.send('b.gif', image_bytes((64, 64), 'GIF', mode='P'))
+        with Image.open(gif.attachment_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 64))  # never scaled up
+    
+    def test_exif_rotated_photo_is_measured_upright(self):
+        """Test a sideways-stored phone photo records the dimensions it is shown at"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW
+        out = io.BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(out, 'JPEG', exif=exif)
+        msg = self.send('phone.jpg', out.getvalue())
+        self.assertEqual((msg.attachment_width, msg.attachment_height), (200, 400))
+        with Image.open(msg.attachment_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 256))
+    
+    def test_backfill_command(self):
+        """Test attachments stored before processing existed are picked up"""
+        legacy = ChatMessage.objects.create(
+            sender=self.employee, receiver=self.manager,
+            attachment=SimpleUploadedFile('old.png', image_bytes((40, 30))), attachment_name='old.png'
+        )
+        out = StringIO()
+        call_command('process_chat_attachments', stdout=out)
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.attachment_mime, legacy.attachment_width), ('image/png', 40))
+        self.assertIn('Processed 1 attachments (1 thumbnails)', out.getvalue())
+
+
+class ChatAttachmentWorkerTests(TransactionTestCase):
+    """Background processing on the thread pool (needs committed rows)"""
+    
+    def test_thread_pool_processes_after_commit(self):
+        """Test schedule() hands the work to a pool thread"""
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            sender = User.objects.create_user(email='a@test.com', role='employee')
+            receiver = User.objects.create_user(email='b@test.com', role='manager')
+            msg = ChatMessage.objects.create(
+                sender=sender, receiver=receiver, attachment=SimpleUploadedFile('x.png', image_bytes((500, 500)))
+            )
+            future = attachments.schedule(msg.id)
+            future.result(timeout=30)
+            msg.refresh_from_db()
+            self.assertEqual(msg.attachment_mime, 'image/png')
+            self.assertTrue(msg.attachment_thumbnail.name.startswith('blobs/'))
+
+
+@override_settings(CHAT_UPLOAD_MAX_BYTES=300 * 1024, CHAT_UPLOAD_CHUNK_BYTES=100 * 1024, CHAT_ATTACHMENT_PROCESSING='sync')
+class ChunkedUploadTests(TestCase):
+    """Test cases for the resumable chunked attachment upload API"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=self.manager)
+        self.client.force_login(self.employee)
+        self.pdf = b'%PDF-1.7\n' + os.urandom(250 * 1024)
+    
+    def start(self, size=None, content_type='application/pdf', file_name='report.pdf'):
+        return self.client.post(reverse('start_chat_upload'), {
+            'file_name': file_name, 'size': len(self.pdf) if size is None else size, 'content_type': content_type,
+        }, content_type='application/json')
+    
+    def put(self, upload_id, offset, body):
+        return self.client.generic(
+            'PUT', reverse('chat_upload', args=[upload_id]) + f'?offset={offset}', body,
+            content_type='application/octet-stream'
+        )
+    
+    def complete(self, upload_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('complete_chat_upload', args=[upload_id]),
+                {'receiver_id': self.manager.id, 'message': 'Report attached'}, content_type='application/json'
+            )
+    
+    def test_upload_in_chunks_and_send(self):
+        """Test a file sent in chunks lands in place and becomes a message attachment"""
+        upload = self.start().json()
+        path = ChatUpload.objects.get().path
+        chunk = upload['chunk_size']
+        for offset in range(0, len(self.pdf), chunk):
+            response = self.put(upload['id'], offset, self.pdf[offset:offset + chunk])
+            self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['complete'])
+        
+        data = self.complete(upload['id']).json()
+        msg = ChatMessage.objects.get(pk=data['message']['id'])
+        self.assertEqual(msg.attachment.name, storage.blob_name(hashlib.sha256(self.pdf).hexdigest(), '.pdf'))
+        self.assertFalse(default_storage.exists(path))  # removed once the message committed
+        with msg.attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.pdf)
+        self.assertEqual((msg.attachment_name, msg.attachment_mime), ('report.pdf', 'application/pdf'))
+        self.assertFalse(ChatUpload.objects.exists())
+        self.assertEqual(UnreadCounter.objects.get(receiver=self.manager).count, 1)
+        # A second completion cannot send the file twice
+        self.assertEqual(self.complete(upload['id']).status_code, 404)
+    
+    def test_failed_completion_can_be_retried(self):
+        """Test a completion that rolls back keeps the upload and its file for the next try"""
+        upload_id = self.start().json()['id']
+        path = ChatUpload.objects.get().path
+        self.put(upload_id, 0, self.pdf[:100 * 1024])
+        self.put(upload_id, 100 * 1024, self.pdf[100 * 1024:200 * 1024])
+        self.put(upload_id, 200 * 1024, self.pdf[200 * 1024:])
+        with patch('accounts.views._create_message', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                self.complete(upload_id)
+        self.assertTrue(ChatUpload.objects.filter(pk=upload_id).exists())
+        self.assertTrue(default_storage.exists(path))
+        
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 200)
+        with ChatMessage.objects.get(pk=response.json()['message']['id']).attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.pdf)
+        self.assertFalse(default_storage.exists(path))
+    
+    def test_limits_are_checked_before_bytes(self):
+        """Test oversized files, disallowed types and oversized chunks are refused"""
+        self.assertEqual(self.start(size=301 * 1024).status_code, 413)
+        self.assertEqual(self.start(content_type='application/zip', file_name='a.zip').status_code, 415)
+        upload = self.start().json()
+        self.assertEqual(self.put(upload['id'], 0, self.pdf[:101 * 1024]).status_code, 413)
+        self.assertEqual(self.put(upload['id'], 200 * 1024, self.pdf[:100 * 1024]).status_code, 409)
+    
+    def test_content_must_match_declared_type(self):
+        """Test a first chunk whose magic bytes disagree discards the upload"""
+        upload = self.start(size=1000).json()
+        path = ChatUpload.objects.get().path
+        self.assertEqual(self.put(upload['id'], 0, b'PK\x03\x04' + b'0' * 996).status_code, 415)
+        self.assertFalse(ChatUpload.objects.exists())
+        self.assertFalse(default_storage.exists(path))
+    
+    def test_resume_after_interrupted_chunk(self):
+        """Test a half-received chunk keeps its bytes and the client resumes from the offset"""
+        upload_id = self.start().json()['id']
+        upload = ChatUpload.objects.get()
+        # Client went away after 40 KB of a 100 KB chunk
+        self.assertEqual(uploads.write_chunk(upload, 0, 100 * 1024, io.BytesIO(self.pdf[:40 * 1024])), 40 * 1024)
+        status = self.client.get(reverse('chat_upload', args=[upload_id])).json()
+        self.assertEqual(status['offset'], 40 * 1024)
+        offset = status['offset']
+        while offset < len(self.pdf):
+            offset = self.put(upload_id, offset, self.pdf[offset:offset + 100 * 1024]).json()['offset']
+        data = self.complete(upload_id).json()
+        with ChatMessage.objects.get(pk=data['message']['id']).attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.pdf)
+    
+    def test_incomplete_and_foreign_uploads(self):
+        """Test completing early, and touching someone else's upload, are refused"""
+        upload_id = self.start().json()['id']
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse('chat_upload', args=[upload_id])).status_code, 404)
+    
+    def test_stale_uploads_expire(self):
+        """Test the cleanup command drops abandoned uploads and their files"""
+        self.start()
+        upload = ChatUpload.objects.get()
+        ChatUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('clear_chat_uploads', stdout=out)
+        self.assertIn('Discarded 1', out.getvalue())
+        self.assertFalse(default_storage.exists(upload.path))
+    
+    def test_send_message_applies_the_same_limits(self):
+        """Test the multipart send path refuses oversized and disallowed files"""
+        response = self.client.post(reverse('send_message'), {
+            'receiver_id': self.manager.id, 'attachment': SimpleUploadedFile('big.pdf', b'%PDF-' + b'0' * 310 * 1024),
+        })
+        self.assertEqual(response.status_code, 413)
+        response = self.client.post(reverse('send_message'), {
+            'receiver_id': self.manager.id, 'attachment': SimpleUploadedFile('a.exe', b'MZ' + b'0' * 100),
+        })
+        self.assertEqual(response.status_code, 415)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Test cases for deduplicated blob storage and its reference counts"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media.name, CHAT_ATTACHMENT_PROCESSING='sync', BLOB_COLLECT_GRACE=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=self.manager)
+        self.client.force_login(self.manager)
+        self.pdf = b'%PDF-1.7\n' + os.urandom(4096)
+    
+    def send(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('send_message'), {
+                'receiver_id': self.employee.id,
+                'attachment': SimpleUploadedFile(name, content),
+            })
+        return ChatMessage.objects.get(pk=response.json()['message']['id'])
+    
+    def test_same_file_is_stored_once(self):
+        """Test a file sent twice shares one blob counted twice, collected after both messages go"""
+        first = self.send('policy.pdf', self.pdf)
+        second = self.send('Policy (1).pdf', self.pdf)
+        name = storage.blob_name(hashlib.sha256(self.pdf).hexdigest(), '.pdf')
+        self.assertEqual((first.attachment.name, second.attachment.name), (name, name))
+        self.assertEqual(second.attachment_name, 'Policy (1).pdf')
+        blob = StoredBlob.objects.get(name=name)
+        self.assertEqual((blob.ref_count, blob.size), (2, len(self.pdf)))
+        self.assertEqual(len(os.listdir(os.path.dirname(default_storage.path(name)))), 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+    
+    def test_thumbnails_are_shared(self):
+        """Test the same photo sent twice gets one thumbnail blob"""
+        photo = image_bytes((600, 400))
+        first, second = self.send('a.png', photo), self.send('b.png', photo)
+        self.assertEqual(first.attachment_thumbnail.name, second.attachment_thumbnail.name)
+        self.assertEqual(StoredBlob.objects.get(name=first.attachment_thumbnail.name).ref_count, 2)
+    
+    def test_replaced_profile_picture_is_released(self):
+        """Test changing a profile picture drops the old blob"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.profile_picture = SimpleUploadedFile('me.png', image_bytes((64, 64)))
+            self.employee.save()
+        old = self.employee.profile_picture.name
+        self.assertTrue(storage.is_blob(old))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.profile_picture = SimpleUploadedFile('me.png', image_bytes((32, 32)))
+            self.employee.save()
+        self.assertNotEqual(self.employee.profile_picture.name, old)
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(StoredBlob.objects.get(name=self.employee.profile_picture.name).ref_count, 1)
+    
+    def test_chunked_upload_dedupes_with_form_upload(self):
+        """Test a chunked upload of a file already sent reuses its blob"""
+        sent = self.send('policy.pdf', self.pdf)
+        upload = uploads.start_upload(self.manager, 'policy.pdf', len(self.pdf), 'application/pdf')
+        uploads.write_chunk(upload, 0, len(self.pdf), io.BytesIO(self.pdf))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('complete_chat_upload', args=[upload.id]),
+                {'receiver_id': self.employee.id}, content_type='application/json'
+            )
+        msg = ChatMessage.objects.get(pk=response.json()['message']['id'])
+        self.assertEqual(msg.attachment.name, sent.attachment.name)
+        self.assertEqual(StoredBlob.objects.get(name=sent.attachment.name).ref_count, 2)
+        self.assertFalse(default_storage.exists(upload.path))
+    
+    def test_blob_reused_meanwhile_survives_collection(self):
+        """Test a blob stored again within the grace period keeps its file when its old row is collected"""
+        first = self.send('policy.pdf', self.pdf)
+        name = first.attachment.name
+        with override_settings(BLOB_COLLECT_GRACE=60):
+            # A second upload dedupes against the blob, but has not counted its reference yet
+            self.assertEqual(storage.blob_storage.save('policy.pdf', io.BytesIO(self.pdf)), name)
+            with self.captureOnCommitCallbacks(execute=True):
+                first.delete()
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), [os.path.basename(name)])
+    
+    def test_collected_blob_is_rewritten(self):
+        """Test storing content whose blob was just collected writes the file again"""
+        first = self.send('policy.pdf', self.pdf)
+        name = first.attachment.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(storage.blob_storage.save('policy.pdf', io.BytesIO(self.pdf)), name)
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), self.pdf)
+    
+    def test_migrate_media_to_blobs(self):
+        """Test files saved before blob storage are moved in and counted"""
+        legacy = default_storage.save('chat_attachments/old.pdf', io.BytesIO(self.pdf))
+        msgs = [
+            ChatMessage.objects.create(sender=self.manager, receiver=self.employee, attachment=legacy)
+            for _ in range(2)
+        ]
+        ChatMessage.objects.create(sender=self.manager, receiver=self.employee, attachment='chat_attachments/gone.pdf')
+        out, err = StringIO(), StringIO()
+        call_command('migrate_media_to_blobs', stdout=out, stderr=err)
+        self.assertIn('Moved 2 files into 1 blobs, 1 missing', out.getvalue())
+        name = storage.blob_name(hashlib.sha256(self.pdf).hexdigest(), '.pdf')
+        for msg in msgs:
+            msg.refresh_from_db()
+            self.assertEqual(msg.attachment.name, name)
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 2)
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertTrue(default_storage.exists(name))
+
+
+class AttachmentDownloadTests(TestCase):
+    """Test cases for the authenticated, cacheable attachment download view"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, CHAT_ATTACHMENT_PROCESSING='sync')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(email='employee@test.com', role='employee', manager=self.manager)
+        self.outsider = User.objects.create_user(email='outsider@test.com', role='employee', manager=self.manager)
+        self.pdf = b'%PDF-1.7\n' + os.urandom(10000)
+        self.client.force_login(self.employee)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('send_message'), {
+                'receiver_id': self.manager.id,
+                'attachment': SimpleUploadedFile('Leave policy.pdf', self.pdf),
+            })
+        self.data = response.json()['message']
+        self.url = reverse('chat_attachment', args=[self.data['id']])
+        self.etag = '"%s"' % hashlib.sha256(self.pdf).hexdigest()
+    
+    def test_only_participants_can_download(self):
+        """Test sender and receiver get the file, anyone else a 404"""
+        self.assertTrue(self.data['attachment_url'].startswith(self.url + '?v='))
+        response = self.client.get(self.data['attachment_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.pdf)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], "inline; filename*=UTF-8''Leave%20policy.pdf")
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+    
+    def test_cache_headers_and_revalidation(self):
+        """Test blobs are immutable with a digest ETag, and revalidate to 304"""
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # Revalidation still checks access
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag).status_code, 404)
+    
+    def test_range_requests(self):
+        """Test single byte ranges get 206, stale If-Range the whole file, bad ranges 416"""
+        for header, body in (
+            ('bytes=0-99', self.pdf[:100]),
+            ('bytes=9000-', self.pdf[9000:]),
+            ('bytes=-10', self.pdf[-10:]),
+        ):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), body)
+            self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(
+            self.client.get(self.url, HTTP_RANGE='bytes=0-99')['Content-Range'], f'bytes 0-99/{len(self.pdf)}'
+        )
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE=self.etag).status_code, 206)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"stale"').status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20000-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.pdf)}'))
+    
+    def test_sendfile_offload(self):
+        """Test the proxy gets the file to send and Python sends no body"""
+        msg = ChatMessage.objects.get(pk=self.data['id'])
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_SENDFILE_URL='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + msg.attachment.name)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], self.etag)
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], msg.attachment.path)
+    
+    def test_thumbnail_download(self):
+        """Test image thumbnails are served as WebP through the same checks"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('send_message'), {
+                'receiver_id': self.manager.id,
+                'attachment': SimpleUploadedFile('photo.png', image_bytes((400, 300))),
+            })
+        photo_id = response.json()['message']['id']
+        response = self.client.get(reverse('chat_attachment_thumbnail', args=[photo_id]))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertEqual(self.client.get(reverse('chat_attachment_thumbnail', args=[self.data['id']])).status_code, 404)
+
+
+class ProfilePictureTests(TestCase):
+    """Test cases for profile picture normalization and avatar sizes"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, BLOB_COLLECT_GRACE=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(
+            email='employee@test.com', full_name='Employee', role='employee', manager=self.manager
+        )
+        self.client.force_login(self.employee)
+    
+    def phone_photo(self):
+        """A landscape JPEG stored sideways: EXIF says rotate to portrait, and names the owner"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW
+        exif[0x010E] = 'Home address'  # ImageDescription
+        out = io.BytesIO()
+        Image.new('RGB', (1600, 800), 'red').save(out, 'JPEG', exif=exif)
+        return out.getvalue()
+    
+    def upload(self, content, name='photo.jpg'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('profile'), {
+                'full_name': 'Employee', 'email': 'employee@test.com',
+                'profile_picture': SimpleUploadedFile(name, content),
+            })
+    
+    def test_upload_is_normalized(self):
+        """Test the picture is upright, capped, metadata-free WebP with square avatars"""
+        self.upload(self.phone_photo())
+        self.employee.refresh_from_db()
+        with Image.open(self.employee.profile_picture.path) as picture:
+            self.assertEqual((picture.format, picture.size), ('WEBP', (512, 1024)))
+            self.assertFalse(picture.getexif())
+        for size in User.AVATAR_SIZES:
+            avatar = getattr(self.employee, f'avatar_{size}')
+            with Image.open(avatar.path) as image:
+                self.assertEqual((image.format, image.size), ('WEBP', (size, size)))
+            self.assertEqual(StoredBlob.objects.get(name=avatar.name).ref_count, 1)
+        self.assertEqual(self.employee.avatar_url(40), self.employee.avatar_48.url)
+        self.assertEqual(self.employee.avatar_url(64), self.employee.avatar_96.url)
+        self.assertEqual(self.employee.avatar_large_url, self.employee.avatar_256.url)
+    
+    def test_pages_load_small_avatars(self):
+        """Test the sidebar and chat contact list link avatars, not the picture"""
+        self.upload(self.phone_photo())
+        self.employee.refresh_from_db()
+        response = self.client.get(reverse('employee_dashboard'))
+        self.assertContains(response, f'src="{self.employee.avatar_48.url}"')
+        self.assertNotContains(response, f'src="{self.employee.profile_picture.url}"')
+        self.client.force_login(self.manager)
+        users = self.client.get(reverse('get_chat_users')).json()['users']
+        self.assertEqual(users[0]['avatar_url'], self.employee.avatar_48.url)
+        self.assertEqual(users[0]['avatar_2x_url'], self.employee.avatar_96.url)
+    
+    def test_invalid_image_is_refused(self):
+        """Test a file Pillow cannot decode leaves the profile unchanged"""
+        response = self.upload(b'not an image', name='photo.png')
+        self.employee.refresh_from_db()
+        self.assertFalse(self.employee.profile_picture)
+        self.assertIn('must be an image', [str(m) for m in response.wsgi_request._messages][0])
+    
+    def test_replacing_picture_releases_old_files(self):
+        """Test a new picture drops the blobs of the old picture and avatars"""
+        self.upload(self.phone_photo())
+        self.employee.refresh_from_db()
+        old = [self.employee.profile_picture.name, self.employee.avatar_48.name]
+        self.upload(image_bytes((300, 300)), name='new.png')
+        for name in old:
+            self.assertFalse(default_storage.exists(name))
+            self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+    
+    def test_build_avatars_backfills(self):
+        """Test pictures stored before the pipeline get normalized with avatars"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.profile_picture = SimpleUploadedFile('old.jpg', self.phone_photo())
+            self.employee.save()
+        original = self.employee.profile_picture.name
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_avatars', stdout=out)
+        self.assertIn('Built avatars for 1 users, 0 failed', out.getvalue())
+        self.employee.refresh_from_db()
+        self.assertTrue(self.employee.avatar_256)
+        self.assertTrue(self.employee.profile_picture.name.endswith('.webp'))
+        self.assertFalse(default_storage.exists(original))
+        # Nothing left to do on a second run
+        call_command('build_avatars', stdout=out)
+        self.assertIn('Built avatars for 0 users', out.getvalue())
+
+
+class ConversationTests(QueryBudgetTestMixin, TestCase):
+    """Test cases for conversations and their denormalized last message and read cursors"""
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', full_name='Manager', role='manager')
+        self.employee = User.objects.create_user(
+            email='employee@test.com', full_name='Employee', role='employee', manager=self.manager
+        )
+        self.colleague = User.objects.create_user(
+            email='colleague@test.com', full_name='Colleague', role='employee', manager=self.manager
+        )
+    
+    def send(self, sender, receiver, text):
+        self.client.force_login(sender)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('send_message'), {'receiver_id': receiver.id, 'message': text}, content_type='application/json'
+            )
+        return response.json()['message']['id']
+    
+    def test_messages_share_the_pair_conversation(self):
+        """Test both directions land in one conversation keyed by the ordered pair"""
+        first = self.send(self.employee, self.manager, 'Hello')
+        second = self.send(self.manager, self.employee, 'Hi')
+        conversation = Conversation.objects.get()
+        low, high = sorted([self.manager.id, self.employee.id])
+        self.assertEqual((conversation.user_low_id, conversation.user_high_id), (low, high))
+        self.assertEqual(set(conversation.messages.values_list('id', flat=True)), {first, second})
+        self.assertEqual(conversation.last_message_id, second)
+        self.assertEqual(conversation.last_activity, ChatMessage.objects.get(pk=second).created_at)
+        # Senders have seen their own messages; the employee has not opened the reply yet
+        self.assertEqual(conversation.read_id(self.manager), second)
+        self.assertEqual(conversation.read_id(self.employee), first)
+    
+    def test_last_message_never_moves_back(self):
+        """Test recording an older message (a late concurrent commit) keeps the newer one"""
+        older = ChatMessage.objects.create(sender=self.employee, receiver=self.manager, message='Older')
+        newer = ChatMessage.objects.create(sender=self.employee, receiver=self.manager, message='Newer')
+        Conversation.objects.record_message(older)
+        self.assertEqual(Conversation.objects.get().last_message_id, newer.id)
+    
+    def test_reading_moves_the_cursor(self):
+        """Test opening and polling a thread advance the reader's cursor and report the other's"""
+        first = self.send(self.employee, self.manager, 'One')
+        self.client.force_login(self.manager)
+        data = self.client.get(reverse('get_messages', args=[self.employee.id])).json()
+        self.assertEqual(data['other_read_id'], first)
+        self.assertEqual(Conversation.objects.get().read_id(self.manager), first)
+        second = self.send(self.employee, self.manager, 'Two')
+        self.client.force_login(self.manager)
+        self.client.get(reverse('check_new_messages', args=[self.employee.id]) + f'?last_id={first}')
+        self.assertEqual(Conversation.objects.get().read_id(self.manager), second)
+    
+    def test_inbox_sorted_by_activity_with_preview(self):
+        """Test the contact list puts the latest conversation first with its last message"""
+        self.send(self.employee, self.manager, 'Old news')
+        self.send(self.colleague, self.manager, 'x' * 200)
+        self.client.force_login(self.manager)
+        users = self.client.get(reverse('get_chat_users')).json()['users']
+        self.assertEqual([u['email'] for u in users], ['colleague@test.com', 'employee@test.com'])
+        self.assertEqual(users[0]['last_message'], 'x' * 80)
+        self.assertEqual(users[1]['last_message'], 'Old news')
+        self.assertIsNotNone(users[0]['last_activity'])
+    
+    def test_thread_and_inbox_stay_constant(self):
+        """Test opening a thread and the inbox cost the same for any number of messages"""
+        for i in range(3):
+            self.send(self.employee, self.manager, f'Message {i}')
+        self.client.force_login(self.manager)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('get_messages', args=[self.employee.id]))
+            self.client.get(reverse('get_chat_users'))
+        for i in range(10):
+            self.send(self.employee, self.manager, f'More {i}')
+            self.send(self.colleague, self.manager, f'More {i}')
+        self.client.force_login(self.manager)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('get_messages', args=[self.employee.id]))
+            self.client.get(reverse('get_chat_users'))
+        self.assertEqual(len(few), len(many))
+
+
+class ConversationMigrationTests(TransactionTestCase):
+    """Test cases for the migration that files existing messages under conversations"""
+    
+    before = [('accounts', '0015_user_avatars')]
+    
+    def tearDown(self):
+        # Leave the schema as the rest of the suite expects it
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+    
+    def test_backfill_and_required_conversation(self):
+        """Test messages saved before conversations get one each, with last message and read cursors"""
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old_apps = executor.loader.project_state(self.before).apps
+        OldUser = old_apps.get_model('accounts', 'User')
+        OldMessage = old_apps.get_model('accounts', 'ChatMessage')
+        manager = OldUser.objects.create(email='manager@test.com', role='manager')
+        employee = OldUser.objects.create(email='employee@test.com', role='employee')
+        read = OldMessage.objects.create(sender=employee, receiver=manager, message='Read', is_read=True)
+        unread = OldMessage.objects.create(sender=employee, receiver=manager, message='Unread')
+        
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        conversation = Conversation.objects.get()
+        self.assertEqual(ChatMessage.objects.filter(conversation=conversation).count(), 2)
+        self.assertEqual(conversation.last_message_id, unread.id)
+        self.assertEqual(conversation.read_id(manager.id), read.id)
+        self.assertEqual(conversation.read_id(employee.id), unread.id)
+        self.assertFalse(ChatMessage._meta.get_field('conversation').null)
+
+
+class MessageSerializerTests(TestCase):
+    """Test cases for the shared .values()-based chat message serializer"""
+    
+    def setUp(self):
+        self.manager = User.objects.create_user(email='manager@test.com', role='manager')
+        self.employee = User.objects.create_user(
+            email='employee@test.com', full_name='Employee', role='employee', manager=self.manager
+        )
+        digest = 'ab' * 32
+        self.messages = [
+            ChatMessage.objects.create(sender=self.employee, receiver=self.manager, message='Plain'),
+            ChatMessage.objects.create(
+                sender=self.manager, receiver=self.employee, attachment=f'blobs/ab/ab/{digest}.png',
+                attachment_name='photo.png', attachment_mime='image/png', attachment_size=2048,
+                attachment_width=640, attachment_height=480, attachment_thumbnail=f'blobs/cd/cd/{"cd" * 32}.webp',
+            ),
+            ChatMessage.objects.create(
+                sender=self.manager, receiver=self.employee, attachment='chat_attachments/old.PDF',
+            ),
+        ]
+        # Spread over times of day, including midnight and noon
+        for msg, hour in zip(self.messages, (0, 12, 23)):
+            msg.created_at = timezone.now().replace(hour=hour, minute=5) - timedelta(days=hour)
+        ChatMessage.objects.bulk_update(self.messages, ['created_at'])
+    
+    def test_matches_model_based_payload(self):
+        """Test payloads equal the ones the views built from model instances"""
+        from .management.commands.benchmark_chat_serializer import legacy_payload
+        rows = serializers.message_values(ChatMessage.objects.order_by('id'))
+        self.assertEqual(
+            serializers.MessageSerializer(self.employee.id).serialize_many(rows),
+            [legacy_payload(msg, self.employee) for msg in ChatMessage.objects.order_by('id')]
+        )
+        data = serializers.MessageSerializer(self.employee.id).serialize(
+            serializers.instance_values(ChatMessage.objects.select_related('sender').get(pk=self.messages[1].pk))
+        )
+        self.assertTrue(data['attachment_url'].endswith(f'/chat/attachments/{self.messages[1].id}/?v=abababababab'))
+        self.assertEqual((data['is_image'], data['is_mine']), (True, False))
+    
+    def test_thread_page_is_one_query(self):
+        """Test a page with its senders loads in a single query"""
+        with self.assertNumQueries(1):
+            serializers.MessageSerializer(self.manager.id).serialize_many(
+                serializers.message_values(ChatMessage.objects.all())
+            )
+    
+    def test_json_fallback_without_orjson(self):
+        """Test responses encode the same with and without the optional orjson"""
+        page = serializers.MessageSerializer(self.manager.id).serialize_many(
+            serializers.message_values(ChatMessage.objects.all())
+        )
+        with patch.object(serializers, 'orjson', None):
+            plain = serializers.json_response({'messages': page})
+        self.assertEqual(json.loads(plain.content), json.loads(serializers.json_response({'messages': page}).content))
+        self.assertEqual(plain['Content-Type'], 'application/json')
+    
+    def test_benchmark_command(self):
+        """Test the benchmark runs and leaves no rows behind"""
+        out = StringIO()
+        call_command('benchmark_chat_serializer', messages=50, repeat=1, stdout=out)
+        self.assertIn('instances + json (before)', out.getvalue())
+        self.assertIn('Serialized 50 messages', out.getvalue())
+        self.assertEqual(ChatMessage.objects.count(), 3)
+        self.assertFalse(User.objects.filter(email__startswith='benchmark-').exists())
@@ -0,0 +1,149 @@
+"""
+CHUNKED CHAT UPLOADS - Resumable, size-limited attachment uploads
+
+    POST /chat/uploads/                    declare name, size and type
+    PUT  /chat/uploads/<id>/?offset=N      send the bytes from offset N
+    GET  /chat/uploads/<id>/               how far the upload got (resume)
+    POST /chat/uploads/<id>/complete/      send it as a chat message
+
+Limits are checked before a byte is accepted: the declared size and type
+when the upload starts, the chunk length (from Content-Length) and the
+offset before each chunk body is read, and the real type (magic bytes)
+of the first chunk before it is written. Bodies are read from the request
+stream in small pieces and written straight into the attachment's final
+file, so memory stays flat and nothing goes through Django's upload
+handlers or temp files. An interrupted chunk keeps the bytes that did
+arrive; the client asks for the offset and carries on from there.
+
+Writing at an offset needs a local filesystem storage (storage.path()).
+Completing links the file into the content-addressed store (storage.py),
+hashing it from disk, so a file already sent before is not kept twice;
+the upload's own file goes when the message commits.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .attachments import SNIFF_BYTES, sniff_mime
+from .models import ChatUpload
+from .storage import blob_storage
+
+READ_SIZE = 64 * 1024
+UPLOAD_DIR = 'chat_attachments'
+
+
+class UploadError(Exception):
+    """Refused upload or chunk; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_file(size, content_type):
+    """Raise UploadError unless a file of this size and type may be attached"""
+    if size > settings.CHAT_UPLOAD_MAX_BYTES:
+        raise UploadError(f'Files can be at most {settings.CHAT_UPLOAD_MAX_BYTES // (1024 * 1024)} MB', status=413)
+    if content_type not in settings.CHAT_UPLOAD_ALLOWED_TYPES:
+        raise UploadError(f'{content_type or "This file type"} cannot be attached', status=415)
+
+
+def start_upload(owner, file_name, size, content_type):
+    """Validate the declared file and create its empty final file. Returns the ChatUpload"""
+    if not file_name or size <= 0:
+        raise UploadError('file_name and a positive size are required')
+    check_file(size, content_type)
+    _, ext = os.path.splitext(get_valid_filename(os.path.basename(file_name)) or 'file')
+    upload = ChatUpload(owner=owner, file_name=file_name[:255], content_type=content_type, size=size)
+    upload.path = default_storage.save(f'{UPLOAD_DIR}/{upload.id.hex}{ext[:10].lower()}', ContentFile(b''))
+    upload.save()
+    return upload
+
+
+def write_chunk(upload, offset, length, stream):
+    """
+    Write `length` bytes read from `stream` at `offset` of the upload's
+    file and advance upload.received. Returns the number of bytes written
+    (fewer than `length` if the client went away mid-chunk)
+    """
+    if offset != upload.received:
+        raise UploadError(f'Expected offset {upload.received}', status=409)
+    if length <= 0:
+        raise UploadError('Content-Length is required', status=411)
+    if length > settings.CHAT_UPLOAD_CHUNK_BYTES:
+        raise UploadError(f'Chunks can be at most {settings.CHAT_UPLOAD_CHUNK_BYTES} bytes', status=413)
+    if offset + length > upload.size:
+        raise UploadError('Chunk goes past the declared size', status=413)
+
+    written = 0
+    rejected = False
+    with open(default_storage.path(upload.path), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            piece = stream.read(min(READ_SIZE, length - written))
+            if not piece:
+                break
+            if offset == 0 and written == 0:
+                piece = _read_head(piece, stream, min(SNIFF_BYTES, length))
+                rejected = sniff_mime(piece[:SNIFF_BYTES]) != upload.content_type
+                if rejected:
+                    break
+            f.write(piece)
+            written += len(piece)
+    if rejected:
+        # First bytes are not the declared type: nothing of this upload is kept
+        discard(upload)
+        raise UploadError(f'File content is not {upload.content_type}', status=415)
+
+    # Conditional on the offset: a concurrent retry of the same chunk only counts once
+    advanced = ChatUpload.objects.filter(pk=upload.pk, received=offset).update(
+        received=offset + written, updated_at=timezone.now()
+    )
+    if not advanced:
+        raise UploadError('Chunk was already received', status=409)
+    upload.received = offset + written
+    return written
+
+
+def _read_head(piece, stream, needed):
+    """Extend the first piece to `needed` bytes so the magic bytes can be checked"""
+    while len(piece) < needed:
+        more = stream.read(needed - len(piece))
+        if not more:
+            break
+        piece += more
+    return piece
+
+
+def finish_upload(upload):
+    """
+    Put a complete upload's file into blob storage and return its blob
+    name. The upload's own file is only deleted once the caller's
+    transaction commits: after a rollback the upload can be completed again
+    """
+    name = blob_storage.adopt(default_storage.path(upload.path), move=False)
+    transaction.on_commit(lambda: default_storage.delete(upload.path))
+    return name
+
+
+def discard(upload):
+    """Delete an unfinished upload and its partial file"""
+    default_storage.delete(upload.path)
+    upload.delete()
+
+
+def expire_stale(max_age=None):
+    """Discard unfinished uploads untouched for CHAT_UPLOAD_EXPIRY. Returns how many"""
+    max_age = max_age or timedelta(seconds=settings.CHAT_UPLOAD_EXPIRY)
+    stale = ChatUpload.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in stale.iterator():
+        discard(upload)
+        count += 1
+    return count
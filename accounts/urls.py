@@ -12,15 +12,27 @@ urlpatterns = [
     path('leaves/request/', views.request_leave, name='request_leave'),
     path('leaves/my-leaves/', views.my_leaves, name='my_leaves'),
     path('leaves/all/', views.all_leaves, name='all_leaves'),
+    path('leaves/export/', views.export_leaves, name='export_leaves'),
     path('leaves/approve/<int:leave_id>/', views.approve_leave, name='approve_leave'),
+    path('leaves/bulk-decide/', views.bulk_decide_leaves, name='bulk_decide_leaves'),
     path('leaves/cancel/<int:leave_id>/', views.cancel_leave, name='cancel_leave'),
     path('leaves/history/', views.team_history, name='team_history'),
+    path('leaves/calendar/', views.team_calendar, name='team_calendar'),
+    path('leaves/absences/', views.team_absences_api, name='team_absences_api'),
+    path('leaves/report/', views.leave_report, name='leave_report'),
     # Chat URLs
     path('chat/', views.chat_page, name='chat_page'),
     path('chat/users/', views.get_chat_users, name='get_chat_users'),
     path('chat/messages/<int:user_id>/', views.get_messages, name='get_messages'),
     path('chat/send/', views.send_message, name='send_message'),
+    path('chat/attachments/<int:message_id>/', views.chat_attachment, name='chat_attachment'),
+    path('chat/attachments/<int:message_id>/thumbnail/', views.chat_attachment, {'thumbnail': True},
+         name='chat_attachment_thumbnail'),
+    path('chat/uploads/', views.start_chat_upload, name='start_chat_upload'),
+    path('chat/uploads/<uuid:upload_id>/', views.chat_upload, name='chat_upload'),
+    path('chat/uploads/<uuid:upload_id>/complete/', views.complete_chat_upload, name='complete_chat_upload'),
     path('chat/check/<int:user_id>/', views.check_new_messages, name='check_new_messages'),
+    path('chat/stream/', views.chat_stream, name='chat_stream'),
     # User management
     path('users/delete/<int:user_id>/', views.delete_user, name='delete_user'),
 ]
@@ -0,0 +1,194 @@
+"""
+BULK USER IMPORT - Load users from CSV in batches
+
+CSV columns (header row required, only email is mandatory):
+    email, full_name, phone, department, role, manager, password
+
+Rows are read as a stream and handled in batches: passwords are hashed
+in a process pool (PBKDF2 is deliberately slow, so this is where the
+time goes), then the batch goes in with one bulk_create. `manager` holds
+the manager's email, which may be an existing user or someone later in
+the same file, so it is resolved in a second pass with bulk_update.
+
+bulk_create skips model signals, so leave balances are provisioned per
+batch and dashboard stats and cached dashboards are updated at the end.
+"""
+import csv
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from . import dashboard_cache, services
+from .models import DashboardStats, User
+
+DEFAULT_BATCH_SIZE = 1000
+ROLES = {role for role, _ in User.ROLE_CHOICES}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.existing = 0
+        self.errors = []  # (line number, message)
+        self.unknown_managers = []  # (email, manager email)
+
+
+def _init_worker():
+    # Spawned workers (macOS/Windows) start without Django configured
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password)
+
+
+class _Hasher:
+    """Hash a batch of passwords in a process pool, or inline with workers=1"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+
+    def __call__(self, passwords):
+        if self.pool is None:
+            return [_hash(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.pool.map(_hash, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def _clean_row(row):
+    """Return the cleaned fields of a CSV row, or raise ValueError"""
+    email = User.objects.normalize_email((row.get('email') or '').strip())
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise ValueError(f'invalid email {email!r}')
+    role = (row.get('role') or 'employee').strip().lower()
+    if role not in ROLES:
+        raise ValueError(f'unknown role {role!r}')
+    fields = {
+        'email': email,
+        'full_name': (row.get('full_name') or '').strip(),
+        'phone': (row.get('phone') or '').strip(),
+        'department': (row.get('department') or '').strip(),
+        'role': role,
+        'password': row.get('password') or None,
+        'manager': User.objects.normalize_email((row.get('manager') or '').strip()),
+    }
+    return fields
+
+
+def import_users(path, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """
+    Import users from the CSV at `path` in one transaction. Existing
+    emails are skipped, bad rows are reported and skipped. Returns an
+    ImportResult
+    """
+    workers = workers or os.cpu_count() or 1
+    result = ImportResult()
+    manager_links = []  # (user email, manager email), resolved after every row is in
+    created_by_role = Counter()
+    hasher = _Hasher(workers)
+    try:
+        with transaction.atomic(), open(path, newline='', encoding='utf-8-sig') as f:
+            seen = set()
+            batch = []
+            # Header is line 1, so the first data row is line 2
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    fields = _clean_row(row)
+                except ValueError as exc:
+                    result.errors.append((line, str(exc)))
+                    continue
+                if fields['email'] in seen:
+                    result.errors.append((line, f"duplicate email {fields['email']}"))
+                    continue
+                seen.add(fields['email'])
+                batch.append(fields)
+                if len(batch) == batch_size:
+                    _insert_batch(batch, hasher, result, manager_links, created_by_role)
+                    batch = []
+            if batch:
+                _insert_batch(batch, hasher, result, manager_links, created_by_role)
+
+            manager_ids = _link_managers(manager_links, batch_size, result)
+            _refresh_denormalized(created_by_role, manager_ids)
+    finally:
+        hasher.close()
+    return result
+
+
+def _insert_batch(batch, hasher, result, manager_links, created_by_role):
+    existing = set(
+        User.objects.filter(email__in=[fields['email'] for fields in batch]).values_list('email', flat=True)
+    )
+    rows = [fields for fields in batch if fields['email'] not in existing]
+    result.existing += len(batch) - len(rows)
+    if not rows:
+        return
+
+    # Blank passwords become unusable ones; those need no pool round trip
+    to_hash = [fields['password'] for fields in rows if fields['password']]
+    hashes = iter(hasher(to_hash))
+    now = timezone.now()
+    users = [
+        User(
+            email=fields['email'],
+            full_name=fields['full_name'],
+            phone=fields['phone'],
+            department=fields['department'],
+            password=next(hashes) if fields['password'] else make_password(None),
+            date_joined=now,
+        )
+        for fields in rows
+    ]
+    for user, fields in zip(users, rows):
+        # Same staff/superuser flags as signing up with the role
+        user.set_role(fields['role'])
+    User.objects.bulk_create(users)
+    created_by_role.update(user.role for user in users)
+    manager_links.extend((fields['email'], fields['manager']) for fields in rows if fields['manager'])
+    result.created += len(users)
+    services.provision_leave_balances(
+        timezone.now().year, employee_ids=[user.pk for user in users if user.role == 'employee']
+    )
+
+
+def _link_managers(links, batch_size, result):
+    """Second pass: point imported users at their managers. Returns the manager ids"""
+    manager_ids = set()
+    for start in range(0, len(links), batch_size):
+        chunk = links[start:start + batch_size]
+        emails = {email for link in chunk for email in link}
+        ids = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+        users = []
+        for email, manager_email in chunk:
+            manager_id = ids.get(manager_email)
+            if manager_id is None:
+                result.unknown_managers.append((email, manager_email))
+                continue
+            # Freshly imported: no leave requests yet whose team_manager would need moving
+            users.append(User(pk=ids[email], manager_id=manager_id))
+            manager_ids.add(manager_id)
+        User.objects.bulk_update(users, ['manager'])
+    return manager_ids
+
+
+def _refresh_denormalized(created_by_role, manager_ids):
+    DashboardStats.objects.adjust(
+        total_users=sum(created_by_role.values()),
+        **{DashboardStats.objects.ROLE_FIELDS[role]: count for role, count in created_by_role.items()}
+    )
+    # Team lists of the managers changed
+    transaction.on_commit(lambda: dashboard_cache.invalidate_many(manager_ids))
@@ -1,13 +1,29 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from asgiref.sync import sync_to_async
+from datetime import date, timedelta
 import json
+import os
+from . import (
+    absences, attachments, avatars, dashboard_cache, exports, media, realtime, serializers, services, storage, uploads,
+    workdays
+)
 from .forms import LeaveRequestForm, ProfileUpdateForm
-from .models import User, LeaveRequest, LeaveBalance, LeaveType, ChatMessage
+from .pagination import keyset_paginate
+from .models import (
+    User, LeaveRequest, LeaveBalance, LeaveType, ChatMessage, ChatUpload, Conversation, UnreadCounter, DashboardStats,
+    LeaveRollup
+)
 
 
 def home(request):
@@ -30,62 +46,53 @@ def admin_dashboard(request):
         messages.error(request, 'Access denied. Admin only.')
         return redirect('account_login')
     
-    total_users = User.objects.count()
-    total_employees = User.objects.filter(role='employee').count()
-    total_managers = User.objects.filter(role='manager').count()
-    pending_leaves = LeaveRequest.objects.filter(status='pending').count()
+    # Materialized totals: one row, kept current by signals (see signals.py)
+    stats = DashboardStats.objects.current()
     
-    recent_leaves = LeaveRequest.objects.all()[:10]
+    recent_leaves = LeaveRequest.objects.with_related()[:10]
     recent_users = User.objects.all()[:5]
     
     context = {
-        'total_users': total_users,
-        'total_employees': total_employees,
-        'total_managers': total_managers,
-        'pending_leaves': pending_leaves,
+        'total_users': stats.total_users,
+        'total_employees': stats.total_employees,
+        'total_managers': stats.total_managers,
+        'pending_leaves': stats.pending_leaves,
         'recent_leaves': recent_leaves,
         'recent_users': recent_users,
     }
     return render(request, 'dashboards/admin_dashboard.html', context)
 
 
-@login_required
-def manager_dashboard(request):
-    if request.user.role != 'manager':
-        messages.error(request, 'Access denied. Manager only.')
-        return redirect('account_login')
+def _manager_dashboard_context(manager):
+    """Fully evaluated so it can be stored in the dashboard cache"""
+    # Only the columns the team list shows: cached users must not carry password hashes
+    role_names = dict(User.ROLE_CHOICES)
+    team_members = [
+        {**member, 'role_display': role_names.get(member['role'], member['role'])}
+        for member in User.objects.filter(manager=manager).values('id', 'full_name', 'email', 'role')
+    ]
+    pending_leaves = absences.attach_conflicts(manager, list(
+        LeaveRequest.objects.for_manager(manager).filter(status='pending').with_related()
+    ))
     
-    team_members = User.objects.filter(manager=request.user)
-    pending_leaves = LeaveRequest.objects.filter(
-        employee__manager=request.user,
-        status='pending'
-    )
-    
-    team_leaves = LeaveRequest.objects.filter(
-        employee__manager=request.user
-    )[:10]
+    team_leaves = list(LeaveRequest.objects.for_manager(manager).with_related()[:10])
     
-    context = {
+    return {
         'team_members': team_members,
         'pending_leaves': pending_leaves,
         'team_leaves': team_leaves,
-        'pending_count': pending_leaves.count(),
-        'team_count': team_members.count(),
+        'pending_count': len(pending_leaves),
+        'team_count': len(team_members),
     }
-    return render(request, 'dashboards/manager_dashboard.html', context)
 
 
-@login_required
-def employee_dashboard(request):
-    if request.user.role != 'employee':
-        messages.error(request, 'Access denied. Employee only.')
-        return redirect('home')
-    
-    my_leaves = LeaveRequest.objects.filter(employee=request.user)
-    leave_balances = LeaveBalance.objects.filter(
-        employee=request.user,
+def _employee_dashboard_context(employee):
+    """Fully evaluated so it can be stored in the dashboard cache"""
+    my_leaves = LeaveRequest.objects.for_employee(employee)
+    leave_balances = list(LeaveBalance.objects.filter(
+        employee=employee,
         year=timezone.now().year
-    )
+    ).select_related('leave_type'))
     
     for balance in leave_balances:
         if balance.total_days > 0:
@@ -93,23 +100,50 @@ def employee_dashboard(request):
         else:
             balance.percentage = 0
     
-    pending_count = my_leaves.filter(status='pending').count()
-    approved_count = my_leaves.filter(status='approved').count()
+    # All three counters in one aggregate query
+    counts = my_leaves.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        approved=Count('id', filter=Q(status='approved')),
+    )
     
-    context = {
-        'my_leaves': my_leaves[:10],
+    return {
+        'my_leaves': list(my_leaves.with_related()[:10]),
         'leave_balances': leave_balances,
-        'pending_count': pending_count,
-        'approved_count': approved_count,
-        'total_requests': my_leaves.count(),
+        'pending_count': counts['pending'],
+        'approved_count': counts['approved'],
+        'total_requests': counts['total'],
     }
+
+
+@login_required
+def manager_dashboard(request):
+    if request.user.role != 'manager':
+        messages.error(request, 'Access denied. Manager only.')
+        return redirect('account_login')
+    
+    context = dashboard_cache.get_or_build(
+        'manager', request.user.id, lambda: _manager_dashboard_context(request.user)
+    )
+    return render(request, 'dashboards/manager_dashboard.html', context)
+
+
+@login_required
+def employee_dashboard(request):
+    if request.user.role != 'employee':
+        messages.error(request, 'Access denied. Employee only.')
+        return redirect('home')
+    
+    context = dashboard_cache.get_or_build(
+        'employee', request.user.id, lambda: _employee_dashboard_context(request.user)
+    )
     return render(request, 'dashboards/employee_dashboard.html', context)
 
 
 @login_required
 def request_leave(request):
     if request.method == 'POST':
-        form = LeaveRequestForm(request.POST)
+        form = LeaveRequestForm(request.POST, employee=request.user)
         if form.is_valid():
             leave_request = form.save(commit=False)
             leave_request.employee = request.user
@@ -123,15 +157,21 @@ def request_leave(request):
             messages.success(request, 'Leave request submitted successfully!')
             return redirect('employee_dashboard')
     else:
-        form = LeaveRequestForm()
+        form = LeaveRequestForm(employee=request.user)
     
-    return render(request, 'leaves/request_leave.html', {'form': form})
+    context = {
+        'form': form,
+        # The duration preview counts days with the same calendar the form saves with
+        'workday_calendar': workdays.preview_calendar(request.user),
+    }
+    return render(request, 'leaves/request_leave.html', context)
 
 
 @login_required
 def my_leaves(request):
-    leaves = LeaveRequest.objects.filter(employee=request.user)
-    return render(request, 'leaves/my_leaves.html', {'leaves': leaves})
+    leaves = LeaveRequest.objects.for_employee(request.user).with_related()
+    page = keyset_paginate(request, leaves, 'created_at')
+    return render(request, 'leaves/my_leaves.html', {'leaves': page.items, 'page': page})
 
 
 @login_required
@@ -143,22 +183,55 @@ def all_leaves(request):
     status_filter = request.GET.get('status', '')
     
     if request.user.role == 'admin':
-        leaves = LeaveRequest.objects.all()
+        leaves = LeaveRequest.objects.with_related()
     else:
-        leaves = LeaveRequest.objects.filter(employee__manager=request.user)
+        leaves = LeaveRequest.objects.for_manager(request.user).with_related()
     
     if status_filter:
         leaves = leaves.filter(status=status_filter)
     
-    leaves = leaves.order_by('-created_at')
+    # Keyset pagination on (created_at, id), newest first
+    page = keyset_paginate(request, leaves, 'created_at')
     
     context = {
-        'leaves': leaves,
+        'leaves': page.items,
+        'page': page,
         'status_filter': status_filter,
     }
     return render(request, 'leaves/all_leaves.html', context)
 
 
+@login_required
+def export_leaves(request):
+    """
+    Stream leave history as CSV (default) or JSON Lines. Admins get every
+    request, managers their team. Filters: ?start=&end=&status=&department=
+    """
+    if request.user.role not in ['admin', 'manager']:
+        messages.error(request, 'Access denied.')
+        return redirect('account_login')
+    
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.EXPORT_FORMATS:
+        return HttpResponse('format must be csv or jsonl', status=400, content_type='text/plain')
+    try:
+        filters = exports.parse_filters(request.GET)
+    except ValueError as exc:
+        return HttpResponse(str(exc), status=400, content_type='text/plain')
+    
+    if request.user.role == 'admin':
+        leaves = LeaveRequest.objects.all()
+    else:
+        leaves = LeaveRequest.objects.for_manager(request.user)
+    
+    rows = exports.export_rows(leaves, **filters)
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(exports.render_lines(rows, fmt), content_type=content_type)
+    filename = f"leaves-{timezone.now():%Y%m%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @login_required
 def approve_leave(request, leave_id):
     # Only managers can approve/reject leaves, not admin
@@ -168,50 +241,79 @@ def approve_leave(request, leave_id):
             return redirect('admin_dashboard')
         return redirect('account_login')
     
-    leave_request = get_object_or_404(LeaveRequest, id=leave_id)
+    leave_request = get_object_or_404(LeaveRequest.objects.select_related('employee'), id=leave_id)
     
     # Verify the leave request is from manager's team
-    if leave_request.employee.manager != request.user:
+    if leave_request.employee.manager_id != request.user.id:
         messages.error(request, 'You can only approve leaves from your team members.')
         return redirect('manager_dashboard')
     
     if request.method == 'POST':
         action = request.POST.get('action')
         
-        if action == 'approve':
-            leave_request.status = 'approved'
-            leave_request.approved_by = request.user
-            leave_request.save()
-            messages.success(request, f'Leave request approved for {leave_request.employee.full_name}')
-            
-            try:
-                balance = LeaveBalance.objects.get(
-                    employee=leave_request.employee,
-                    leave_type=leave_request.leave_type,
-                    year=timezone.now().year
-                )
-                balance.used_days += leave_request.total_days
-                balance.save()
-            except LeaveBalance.DoesNotExist:
-                pass
-        
-        elif action == 'reject':
-            leave_request.status = 'rejected'
-            leave_request.approved_by = request.user
-            leave_request.save()
-            messages.success(request, f'Leave request rejected for {leave_request.employee.full_name}')
+        if action in ('approve', 'reject'):
+            if services.decide_leave(leave_request, request.user, approve=action == 'approve'):
+                verb = 'approved' if action == 'approve' else 'rejected'
+                messages.success(request, f'Leave request {verb} for {leave_request.employee.full_name}')
+            else:
+                messages.error(request, 'This leave request has already been processed.')
         
         return redirect('manager_dashboard')
     
     return redirect('manager_dashboard')
 
 
+BULK_DECIDE_MAX = 200
+
+
+@login_required
+@require_POST
+def bulk_decide_leaves(request):
+    """
+    Approve or reject a batch of pending requests (leave_ids + action) in
+    one transaction. JSON clients get the summary as JSON, the dashboard
+    form gets it as a flash message
+    """
+    wants_json = 'application/json' in request.headers.get('Accept', '')
+    
+    def respond(summary=None, error=None, status=200):
+        if wants_json:
+            return JsonResponse({'error': error} if error else summary, status=status)
+        if error:
+            messages.error(request, error)
+        else:
+            messages.success(request, f"{len(summary['decided'])} leave request(s) {summary['action']}.")
+            skipped = len(summary['not_pending']) + len(summary['not_found'])
+            if skipped:
+                messages.warning(request, f'{skipped} request(s) skipped: already processed or not in your team.')
+        return redirect('manager_dashboard')
+    
+    if request.user.role != 'manager':
+        return respond(error='Only managers can approve or reject leave requests.', status=403)
+    
+    action = request.POST.get('action')
+    try:
+        leave_ids = [int(leave_id) for leave_id in request.POST.getlist('leave_ids')]
+    except ValueError:
+        return respond(error='Invalid leave id.', status=400)
+    if action not in ('approve', 'reject') or not leave_ids:
+        return respond(error='Select at least one request and an action.', status=400)
+    if len(leave_ids) > BULK_DECIDE_MAX:
+        return respond(error=f'At most {BULK_DECIDE_MAX} requests can be processed at once.', status=400)
+    
+    try:
+        summary = services.decide_leaves(request.user, leave_ids, approve=action == 'approve')
+    except services.LeaveConflict as exc:
+        return respond(error=str(exc), status=409)
+    return respond(summary)
+
+
 @login_required
 def cancel_leave(request, leave_id):
     leave_request = get_object_or_404(LeaveRequest, id=leave_id, employee=request.user)
     
-    if leave_request.status == 'pending':
-        leave_request.delete()
+    # Conditional delete: a manager may approve it between the read and here
+    if LeaveRequest.objects.filter(pk=leave_request.pk, status='pending').delete()[0]:
         messages.success(request, 'Leave request cancelled and removed!')
     else:
         messages.error(request, 'Only pending requests can be cancelled.')
@@ -227,28 +329,136 @@ def team_history(request):
     
     status_filter = request.GET.get('status', '')
     
-    team_leaves = LeaveRequest.objects.filter(
-        employee__manager=request.user
-    ).order_by('-created_at')
+    team_leaves = LeaveRequest.objects.for_manager(request.user).with_related(reason=True)
     
     if status_filter:
         team_leaves = team_leaves.filter(status=status_filter)
     
+    page = keyset_paginate(request, team_leaves, 'created_at')
+    
     context = {
-        'team_leaves': team_leaves,
+        'team_leaves': page.items,
+        'page': page,
         'status_filter': status_filter,
     }
     return render(request, 'leaves/team_history.html', context)
 
 
+def _month_param(request, name, default):
+    """First day of the ?name=YYYY-MM month, or `default` if missing or invalid"""
+    try:
+        year, month = (int(part) for part in request.GET.get(name, '').split('-'))
+        return date(year, month, 1)
+    except ValueError:
+        return default
+
+
+@login_required
+def team_calendar(request):
+    if request.user.role != 'manager':
+        messages.error(request, 'Access denied. Manager only.')
+        return redirect('account_login')
+    
+    month_start = _month_param(request, 'month', timezone.now().date().replace(day=1))
+    days, rows, next_month = absences.month_grid(request.user, month_start)
+    context = {
+        'days': days,
+        'rows': rows,
+        'month_start': month_start,
+        'previous_month': (month_start - timedelta(days=1)).replace(day=1),
+        'next_month': next_month,
+    }
+    return render(request, 'leaves/team_calendar.html', context)
+
+
+@login_required
+def team_absences_api(request):
+    """Approved and pending team leaves overlapping ?start=&end= (YYYY-MM-DD)"""
+    if request.user.role != 'manager':
+        return JsonResponse({'error': 'Manager only'}, status=403)
+    try:
+        start, end = absences.parse_window(request.GET.get('start'), request.GET.get('end'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    leaves = absences.team_absences(request.user, start, end)
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'absences': [
+            {
+                'id': leave.id,
+                'employee_id': leave.employee_id,
+                'employee_name': leave.employee.full_name or leave.employee.email,
+                'leave_type': leave.leave_type.name,
+                'start_date': leave.start_date.isoformat(),
+                'end_date': leave.end_date.isoformat(),
+                'total_days': leave.total_days,
+                'status': leave.status,
+            }
+            for leave in leaves
+        ],
+    })
+
+
+# Per-status totals over rollup rows
+REPORT_TOTALS = {
+    'pending': Sum('request_count', filter=Q(status='pending'), default=0),
+    'approved': Sum('request_count', filter=Q(status='approved'), default=0),
+    'rejected': Sum('request_count', filter=Q(status='rejected'), default=0),
+    'days_taken': Sum('total_days', filter=Q(status='approved'), default=0),
+    'days_pending': Sum('total_days', filter=Q(status='pending'), default=0),
+}
+
+
+@login_required
+def leave_report(request):
+    """
+    Requests by status and days taken per department and leave type, and
+    per month, for ?start=&end= (YYYY-MM, default this year) and an
+    optional ?department=. Reads only the rollup tables, never leave_requests
+    """
+    if request.user.role != 'admin':
+        messages.error(request, 'Access denied. Admin only.')
+        return redirect('account_login')
+    
+    this_year = timezone.now().year
+    start = _month_param(request, 'start', date(this_year, 1, 1))
+    end = _month_param(request, 'end', date(this_year, 12, 1))
+    if end < start:
+        start, end = end, start
+    department = request.GET.get('department', '').strip()
+    
+    rollups = LeaveRollup.objects.filter(month__range=(start, end)).exclude(request_count=0)
+    if department:
+        rollups = rollups.filter(department=department)
+    
+    by_type = list(
+        rollups.values('department', 'leave_type__name').annotate(**REPORT_TOTALS).order_by('department', 'leave_type__name')
+    )
+    by_month = list(rollups.values('month').annotate(**REPORT_TOTALS).order_by('month'))
+    totals = {name: sum(row[name] for row in by_month) for name in REPORT_TOTALS}
+    
+    context = {
+        'by_type': by_type,
+        'by_month': by_month,
+        'totals': totals,
+        'start': start,
+        'end': end,
+        'department': department,
+    }
+    return render(request, 'leaves/leave_report.html', context)
+
+
 @login_required
 def all_users(request):
     if request.user.role != 'admin':
         messages.error(request, 'Access denied.')
         return redirect('account_login')
     
-    users = User.objects.all()
-    return render(request, 'admin/all_users.html', {'users': users})
+    users = User.objects.select_related('manager')
+    page = keyset_paginate(request, users, 'date_joined')
+    return render(request, 'admin/all_users.html', {'users': page.items, 'page': page})
 
 
 @login_required
@@ -312,9 +522,18 @@ def profile(request):
             
             # PROFILE PICTURE UPLOAD - Uses Pillow library to handle image files
             # request.FILES contains uploaded files from form
-            # Saves to media/profiles/ folder (defined in models.py)
+            # Stored upright without metadata, plus 48/96/256px avatars (avatars.py)
             if 'profile_picture' in request.FILES:
-                user.profile_picture = request.FILES['profile_picture']
+                try:
+                    avatars.set_profile_picture(user, request.FILES['profile_picture'])
+                except avatars.InvalidImage:
+                    messages.error(request, 'Profile picture must be an image!')
+                    if request.user.role == 'employee':
+                        return redirect('employee_dashboard')
+                    elif request.user.role == 'manager':
+                        return redirect('manager_dashboard')
+                    else:
+                        return redirect('admin_dashboard')
             
             user.save()
             messages.success(request, 'Profile updated successfully!')
@@ -340,11 +559,44 @@ def profile(request):
 # CHAT FEATURE - Real-time messaging with AJAX
 # ============================================
 
+# History page size for get_messages (older pages load on scroll-up)
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+CHAT_PREVIEW_LENGTH = 80  # Characters of the last message shown in the contact list
+
+@login_required
+def chat_attachment(request, message_id, thumbnail=False):
+    """
+    CHAT ATTACHMENT DOWNLOAD: Only the sender and receiver get the file
+    Conditional requests, Range and proxy offload are handled by media.py
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    msg = get_object_or_404(
+        ChatMessage.objects.only(
+            'attachment', 'attachment_name', 'attachment_mime', 'attachment_thumbnail', 'sender_id', 'receiver_id'
+        ),
+        Q(sender=request.user) | Q(receiver=request.user),
+        pk=message_id,
+    )
+    if thumbnail:
+        field_file, content_type, file_name = msg.attachment_thumbnail, 'image/webp', ''
+    else:
+        field_file = msg.attachment
+        content_type = msg.attachment_mime or attachments.UNKNOWN_TYPE
+        file_name = msg.attachment_name or os.path.basename(field_file.name)
+    if not field_file:
+        raise Http404('No attachment')
+    # Only types the browser can show safely open inline; anything else downloads
+    inline = content_type in settings.CHAT_UPLOAD_ALLOWED_TYPES
+    return media.serve_file(request, field_file.storage, field_file.name, content_type, file_name, inline)
+
+
 @login_required
 def get_chat_users(request):
     """
     CHAT API 1: Get list of users available for chat
-    Returns JSON with user list and unread message count
+    Returns JSON with user list and unread message count (single query)
     """
     # Role-based chat access: Employees see managers, Managers see their team
     if request.user.role == 'employee':
@@ -352,16 +604,37 @@ def get_chat_users(request):
     else:
         users = User.objects.filter(manager=request.user)
     
+    # Unread badge read from the denormalized counter table in the same query
+    unread_counts = UnreadCounter.objects.filter(
+        receiver=request.user, sender=OuterRef('pk')
+    ).values('count')[:1]
+    # INBOX: last activity and a preview from each contact's conversation, in the same query
+    conversations = Conversation.objects.filter(
+        Q(user_low=request.user, user_high=OuterRef('pk')) | Q(user_low=OuterRef('pk'), user_high=request.user)
+    )
+    users = users.annotate(
+        unread=Coalesce(Subquery(unread_counts), Value(0)),
+        last_activity=Subquery(conversations.values('last_activity')[:1]),
+        last_message=Subquery(conversations.values('last_message__message')[:1]),
+        last_attachment=Subquery(conversations.values('last_message__attachment_name')[:1]),
+    ).order_by(F('last_activity').desc(nulls_last=True), 'full_name', 'email').values(
+        'id', 'full_name', 'email', 'role', 'unread', 'avatar_48', 'avatar_96',
+        'last_activity', 'last_message', 'last_attachment'
+    )
+    
     user_list = []
     for user in users:
-        # Count unread messages for badge display
-        unread = ChatMessage.objects.filter(sender=user, receiver=request.user, is_read=False).count()
         user_list.append({
-            'id': user.id,
-            'name': user.full_name or user.email,
-            'email': user.email,
-            'role': user.role,
-            'unread': unread
+            'id': user['id'],
+            'name': user['full_name'] or user['email'],
+            'email': user['email'],
+            'role': user['role'],
+            'unread': user['unread'],
+            # 96px for high-density screens; the list shows 48px avatars
+            'avatar_url': storage.blob_storage.url(user['avatar_48']) if user['avatar_48'] else None,
+            'avatar_2x_url': storage.blob_storage.url(user['avatar_96']) if user['avatar_96'] else None,
+            'last_message': (user['last_message'] or user['last_attachment'] or '')[:CHAT_PREVIEW_LENGTH],
+            'last_activity': user['last_activity'].isoformat() if user['last_activity'] else None,
         })
     
     return JsonResponse({'users': user_list})
@@ -370,40 +643,79 @@ def get_chat_users(request):
 @login_required
 def get_messages(request, user_id):
     """
-    CHAT API 2: Load chat history between two users
-    Returns all messages with attachment info (images/PDFs)
+    CHAT API 2: Load chat history between two users, one page at a time
+    Returns the newest `limit` messages older than `before_id` (cursor),
+    oldest first, so opening a chat costs the same for any thread length
     """
     other_user = get_object_or_404(User, id=user_id)
     
-    # Complex query: Get messages where BOTH users are sender OR receiver
-    # This gets the full conversation between two people
-    messages_qs = ChatMessage.objects.filter(
-        sender__in=[request.user, other_user],
-        receiver__in=[request.user, other_user]
-    ).order_by('created_at')
+    try:
+        limit = min(max(int(request.GET.get('limit', CHAT_PAGE_SIZE)), 1), CHAT_MAX_PAGE_SIZE)
+        before_id = int(request.GET.get('before_id', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+    
+    # One indexed lookup of the pair's conversation, then a range scan of chat_conversation_idx
+    conversation = Conversation.objects.for_pair(request.user, other_user).first()
+    if conversation is None:
+        messages_qs = ChatMessage.objects.none()
+    else:
+        messages_qs = ChatMessage.objects.filter(conversation=conversation)
+    if before_id:
+        messages_qs = messages_qs.filter(id__lt=before_id)
+    
+    # Newest first, one extra row tells us whether an older page exists
+    page = list(serializers.message_values(messages_qs.order_by('-id'))[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    
+    if not before_id and page:
+        # Mark all received messages as read (removes unread badge)
+        marked = ChatMessage.objects.filter(sender=other_user, receiver=request.user, is_read=False).update(is_read=True)
+        # Subtract what was marked rather than zeroing: a message sent since the UPDATE stays counted
+        UnreadCounter.objects.decrement(sender=other_user, receiver=request.user, by=marked)
+        Conversation.objects.mark_read(request.user, other_user, page[-1]['id'])
+    
+    return serializers.json_response({
+        'messages': serializers.MessageSerializer(request.user.id).serialize_many(page),
+        'has_more': has_more,
+        'next_before_id': page[0]['id'] if has_more else None,
+        # Read receipt: the newest message the other user has seen
+        'other_read_id': conversation.read_id(other_user) if conversation else 0,
+    })
+
+
+def _create_message(sender, receiver, message_text, attachment=None, attachment_name=''):
+    """
+    Save a message and bump the receiver's unread counter (the conversation's
+    last message and read cursor move in the same transaction, see
+    signals.py); after commit, push it to the receiver's streams and
+    process the attachment.
+    `attachment` is an uploaded file or the storage name of one already
+    in place. Returns the sender's view of the message
+    """
+    with transaction.atomic():
+        msg = ChatMessage.objects.create(
+            sender=sender,
+            receiver=receiver,
+            conversation=Conversation.objects.between(sender, receiver),
+            message=message_text,
+            attachment=attachment,  # FileField handles upload
+            attachment_name=attachment_name
+        )
+        UnreadCounter.objects.increment(sender=sender, receiver=receiver)
+        if attachment:
+            # Sniffing and thumbnails run off the request thread, after commit
+            transaction.on_commit(lambda: attachments.schedule(msg.id))
+    
+    msg_data = serializers.MessageSerializer(sender.id).serialize(serializers.instance_values(msg))
     
-    # Mark all received messages as read (removes unread badge)
-    ChatMessage.objects.filter(sender=other_user, receiver=request.user, is_read=False).update(is_read=True)
-    
-    message_list = []
-    for msg in messages_qs:
-        msg_data = {
-            'id': msg.id,
-            'sender_id': msg.sender.id,
-            'sender_name': msg.sender.full_name or msg.sender.email,
-            'message': msg.message,
-            'is_mine': msg.sender == request.user,
-            'time': msg.created_at.strftime('%I:%M %p'),
-            'date': msg.created_at.strftime('%b %d, %Y'),
-            'has_attachment': bool(msg.attachment),
-            'attachment_url': msg.attachment.url if msg.attachment else None,
-            'attachment_name': msg.attachment_name or '',
-            'is_image': msg.is_image,
-            'is_pdf': msg.is_pdf,
-        }
-        message_list.append(msg_data)
-    
-    return JsonResponse({'messages': message_list})
+    # PUSH DELIVERY: Notify the receiver's open chat streams once the row is committed
+    transaction.on_commit(
+        lambda: realtime.publish_message(receiver.id, {**msg_data, 'is_mine': False})
+    )
+    return msg_data
 
 
 @login_required
@@ -434,44 +746,113 @@ def send_message(request):
         if not message_text and not attachment:
             return JsonResponse({'error': 'Message or attachment required'}, status=400)
         
+        if attachment:
+            # Same size/type limits as chunked uploads, type from the content
+            head = attachment.read(attachments.SNIFF_BYTES)
+            attachment.seek(0)
+            uploads.check_file(attachment.size, attachments.sniff_mime(head))
+        
         receiver = get_object_or_404(User, id=receiver_id)
         
-        # SAVE MESSAGE WITH ATTACHMENT: Pillow handles image processing
-        # Files saved to media/chat_attachments/ folder
-        msg = ChatMessage.objects.create(
-            sender=request.user,
-            receiver=receiver,
-            message=message_text,
-            attachment=attachment,  # FileField handles upload
-            attachment_name=attachment.name if attachment else ''
+        # SAVE MESSAGE WITH ATTACHMENT: Files saved to media/chat_attachments/ folder
+        msg_data = _create_message(
+            request.user, receiver, message_text, attachment, attachment.name if attachment else ''
         )
         
-        return JsonResponse({
-            'success': True,
-            'message': {
-                'id': msg.id,
-                'sender_id': msg.sender.id,
-                'sender_name': msg.sender.full_name or msg.sender.email,
-                'message': msg.message,
-                'is_mine': True,
-                'time': msg.created_at.strftime('%I:%M %p'),
-                'date': msg.created_at.strftime('%b %d, %Y'),
-                'has_attachment': bool(msg.attachment),
-                'attachment_url': msg.attachment.url if msg.attachment else None,
-                'attachment_name': msg.attachment_name or '',
-                'is_image': msg.is_image,
-                'is_pdf': msg.is_pdf,
-            }
-        })
+        return JsonResponse({'success': True, 'message': msg_data})
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _upload_data(upload):
+    return {
+        'id': str(upload.id),
+        'file_name': upload.file_name,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': settings.CHAT_UPLOAD_CHUNK_BYTES,
+        'complete': upload.is_complete,
+    }
+
+
+@login_required
+@require_POST
+def start_chat_upload(request):
+    """
+    CHUNKED UPLOAD 1: Declare an attachment (JSON: file_name, size, content_type)
+    Size and type are checked here, before any file bytes are sent
+    """
+    try:
+        data = json.loads(request.body)
+        size = int(data.get('size') or 0)
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid upload request'}, status=400)
+    try:
+        upload = uploads.start_upload(request.user, data.get('file_name', ''), size, data.get('content_type', ''))
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse(_upload_data(upload), status=201)
+
+
+@login_required
+def chat_upload(request, upload_id):
+    """
+    CHUNKED UPLOAD 2: GET reports how far the upload got, PUT ?offset=N
+    writes the raw request body at that offset (see uploads.py)
+    """
+    upload = get_object_or_404(ChatUpload, pk=upload_id, owner=request.user)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.GET.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'offset must be a number'}, status=400)
+        try:
+            uploads.write_chunk(upload, offset, length, request)
+        except uploads.UploadError as e:
+            return JsonResponse({'error': str(e), 'offset': upload.received}, status=e.status)
+    elif request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    return JsonResponse(_upload_data(upload))
+
+
+@login_required
+@require_POST
+def complete_chat_upload(request, upload_id):
+    """
+    CHUNKED UPLOAD 3: Send the finished upload as a message
+    (JSON: receiver_id, message). The file is linked into blob storage, not copied
+    """
+    upload = get_object_or_404(ChatUpload, pk=upload_id, owner=request.user)
+    try:
+        data = json.loads(request.body)
+        receiver = User.objects.filter(pk=int(data.get('receiver_id'))).first()
+    except (ValueError, TypeError, AttributeError):
+        receiver = None
+    if receiver is None:
+        return JsonResponse({'error': 'Valid receiver ID required'}, status=400)
+    if not upload.is_complete:
+        return JsonResponse({'error': 'Upload is not complete', 'offset': upload.received}, status=409)
+    
+    with transaction.atomic():
+        # Conditional delete: a double-submitted completion sends one message
+        if not ChatUpload.objects.filter(pk=upload.pk).delete()[0]:
+            return JsonResponse({'error': 'Upload was already sent'}, status=409)
+        msg_data = _create_message(
+            request.user, receiver, (data.get('message') or '').strip(), uploads.finish_upload(upload),
+            upload.file_name
+        )
+    return JsonResponse({'success': True, 'message': msg_data})
+
+
 @login_required
 def check_new_messages(request, user_id):
     """
-    CHAT API 4: AJAX POLLING - Check for new messages every 2 seconds
-    This is called repeatedly by JavaScript to get real-time updates
+    CHAT API 4: AJAX POLLING - Fetch messages newer than last_id
+    Called when the push stream announces a new message, and every 2 seconds
+    as a fallback when the stream is unavailable
     """
     last_id = request.GET.get('last_id', 0)  # Track last message ID to avoid duplicates
     other_user = get_object_or_404(User, id=user_id)
@@ -484,27 +865,37 @@ def check_new_messages(request, user_id):
         id__gt=last_id  # Only messages after last_id
     ).order_by('created_at')
     
-    # Mark new messages as read
-    new_messages.update(is_read=True)
-    
-    message_list = []
-    for msg in new_messages:
-        message_list.append({
-            'id': msg.id,
-            'sender_id': msg.sender.id,
-            'sender_name': msg.sender.full_name or msg.sender.email,
-            'message': msg.message,
-            'is_mine': False,
-            'time': msg.created_at.strftime('%I:%M %p'),
-            'date': msg.created_at.strftime('%b %d, %Y'),
-            'has_attachment': bool(msg.attachment),
-            'attachment_url': msg.attachment.url if msg.attachment else None,
-            'attachment_name': msg.attachment_name or '',
-            'is_image': msg.is_image,
-            'is_pdf': msg.is_pdf,
-        })
+    # Mark new messages as read and keep the unread counter in step
+    marked = new_messages.filter(is_read=False).update(is_read=True)
+    UnreadCounter.objects.decrement(sender=other_user, receiver=request.user, by=marked)
     
-    return JsonResponse({'messages': message_list})
+    rows = list(serializers.message_values(new_messages))
+    if rows:
+        Conversation.objects.mark_read(request.user, other_user, rows[-1]['id'])
+    
+    return serializers.json_response({
+        'messages': serializers.MessageSerializer(request.user.id).serialize_many(rows)
+    })
+
+
+async def chat_stream(request):
+    """
+    CHAT API 5: PUSH STREAM - Server-Sent Events for new messages
+    One long-lived connection per chat page instead of polling. Only served
+    under ASGI; WSGI workers answer 204 so the browser falls back to polling.
+    """
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be pinned for the life of the connection
+        return HttpResponse(status=204)
+    
+    response = StreamingHttpResponse(realtime.event_stream(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
 
 
 @login_required
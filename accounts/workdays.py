@@ -0,0 +1,150 @@
+"""
+WORKING-DAY ENGINE - Count leave days net of weekends and holidays
+
+A WorkdayCalendar keeps one prefix-sum table per year:
+
+    table[i] = working days from 1 January up to (not including) day i
+
+so the working days in any range inside a year are table[b] - table[a],
+and a range over several years adds the yearly totals in between. Tables
+are built on first use (366 steps) and reused, so each count after that
+is O(1) per year spanned, with no loop over the days of the range.
+
+Calendars are built from HolidayCalendar rows and memoized per process
+by (id, updated_at); saving a Holiday bumps its calendar's updated_at
+(see signals.py), so stale tables are never used.
+"""
+from array import array
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from . import dashboard_cache
+from .models import HolidayCalendar, LeaveRequest, LeaveRollup
+
+DEFAULT_WEEKEND = frozenset({5, 6})  # Saturday, Sunday
+RECOMPUTE_CHUNK_SIZE = 5000
+
+
+class WorkdayCalendar:
+    def __init__(self, weekend=DEFAULT_WEEKEND, holidays=()):
+        self.weekend = frozenset(weekend)
+        self.holidays = frozenset(holidays)
+        self._tables = {}
+
+    def _table(self, year):
+        table = self._tables.get(year)
+        if table is None:
+            day = date(year, 1, 1)
+            table = array('H', [0])
+            running = 0
+            while day.year == year:
+                if day.weekday() not in self.weekend and day not in self.holidays:
+                    running += 1
+                table.append(running)
+                day += timedelta(days=1)
+            self._tables[year] = table
+        return table
+
+    def is_working_day(self, day):
+        return day.weekday() not in self.weekend and day not in self.holidays
+
+    def count(self, start, end):
+        """Working days from start to end, both inclusive (0 if end < start)"""
+        if end < start:
+            return 0
+        first = self._table(start.year)
+        begin = start.timetuple().tm_yday - 1
+        stop = end.timetuple().tm_yday
+        if start.year == end.year:
+            return first[stop] - first[begin]
+        total = first[-1] - first[begin]
+        for year in range(start.year + 1, end.year):
+            total += self._table(year)[-1]
+        return total + self._table(end.year)[stop]
+
+
+_calendars = {}
+
+
+def _build(calendar):
+    key = (calendar.pk, calendar.updated_at)
+    cached = _calendars.get(calendar.pk)
+    if cached is None or cached[0] != key:
+        holidays = calendar.holidays.values_list('date', flat=True)
+        cached = (key, WorkdayCalendar(calendar.weekend, holidays))
+        _calendars[calendar.pk] = cached
+    return cached[1]
+
+
+def _default_calendar():
+    return HolidayCalendar.objects.filter(is_default=True).order_by('pk').first()
+
+
+def calendar_for(user):
+    """WorkdayCalendar of the user's holiday calendar, or of the default one"""
+    calendar = None
+    if user is not None and user.holiday_calendar_id:
+        calendar = HolidayCalendar.objects.filter(pk=user.holiday_calendar_id).first()
+    calendar = calendar or _default_calendar()
+    return _build(calendar) if calendar else WorkdayCalendar()
+
+
+def count_working_days(user, start, end):
+    return calendar_for(user).count(start, end)
+
+
+def preview_calendar(user):
+    """The user's weekend days (0 = Monday) and ISO holiday dates, for the request form's script"""
+    calendar = calendar_for(user)
+    return {
+        'weekend': sorted(calendar.weekend),
+        'holidays': sorted(day.isoformat() for day in calendar.holidays),
+    }
+
+
+def recompute_total_days(queryset=None, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """
+    Recompute total_days for every request in `queryset` (default: all)
+    from its employee's calendar. Rows are streamed in chunks and only
+    changed ones are written back with bulk_update. Balances of requests
+    that were already approved are not re-charged. Returns (scanned, updated)
+    """
+    queryset = LeaveRequest.objects.all() if queryset is None else queryset
+    calendars = {
+        calendar.pk: _build(calendar) for calendar in HolidayCalendar.objects.all()
+    }
+    default = _default_calendar()
+    fallback = calendars[default.pk] if default else WorkdayCalendar()
+
+    rows = queryset.order_by('pk').values_list(
+        'pk', 'employee_id', 'start_date', 'end_date', 'total_days', 'employee__holiday_calendar',
+        'leave_type_id', 'status', 'employee__department', 'employee__manager'
+    ).iterator(chunk_size=chunk_size)
+    scanned = updated = 0
+    changed = []
+    rollup_changes = []
+    dashboards = set()
+    for pk, employee_id, start, end, total_days, calendar_id, leave_type_id, status, department, manager_id in rows:
+        scanned += 1
+        days = calendars.get(calendar_id, fallback).count(start, end)
+        if days != total_days:
+            changed.append(LeaveRequest(pk=pk, employee_id=employee_id, total_days=days))
+            rollup_changes.append((department, leave_type_id, start, status, 0, days - total_days))
+            # The employee's dashboard and their manager's team lists both show the days
+            dashboards.update(uid for uid in (employee_id, manager_id) if uid)
+        if len(changed) >= chunk_size:
+            updated += _write_total_days(changed, rollup_changes, dashboards)
+            changed, rollup_changes, dashboards = [], [], set()
+    if changed:
+        updated += _write_total_days(changed, rollup_changes, dashboards)
+    return scanned, updated
+
+
+def _write_total_days(leaves, rollup_changes, dashboards):
+    with transaction.atomic():
+        updated = LeaveRequest.objects.bulk_update(leaves, ['total_days'])
+        # bulk_update skips the signals that keep rollups and cached dashboards current
+        LeaveRollup.objects.apply(rollup_changes)
+    dashboard_cache.invalidate_many(dashboards)
+    return updated
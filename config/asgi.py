@@ -1,3 +1,9 @@
+"""
+ASGI entry point. Serve with an ASGI server so the chat push stream
+(/chat/stream/) holds an idle coroutine instead of a worker thread, e.g.
+
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+"""
 import os
 from django.core.asgi import get_asgi_application
 
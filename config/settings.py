@@ -24,6 +24,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -39,7 +40,9 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to QueryInstrumentationMiddleware
+        'BACKEND': 'accounts.middleware.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -121,3 +124,67 @@ CSRF_TRUSTED_ORIGINS = ['http://127.0.0.1:8000', 'http://localhost:8000', 'https
 # Session settings for "Remember me"
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 30  # 30 days when "Remember me" is checked
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Don't expire on browser close
+
+# Chat push stream: seconds between SSE keep-alive comments
+CHAT_STREAM_HEARTBEAT = 15
+
+# Chat attachment sniffing and thumbnails (accounts/attachments.py): 'thread' runs them
+# on a pool of CHAT_ATTACHMENT_WORKERS threads after the upload commits, 'sync' inline
+CHAT_ATTACHMENT_PROCESSING = config('CHAT_ATTACHMENT_PROCESSING', default='thread')
+CHAT_ATTACHMENT_WORKERS = config('CHAT_ATTACHMENT_WORKERS', default=2, cast=int)
+
+# Chat attachment limits, for both send_message and the chunked upload API (accounts/uploads.py)
+CHAT_UPLOAD_MAX_BYTES = config('CHAT_UPLOAD_MAX_BYTES', default=25 * 1024 * 1024, cast=int)
+CHAT_UPLOAD_CHUNK_BYTES = config('CHAT_UPLOAD_CHUNK_BYTES', default=1024 * 1024, cast=int)
+CHAT_UPLOAD_ALLOWED_TYPES = ['image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf']
+CHAT_UPLOAD_EXPIRY = 24 * 60 * 60  # Seconds before an unfinished upload is discarded
+
+# Seconds a just-stored blob outlives its last reference: the save reusing it may not have committed yet
+# (accounts/storage.py); keep below collect_blobs --min-age
+BLOB_COLLECT_GRACE = 60
+
+# Attachment downloads (accounts/media.py): '' streams from Python, 'x-accel-redirect' hands the
+# file to nginx (an internal location at MEDIA_SENDFILE_URL aliased to MEDIA_ROOT), 'x-sendfile' to Apache
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_SENDFILE_URL = config('MEDIA_SENDFILE_URL', default='/protected-media/')
+
+# Chat fan-out bus (accounts/pubsub.py). InProcessBackend only reaches one worker;
+# use SQLiteBackend for several workers on one machine, PostgresBackend across nodes
+CHAT_BUS = {
+    'BACKEND': config(
+        'CHAT_BUS_BACKEND',
+        default='accounts.pubsub.PostgresBackend' if DATABASE_URL else 'accounts.pubsub.InProcessBackend'
+    ),
+    'OPTIONS': {},
+}
+
+# Per-view SQL count / DB time / template time headers and log lines (accounts/middleware.py)
+QUERY_INSTRUMENTATION = config('QUERY_INSTRUMENTATION', default=DEBUG, cast=bool)
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+
+# Maximum SQL queries per view, session and auth lookups included
+QUERY_BUDGETS = {
+    'admin_dashboard': 5,
+    'manager_dashboard': 6,  # + one query for pending-queue conflicts
+    'employee_dashboard': 5,
+    'all_leaves': 3,
+    'my_leaves': 3,
+    'team_history': 3,
+    'all_users': 3,
+    'bulk_decide_leaves': 11,  # + one rollup upsert
+    'team_calendar': 4,
+    'team_absences_api': 3,
+    'leave_report': 4,
+}
+
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='leaveflow'),
+    }
+}
+
+# Seconds a cached manager/employee dashboard lives (accounts/dashboard_cache.py)
+DASHBOARD_CACHE_TIMEOUT = 300